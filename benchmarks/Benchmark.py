@@ -0,0 +1,95 @@
+import contextlib
+import json
+import multiprocessing
+import optparse
+import os
+import resource
+import sys
+import time
+from urllib.request import urlopen
+
+from benchmarks.FakeGitHub import FakeGitHub
+
+BENCHMARKED_MODULES = ('github_prospector.metrics.RepositoriesMetrics', 'github_prospector.metrics.TeamsMetrics')
+
+
+def get_benchmarked_metrics() -> list[str]:
+    from github_prospector.MetricsRegistry import registry
+
+    return [name for name, metric in registry.get_all().items() if metric['module_name'] in BENCHMARKED_MODULES]
+
+
+def _get_counters(api_url: str) -> dict:
+    with urlopen(f'{api_url}/_stats') as response:
+        return json.load(response)
+
+
+def _get_peak_rss() -> int:
+    """Peak resident set size of the process in bytes."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def run_metric(api_url: str, org: str, repos: list[str], teams: list[str], metric_name: str, options: dict) -> dict:
+    """Runs the metric through QueryRunner, stdout of the run is suppressed. Executed in a fresh process,
+    so peak RSS belongs to the metric."""
+    from github_prospector.__main__ import parser
+    from github_prospector.Client import create_github
+    from github_prospector.QueryRunners import QueryRunner
+
+    config = parser.get_default_values()
+    for key, value in dict(options, github_token='benchmark', api_url=api_url, no_cache=True).items():
+        setattr(config, key, value)
+    github = create_github(config)
+    config.repos = [github.get_repo(f'{org}/{name}') for name in repos]
+    organization = github.get_organization(org)
+    config.teams = [organization.get_team_by_slug(slug) for slug in teams]
+    before = _get_counters(api_url)
+    started = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        QueryRunner(metric_name, config).run()
+    wall_time = time.perf_counter() - started
+    after = _get_counters(api_url)
+    return {
+        'metric': metric_name,
+        'wall_time': wall_time,
+        'requests': after['requests'] - before['requests'],
+        'graphql_requests': after['graphql'] - before['graphql'],
+        'peak_rss': _get_peak_rss(),
+    }
+
+
+class Benchmark:
+    """Runs metrics end-to-end against a local fake GitHub, each metric in its own process."""
+
+    def __init__(self, server: FakeGitHub, options: optparse.Values):
+        self.server = server
+        self.options = options
+        self._context = multiprocessing.get_context('spawn')
+
+    def run_one(self, metric_name: str) -> dict:
+        self.server.reset()
+        org = self.server.org
+        args = (self.server.url, org.name, list(org.repos), list(org.teams), metric_name, {
+            'workers': self.options.workers, 'engine': self.options.engine, 'graphql': self.options.graphql,
+            'search': self.options.search, 'contributor_stats': self.options.contributor_stats,
+            'start_date': self.options.start_date,
+        })
+        with self._context.Pool(1) as pool:
+            return pool.apply(run_metric, args)
+
+    def run(self, metric_names: list[str]) -> list[dict]:
+        results = []
+        for metric_name in metric_names:
+            results.append(self.run_one(metric_name))
+            self.print_result(results[-1])
+        return results
+
+    @staticmethod
+    def print_header():
+        print(f'{"metric":<60} {"wall, s":>9} {"requests":>9} {"graphql":>8} {"peak RSS, MB":>13}')
+
+    @staticmethod
+    def print_result(result: dict):
+        print(f'{result["metric"]:<60} {result["wall_time"]:>9.2f} {result["requests"]:>9} '
+              f'{result["graphql_requests"]:>8} {result["peak_rss"] / 2 ** 20:>13.1f}')
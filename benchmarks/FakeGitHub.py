@@ -0,0 +1,458 @@
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+DATE_PATTERN = '%Y-%m-%dT%H:%M:%SZ'
+START_DATE = datetime(2022, 1, 1)
+
+
+def _date(dt: datetime) -> str:
+    return dt.strftime(DATE_PATTERN)
+
+
+class SyntheticOrg:
+    """Organization with generated repositories, teams, pull requests, reviews, issues, commits, branches
+    and branch protection rules. The same seed generates the same organization."""
+
+    def __init__(self, name: str = 'acme', repos: int = 10, teams: int = 2, users: int = 20, prs: int = 200,
+                 issues: int = 100, commits: int = 300, branches: int = 10, seed: int = 1):
+        rnd = random.Random(seed)
+        self.name = name
+        self.users = [f'user{i}' for i in range(users)]
+        self.repos = {}
+        for r in range(repos):
+            repo_name = f'repo{r}'
+            pulls = []
+            for n in range(1, prs + 1):
+                created = START_DATE + timedelta(hours=n * 7)
+                state = rnd.choice(['open', 'closed', 'closed'])
+                merged = state == 'closed' and rnd.random() < 0.6
+                pulls.append({
+                    'id': r * 1000000 + n, 'number': n, 'state': state, 'title': f'PR {n}',
+                    'created_at': _date(created), 'updated_at': _date(created + timedelta(hours=n % 50)),
+                    'merged_at': _date(created + timedelta(hours=3)) if merged else None,
+                    'user': {'login': rnd.choice(self.users)},
+                    'reviews': [{'id': r * 10000000 + n * 10 + k, 'user': {'login': rnd.choice(self.users)},
+                                 'state': rnd.choice(['APPROVED', 'COMMENTED', 'CHANGES_REQUESTED']),
+                                 'submitted_at': _date(created + timedelta(hours=k + 1))} for k in range(n % 4)],
+                })
+            repo_issues = []
+            for n in range(1, issues + 1):
+                created = START_DATE + timedelta(hours=n * 11)
+                repo_issues.append({
+                    'id': r * 1000000 + 500000 + n, 'number': prs + n, 'state': rnd.choice(['open', 'closed']),
+                    'title': f'Issue {n}', 'created_at': _date(created),
+                    'updated_at': _date(created + timedelta(hours=n % 30)), 'user': {'login': rnd.choice(self.users)},
+                })
+            repo_commits = []
+            for n in range(commits):
+                login = rnd.choice(self.users)
+                repo_commits.append({
+                    'sha': f'{r:04d}{n:036d}', 'author': {'login': login},
+                    'commit': {'author': {'name': login, 'date': _date(START_DATE + timedelta(hours=n * 5))},
+                               'message': f'Commit {n}'},
+                })
+            repo_commits.reverse()  # newest first
+            rules = [
+                {'pattern': 'main', 'requiresApprovingReviews': True, 'requiredApprovingReviewCount': 2,
+                 'dismissesStaleReviews': True, 'requiresCodeOwnerReviews': False, 'isAdminEnforced': True,
+                 'requiresLinearHistory': False, 'allowsForcePushes': False, 'allowsDeletions': False,
+                 'restrictsPushes': True, 'push': [('User', self.users[0]), ('Team', 'team0')]},
+                {'pattern': 'release/*[02468]', 'requiresApprovingReviews': False,
+                 'requiredApprovingReviewCount': None, 'dismissesStaleReviews': False,
+                 'requiresCodeOwnerReviews': False, 'isAdminEnforced': False, 'requiresLinearHistory': True,
+                 'allowsForcePushes': False, 'allowsDeletions': True, 'restrictsPushes': False, 'push': []},
+            ]
+            repo_branches = [{'name': 'main', 'protected': True}] + [
+                {'name': f'release/{b}', 'protected': b % 2 == 0} for b in range(1, branches)]
+            self.repos[repo_name] = {'pulls': pulls, 'issues': repo_issues, 'commits': repo_commits,
+                                     'branches': repo_branches, 'rules': rules}
+        self.teams = {}
+        names = list(self.repos)
+        for t in range(teams):
+            self.teams[f'team{t}'] = {'id': 1000 + t, 'members': self.users[t::teams] or self.users,
+                                      'repos': names[t::teams] or names}
+
+
+class FakeGitHubHandler(BaseHTTPRequestHandler):
+    """GitHub's REST and GraphQL api over a synthetic organization: pagination with Link headers, ETags with
+    conditional requests, rate limits per token. Served endpoints are the ones github_prospector uses."""
+
+    server: 'FakeGitHub'
+    per_page_default = 30
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def base(self) -> str:
+        return f'http://{self.headers["Host"]}'
+
+    @property
+    def org(self) -> SyntheticOrg:
+        return self.server.org
+
+    @property
+    def token(self) -> str:
+        return self.headers.get('Authorization', '').rpartition(' ')[2]
+
+    def send_json(self, data, status: int = 200, link: str = None, spend: bool = True):
+        body = json.dumps(data).encode()
+        etag = '"%x"' % zlib.crc32(body)
+        if status == 200 and self.headers.get('If-None-Match') == etag:
+            # conditional requests answered with 304 don't count against rate limit
+            self.server.count('not_modified')
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_rate_limit_headers(spend=False)
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', 'Sat, 01 Jan 2022 00:00:00 GMT')
+        self.send_rate_limit_headers(spend)
+        if link:
+            self.send_header('Link', link)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_rate_limit_headers(self, spend: bool):
+        remaining = self.server.spend(self.token) if spend else self.server.get_remaining(self.token)
+        self.send_header('X-RateLimit-Limit', str(self.server.rate_limit))
+        self.send_header('X-RateLimit-Remaining', str(remaining))
+        self.send_header('X-RateLimit-Reset', str(int(self.server.rate_limit_reset)))
+
+    def paginate(self, items: list, query: dict, path: str):
+        per_page = int(query.get('per_page', [self.per_page_default])[0])
+        page = int(query.get('page', ['1'])[0])
+        last = max(1, (len(items) + per_page - 1) // per_page)
+        params = {k: v[0] for k, v in query.items()}
+        links = []
+        if page < last:
+            links.append(f'<{self.base}{path}?{urlencode(dict(params, page=page + 1))}>; rel="next"')
+            links.append(f'<{self.base}{path}?{urlencode(dict(params, page=last))}>; rel="last"')
+        self.send_json(items[(page - 1) * per_page:page * per_page], link=', '.join(links) or None)
+
+    def user_json(self, login: str) -> dict:
+        return {'login': login, 'url': f'{self.base}/users/{login}'}
+
+    def repo_json(self, name: str) -> dict:
+        return {'id': zlib.crc32(name.encode()), 'name': name, 'full_name': f'{self.org.name}/{name}',
+                'url': f'{self.base}/repos/{self.org.name}/{name}', 'default_branch': 'main',
+                'owner': {'login': self.org.name}}
+
+    def team_json(self, slug: str) -> dict:
+        team = self.org.teams[slug]
+        return {'id': team['id'], 'name': slug, 'slug': slug, 'url': f'{self.base}/teams/{team["id"]}'}
+
+    def pull_json(self, repo: str, pr: dict) -> dict:
+        data = {k: v for k, v in pr.items() if k != 'reviews'}
+        data['html_url'] = f'https://github.com/{self.org.name}/{repo}/pull/{pr["number"]}'
+        data['url'] = f'{self.base}/repos/{self.org.name}/{repo}/pulls/{pr["number"]}'
+        data['user'] = self.user_json(pr['user']['login'])
+        return data
+
+    def issue_json(self, repo: str, issue: dict) -> dict:
+        return dict(issue, html_url=f'https://github.com/{self.org.name}/{repo}/issues/{issue["number"]}',
+                    url=f'{self.base}/repos/{self.org.name}/{repo}/issues/{issue["number"]}',
+                    user=self.user_json(issue['user']['login']))
+
+    @staticmethod
+    def order(items: list, query: dict) -> list:
+        key = 'updated_at' if query.get('sort', ['created'])[0] == 'updated' else 'created_at'
+        return sorted(items, key=lambda i: i[key], reverse=query.get('direction', ['desc'])[0] == 'desc')
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = [i for i in url.path.split('/') if i]
+        if parts == ['_stats']:  # counters for benchmarks, not a GitHub endpoint
+            return self.send_json(self.server.get_counters(), spend=False)
+        time.sleep(self.server.latency)
+        self.server.count('requests')
+        if self.server.get_remaining(self.token) <= 0 and parts != ['rate_limit']:
+            return self.send_json({'message': 'API rate limit exceeded'}, status=403, spend=False)
+        if parts == ['rate_limit']:
+            core = {'limit': self.server.rate_limit, 'remaining': self.server.get_remaining(self.token),
+                    'reset': int(self.server.rate_limit_reset)}
+            return self.send_json({'resources': {'core': core, 'search': core, 'graphql': core}, 'rate': core},
+                                  spend=False)
+        if parts[:1] == ['users'] and len(parts) == 2:
+            return self.send_json(dict(self.user_json(parts[1]), name=parts[1].upper()))
+        if parts == ['search', 'issues']:
+            return self.search(query, url.path)
+        if parts[:1] == ['orgs'] and len(parts) >= 2 and parts[1] == self.org.name:
+            return self.get_org(parts[2:], query, url.path)
+        if parts[:1] == ['teams'] and len(parts) == 3:
+            return self.get_team(parts[1], parts[2], query, url.path)
+        if parts[:1] == ['repos'] and len(parts) >= 3 and parts[1] == self.org.name and parts[2] in self.org.repos:
+            return self.get_repo(parts[2], parts[3:], query, url.path)
+        self.send_json({'message': 'Not Found'}, status=404)
+
+    def get_org(self, rest: list, query: dict, path: str):
+        if not rest:
+            return self.send_json({'login': self.org.name, 'url': f'{self.base}/orgs/{self.org.name}'})
+        if rest == ['repos']:
+            return self.paginate([self.repo_json(name) for name in self.org.repos], query, path)
+        if rest == ['teams']:
+            return self.paginate([self.team_json(slug) for slug in self.org.teams], query, path)
+        if len(rest) == 2 and rest[0] == 'teams' and rest[1] in self.org.teams:
+            return self.send_json(self.team_json(rest[1]))
+        self.send_json({'message': 'Not Found'}, status=404)
+
+    def get_team(self, team_id: str, resource: str, query: dict, path: str):
+        team = next((t for t in self.org.teams.values() if str(t['id']) == team_id), None)
+        if team and resource == 'members':
+            return self.paginate([self.user_json(login) for login in team['members']], query, path)
+        if team and resource == 'repos':
+            return self.paginate([self.repo_json(name) for name in team['repos']], query, path)
+        self.send_json({'message': 'Not Found'}, status=404)
+
+    def get_repo(self, name: str, rest: list, query: dict, path: str):
+        repo = self.org.repos[name]
+        if not rest:
+            return self.send_json(self.repo_json(name))
+        if rest == ['pulls']:
+            state = query.get('state', ['open'])[0]
+            items = self.order([pr for pr in repo['pulls'] if state in ('all', pr['state'])], query)
+            return self.paginate([self.pull_json(name, pr) for pr in items], query, path)
+        if len(rest) == 3 and rest[0] == 'pulls' and rest[2] == 'reviews':
+            pr = repo['pulls'][int(rest[1]) - 1]
+            return self.paginate([dict(review, user=self.user_json(review['user']['login']))
+                                  for review in pr['reviews']], query, path)
+        if rest == ['issues']:
+            state = query.get('state', ['open'])[0]
+            items = [i for i in repo['issues'] if state in ('all', i['state'])]
+            if 'since' in query:
+                items = [i for i in items if i['updated_at'] >= query['since'][0]]
+            return self.paginate([self.issue_json(name, i) for i in self.order(items, query)], query, path)
+        if rest == ['commits']:
+            items = repo['commits']
+            if 'since' in query:
+                items = [c for c in items if c['commit']['author']['date'] >= query['since'][0]]
+            return self.paginate([dict(c, author=self.user_json(c['author']['login'])) for c in items], query, path)
+        if rest == ['stats', 'contributors']:
+            return self.get_contributor_stats(name, repo)
+        if rest == ['branches']:
+            return self.paginate([
+                dict(branch, protection_url=f'{self.base}/repos/{self.org.name}/{name}/branches/{branch["name"]}'
+                                            f'/protection')
+                for branch in repo['branches']], query, path)
+        if len(rest) >= 3 and rest[0] == 'branches' and rest[-1] == 'protection':
+            return self.get_branch_protection(repo, '/'.join(rest[1:-1]))
+        self.send_json({'message': 'Not Found'}, status=404)
+
+    def get_contributor_stats(self, name: str, repo: dict):
+        if not self.server.mark_stats_computed(name):
+            return self.send_json({}, status=202)  # statistics are computed on the first request
+        weeks = {}
+        for commit in repo['commits']:
+            date = datetime.strptime(commit['commit']['author']['date'], DATE_PATTERN).replace(tzinfo=timezone.utc)
+            week = int((date - timedelta(days=date.weekday())).replace(hour=0, minute=0, second=0).timestamp())
+            author_weeks = weeks.setdefault(commit['author']['login'], {})
+            author_weeks[week] = author_weeks.get(week, 0) + 1
+        return self.send_json([
+            {'author': self.user_json(login), 'total': sum(counts.values()),
+             'weeks': [{'w': week, 'a': 0, 'd': 0, 'c': count} for week, count in sorted(counts.items())]}
+            for login, counts in weeks.items()])
+
+    def get_branch_protection(self, repo: dict, branch: str):
+        rule = repo['rules'][0] if branch == 'main' else repo['rules'][1]
+        data = {'url': self.path, 'enforce_admins': {'enabled': rule['isAdminEnforced']},
+                'required_linear_history': {'enabled': rule['requiresLinearHistory']},
+                'allow_force_pushes': {'enabled': rule['allowsForcePushes']},
+                'allow_deletions': {'enabled': rule['allowsDeletions']}}
+        if rule['requiresApprovingReviews']:
+            data['required_pull_request_reviews'] = {
+                'dismiss_stale_reviews': rule['dismissesStaleReviews'],
+                'require_code_owner_reviews': rule['requiresCodeOwnerReviews'],
+                'required_approving_review_count': rule['requiredApprovingReviewCount']}
+        if rule['restrictsPushes']:
+            data['restrictions'] = {
+                'users': [{'login': n} for kind, n in rule['push'] if kind == 'User'],
+                'teams': [{'name': n} for kind, n in rule['push'] if kind == 'Team'],
+                'apps': [], 'users_url': self.path, 'teams_url': self.path}
+        self.send_json(data)
+
+    def search_items(self, terms: list[str]) -> list[dict]:
+        items = []
+        for term in terms:
+            if term.startswith('repo:'):
+                name = term.split('/')[1]
+                repo = self.org.repos[name]
+                prs = [dict(self.pull_json(name, pr), pull_request={'url': self.pull_json(name, pr)['url'],
+                                                                    'merged_at': pr['merged_at']})
+                       for pr in repo['pulls']]
+                repo_issues = [self.issue_json(name, i) for i in repo['issues']]
+                items = prs if 'is:pr' in terms else repo_issues if 'is:issue' in terms else prs + repo_issues
+        for state in ('open', 'closed'):
+            if f'is:{state}' in terms:
+                items = [i for i in items if i['state'] == state]
+        if 'is:merged' in terms:
+            items = [i for i in items if i.get('merged_at')]
+        for term in terms:
+            if term.startswith('created:'):
+                value = term[len('created:'):]
+                if '..' in value:
+                    start, end = value.split('..')
+                    items = [i for i in items if start <= i['created_at'][:19] <= end]
+                elif value.startswith('>='):
+                    items = [i for i in items if i['created_at'][:19] >= value[2:]]
+                elif value.startswith('<='):
+                    items = [i for i in items if i['created_at'][:19] <= value[2:]]
+        return items
+
+    def search(self, query: dict, path: str):
+        items = sorted(self.search_items(query['q'][0].split()), key=lambda i: i['created_at'], reverse=True)
+        per_page = int(query.get('per_page', [self.per_page_default])[0])
+        page = int(query.get('page', ['1'])[0])
+        link = None
+        if page * per_page < len(items):
+            params = {k: v[0] for k, v in query.items()}
+            link = f'<{self.base}{path}?{urlencode(dict(params, page=page + 1))}>; rel="next"'
+        self.send_json({'total_count': len(items), 'incomplete_results': False,
+                        'items': items[(page - 1) * per_page:page * per_page]}, link=link)
+
+    def do_POST(self):
+        time.sleep(self.server.latency)
+        self.server.count('requests')
+        self.server.count('graphql')
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        query, variables = body['query'], body.get('variables') or {}
+        data = {}
+        # aliased repositories of batched queries
+        for block in re.split(r'(?=\b\w+: repository\()', query)[1:]:
+            alias, _, name = re.match(r'(\w+): repository\(owner: "([^"]+)", name: "([^"]+)"\)', block).groups()
+            repo = self.org.repos.get(name)
+            data[alias] = self.graphql_repository(repo, block) if repo else None
+        if query.startswith('query ($owner') and 'refs(' in query:
+            data['repository'] = {'refs': self.graphql_refs(self.org.repos[variables['name']], variables.get('after'))}
+        if query.startswith('query ($owner') and 'pullRequests(states: OPEN' in query:
+            data['repository'] = {'pullRequests': self.graphql_open_prs(self.org.repos[variables['name']],
+                                                                        variables.get('after'))}
+        for alias, search_query in re.findall(
+                r'(\w+): search\(type: ISSUE, query: "((?:[^"\\]|\\.)*)"\) \{ issueCount \}', query):
+            data[alias] = {'issueCount': len(self.search_items(search_query.split()))}
+        self.send_json({'data': data})
+
+    def graphql_repository(self, repo: dict, block: str) -> dict:
+        result = {}
+        for field, kind, states in re.findall(
+                r'(\w+): (pullRequests|issues)\(states: (\[[A-Z, ]+\]|[A-Z]+)\) \{ totalCount \}', block):
+            states = [i.strip() for i in states.strip('[]').split(',')]
+            items = repo['pulls'] if kind == 'pullRequests' else repo['issues']
+            result[field] = {'totalCount': sum(
+                1 for i in items if ('MERGED' if i.get('merged_at') else i['state'].upper()) in states)}
+        if 'refs(refPrefix' in block:
+            result['refs'] = self.graphql_refs(repo, None)
+        if 'branchProtectionRules' in block:
+            result['branchProtectionRules'] = {'nodes': [
+                dict({k: v for k, v in rule.items() if k != 'push'}, pushAllowances={'nodes': [
+                    {'actor': {'__typename': kind, 'login' if kind == 'User' else 'name': name}}
+                    for kind, name in rule['push']]})
+                for rule in repo['rules']]}
+        return result
+
+    @staticmethod
+    def graphql_refs(repo: dict, after: str = None) -> dict:
+        start = int(after or 0)
+        names = [branch['name'] for branch in repo['branches']]
+        return {'nodes': [{'name': name} for name in names[start:start + 100]],
+                'pageInfo': {'hasNextPage': start + 100 < len(names), 'endCursor': str(start + 100)}}
+
+    @staticmethod
+    def graphql_open_prs(repo: dict, after: str = None, page_size: int = 50) -> dict:
+        prs = [pr for pr in repo['pulls'] if pr['state'] == 'open']
+        start = int(after or 0)
+
+        def user(login):
+            return {'login': login, 'name': login.upper()}
+
+        nodes = [{'number': pr['number'], 'author': user(pr['user']['login']), 'reviews': {'nodes': [
+            {'author': user(r['user']['login']), 'submittedAt': r['submitted_at'], 'state': r['state']}
+            for r in pr['reviews']]}} for pr in prs[start:start + page_size]]
+        return {'nodes': nodes, 'pageInfo': {'hasNextPage': start + page_size < len(prs),
+                                             'endCursor': str(start + page_size)}}
+
+
+class FakeGitHub(ThreadingHTTPServer):
+    """Local GitHub api server over a synthetic organization, serving in a background thread."""
+
+    daemon_threads = True
+
+    def __init__(self, org: SyntheticOrg = None, port: int = 0, latency: float = 0, rate_limit: int = 5000,
+                 rate_limit_window: int = 3600):
+        super().__init__(('127.0.0.1', port), FakeGitHubHandler)
+        self.org = org or SyntheticOrg()
+        self.latency = latency  # seconds per request
+        self.rate_limit = rate_limit
+        self.rate_limit_window = rate_limit_window
+        self.rate_limit_reset = time.time() + rate_limit_window
+        self._lock = threading.Lock()
+        self._remaining: dict[str, int] = {}
+        self._counters = {'requests': 0, 'graphql': 0, 'not_modified': 0}
+        self._stats_computed = set()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def start(self) -> 'FakeGitHub':
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request, client_address):
+        pass  # clients going away in the middle of response, e.g. killed runs
+
+    def count(self, counter: str):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def get_counters(self) -> dict:
+        with self._lock:
+            return dict(self._counters)
+
+    def reset(self):
+        """Reset counters, rate limits and computed statistics."""
+        with self._lock:
+            self._counters = dict.fromkeys(self._counters, 0)
+            self._remaining.clear()
+            self._stats_computed.clear()
+            self.rate_limit_reset = time.time() + self.rate_limit_window
+
+    def _renew_rate_limit(self):
+        if time.time() >= self.rate_limit_reset:
+            self._remaining.clear()
+            self.rate_limit_reset = time.time() + self.rate_limit_window
+
+    def get_remaining(self, token: str) -> int:
+        with self._lock:
+            self._renew_rate_limit()
+            return self._remaining.get(token, self.rate_limit)
+
+    def spend(self, token: str) -> int:
+        with self._lock:
+            self._renew_rate_limit()
+            self._remaining[token] = max(self._remaining.get(token, self.rate_limit) - 1, 0)
+            return self._remaining[token]
+
+    def mark_stats_computed(self, repo: str) -> bool:
+        """Returns True if statistics of repo were already requested."""
+        with self._lock:
+            computed = repo in self._stats_computed
+            self._stats_computed.add(repo)
+            return computed
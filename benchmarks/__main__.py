@@ -0,0 +1,55 @@
+import json
+from optparse import OptionParser
+
+from benchmarks.Benchmark import Benchmark, get_benchmarked_metrics
+from benchmarks.FakeGitHub import FakeGitHub, SyntheticOrg
+
+parser = OptionParser(usage='python -m benchmarks [options]')
+parser.add_option('--repos', dest='repos', type='int', default=10, help='count of repositories. DEFAULT: 10')
+parser.add_option('--teams', dest='teams', type='int', default=2, help='count of teams. DEFAULT: 2')
+parser.add_option('--users', dest='users', type='int', default=20, help='count of users. DEFAULT: 20')
+parser.add_option('--prs', dest='prs', type='int', default=200, help='pull requests per repository. DEFAULT: 200')
+parser.add_option('--issues', dest='issues', type='int', default=100, help='issues per repository. DEFAULT: 100')
+parser.add_option('--commits', dest='commits', type='int', default=300, help='commits per repository. DEFAULT: 300')
+parser.add_option('--branches', dest='branches', type='int', default=10,
+                  help='branches per repository. DEFAULT: 10')
+parser.add_option('--seed', dest='seed', type='int', default=1, help='seed of generated organization. DEFAULT: 1')
+parser.add_option('--latency', dest='latency', type='float', default=0,
+                  help='latency of fake api per request in milliseconds. DEFAULT: 0')
+parser.add_option('--rate-limit', dest='rate_limit', type='int', default=5000,
+                  help='rate limit per token of fake api, renewed for every metric. DEFAULT: 5000')
+parser.add_option('-q', '--query', dest='query', default=None,
+                  help='metric names split by comma. DEFAULT: all metrics of RepositoriesMetrics and TeamsMetrics')
+parser.add_option('-s', '--start_date', dest='start_date', default=None, help='filter metrics by start date')
+parser.add_option('--workers', dest='workers', type='int', default=1, help='workers of runs. DEFAULT: 1')
+parser.add_option('--engine', choices=['sync', 'async'], dest='engine', default='sync', help='fetch engine of runs')
+parser.add_option('--graphql', dest='graphql', action='store_true', default=False, help='runs with --graphql')
+parser.add_option('--search', dest='search', action='store_true', default=False, help='runs with --search')
+parser.add_option('--contributor-stats', dest='contributor_stats', action='store_true', default=False,
+                  help='runs with --contributor-stats')
+parser.add_option('--output', dest='output', default=None, help='json file for storing results')
+
+
+def main(options):
+    if options.start_date:
+        from github_prospector.utils import parse_date
+
+        options.start_date = parse_date(options.start_date)
+    metric_names = [i.strip() for i in options.query.split(',')] if options.query else get_benchmarked_metrics()
+    org = SyntheticOrg(repos=options.repos, teams=options.teams, users=options.users, prs=options.prs,
+                       issues=options.issues, commits=options.commits, branches=options.branches, seed=options.seed)
+    server = FakeGitHub(org, latency=options.latency / 1000, rate_limit=options.rate_limit).start()
+    try:
+        Benchmark.print_header()
+        results = Benchmark(server, options).run(metric_names)
+    finally:
+        server.stop()
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump({'options': {k: str(v) for k, v in vars(options).items()}, 'results': results}, f, indent=2)
+        print(f'Results: {options.output}')
+
+
+if __name__ == '__main__':
+    (options, args) = parser.parse_args()
+    main(options)
@@ -0,0 +1,247 @@
+import asyncio
+import json
+import optparse
+import time
+from typing import Callable, Optional
+
+from github.Branch import Branch
+from github.GithubException import GithubException
+from github.Repository import Repository
+from github.Team import Team
+
+from github_prospector.Client import PooledConnection, create_github
+from github_prospector.DataCache import DataCache
+from github_prospector.QueryPlanner import QueryPlan
+from github_prospector.RateLimiter import MAX_RETRIES, get_tokens, scheduler
+from github_prospector.Records import CommitRecord, IssueRecord, PullRequestRecord
+from github_prospector.settings import DEFAULT_CONCURRENCY
+from github_prospector.Telemetry import telemetry
+from github_prospector.utils import GITHUB_DATE_PATTERN
+
+try:
+    import aiohttp
+    from yarl import URL
+except ImportError:  # optional dependency: pip install github_prospector[async]
+    aiohttp = None
+
+PER_PAGE = 100
+
+
+class AsyncFetcher:
+    """Fetches GitHub's REST api with many requests in flight through a pooled aiohttp session."""
+
+    def __init__(self, config: optparse.Values, concurrency: int = DEFAULT_CONCURRENCY):
+        self.config = config
+        self.concurrency = concurrency
+        self.http_cache = PooledConnection.http_cache
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._session = None
+        self.requests_count = 0
+
+    async def __aenter__(self):
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+            headers={
+                'Authorization': f"token {','.join(get_tokens(getattr(self.config, 'github_token')))}",
+                'Accept': 'application/vnd.github.v3+json',
+                'User-Agent': 'PyGithub/Python',
+            },
+        )
+        return self
+
+    async def __aexit__(self, *args):
+        await self._session.close()
+
+    async def get(self, url: str, params: dict = None) -> tuple[dict, object, Optional[str]]:
+        """GET json paced by the rate limit scheduler. Returns (headers, data, url of next page)."""
+        for attempt in range(MAX_RETRIES + 1):
+            routed, bucket = scheduler.route(url, dict(self._session.headers))
+            delay = scheduler.reserve(bucket)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            async with self._semaphore:
+                headers = {'Authorization': routed['Authorization']}
+                cached = None
+                key = None
+                if self.http_cache:
+                    request_url = str(URL(url).update_query(params or {}))
+                    key = self.http_cache.make_key(request_url, dict(self._session.headers))
+                    cached = self.http_cache.get(key)
+                    if cached:
+                        headers.update(self.http_cache.conditional_headers(cached))
+                started = time.perf_counter()
+                async with self._session.get(url, params=params, headers=headers) as response:
+                    self.requests_count += 1
+                    size = len(await response.read())
+                    telemetry.record_request(response.status, size, time.perf_counter() - started)
+                    response_headers = {k.lower(): v for k, v in response.headers.items()}
+                    next_url = str(response.links['next']['url']) if 'next' in response.links else None
+                    if response.status == 304 and cached:
+                        scheduler.update(bucket, response.status, response_headers)
+                        # 304 has no links of pages, they are in the stored response, its rate limits are outdated
+                        cached_headers = dict(cached[3], **{k: v for k, v in response_headers.items()
+                                                            if k.startswith('x-ratelimit')})
+                        return cached_headers, self._loads(cached[4]), self._get_link(cached_headers, 'next')
+                    body = await response.text()
+            if scheduler.update(bucket, response.status, response_headers, body) and attempt < MAX_RETRIES:
+                continue
+            if response.status >= 400:
+                raise GithubException(response.status, self._loads(body), response_headers)
+            if self.http_cache and response.status == 200:
+                self.http_cache.set(key, response.status, response_headers, body)
+            return response_headers, self._loads(body), next_url
+
+    @staticmethod
+    def _loads(body: str):
+        return json.loads(body) if body else None
+
+    async def get_all(self, url: str, params: dict = None, stop: Callable[[dict], bool] = None) -> list[tuple]:
+        """All items of paginated list as (item, headers of page).
+        Pages after the first one are fetched concurrently if the last page is known, sequentially
+        when iteration can stop early: on the first item `stop` returns True for."""
+        params = dict(params or {}, per_page=PER_PAGE)
+        headers, data, next_url = await self.get(url, params)
+        items = [(item, headers) for item in data]
+        if stop is not None:
+            for i, (item, _) in enumerate(items):
+                if stop(item):
+                    return items[:i]
+            while next_url:
+                headers, data, next_url = await self.get(next_url)
+                for item in data:
+                    if stop(item):
+                        return items
+                    items.append((item, headers))
+            return items
+        last_page = self._get_last_page(headers)
+        if last_page:
+            pages = await asyncio.gather(*[
+                self.get(url, dict(params, page=page)) for page in range(2, last_page + 1)
+            ])
+            for headers, data, _ in pages:
+                items.extend((item, headers) for item in data)
+        return items
+
+    @staticmethod
+    def _get_link(headers: dict, rel: str) -> Optional[str]:
+        for link in headers.get('link', '').split(','):
+            if f'rel="{rel}"' in link:
+                return link.split(';')[0].strip(' <>')
+        return None
+
+    def _get_last_page(self, headers: dict) -> Optional[int]:
+        url = self._get_link(headers, 'last')
+        return int(URL(url).query.get('page', 1)) if url else None
+
+
+class AsyncEngine:
+    """Prefetches collections of requested metrics for all repos and teams concurrently
+    and puts them into the data cache, metric classes compute from there."""
+
+    def __init__(self, config: optparse.Values, data_cache: DataCache):
+        if aiohttp is None:
+            raise ImportError('async engine requires aiohttp: pip install github_prospector[async]')
+        self.config = config
+        self.data_cache = data_cache
+        self.github = create_github(config)
+        self.period_from = getattr(config, 'start_date', None)
+        self.period_to = getattr(config, 'end_date', None)
+        self.plan: Optional[QueryPlan] = None
+
+    def prefetch(self, plan: QueryPlan, repos: list[Repository], teams: list[Team]) -> int:
+        """Fetch data sources planned for requested metrics. Returns count of sent requests."""
+        repo_resources = dict(plan.get_resources('repo'))
+        team_resources = dict(plan.get_resources('team'))
+        if getattr(self.config, 'events', False):
+            # pull requests, issues, commits and branches are read from the event store by metrics
+            for resources in (repo_resources, team_resources):
+                for resource in ('pulls', 'issues', 'commits', 'branches'):
+                    resources.pop(resource, None)
+        elif getattr(self.config, 'incremental', False) or getattr(self.config, 'search', False):
+            # pull requests and issues are synced with the local store or searched by metrics
+            for resources in (repo_resources, team_resources):
+                resources.pop('pulls', None)
+                resources.pop('issues', None)
+        self.plan = plan
+        return asyncio.run(self._prefetch(repo_resources, team_resources, repos or [], teams or []))
+
+    async def _prefetch(self, repo_resources: dict, team_resources: dict, repos: list[Repository],
+                        teams: list[Team]) -> int:
+        concurrency = getattr(self.config, 'concurrency', None) or DEFAULT_CONCURRENCY
+        async with AsyncFetcher(self.config, concurrency) as fetcher:
+            tasks = []
+            for repo in repos:
+                if 'pulls' in repo_resources:
+                    tasks.append(self._scoped('repo', repo, 'pulls', self._prefetch_pulls(
+                        fetcher, repo, self.plan.get_fetch_state('repo', 'pulls', repo_resources['pulls'], repo))))
+                if 'issues' in repo_resources:
+                    tasks.append(self._scoped('repo', repo, 'issues', self._prefetch_issues(
+                        fetcher, repo, self.plan.get_fetch_state('repo', 'issues', repo_resources['issues'], repo))))
+                if 'commits' in repo_resources:
+                    tasks.append(self._scoped('repo', repo, 'commits', self._prefetch_commits(fetcher, repo)))
+                if 'branches' in repo_resources:
+                    tasks.append(self._scoped('repo', repo, 'branches', self._prefetch_branches(fetcher, repo)))
+            for team in teams:
+                if 'repos' in team_resources:
+                    # pull requests of repos prefetched for repo metrics cover team's ones
+                    skipped = {repo.full_name for repo in repos} if 'pulls' in repo_resources else set()
+                    tasks.append(self._scoped('team', team, 'repos', self._prefetch_team(
+                        fetcher, team, 'pulls' in team_resources, skipped)))
+            for result in await asyncio.gather(*tasks, return_exceptions=True):
+                # prefetching is best-effort, metrics fetch what's missing themselves
+                if isinstance(result, Exception):
+                    print(f'! Prefetch error: {result}')
+            return fetcher.requests_count
+
+    @staticmethod
+    async def _scoped(object_type: str, obj, resource: str, coroutine):
+        """Requests of prefetching are attributed to prefetched resource, metrics read it from the data cache."""
+        with telemetry.scope(object_type, obj.name, f'prefetch:{resource}'):
+            return await coroutine
+
+    def _make(self, klass, items: list[tuple]) -> list:
+        return [self.github.create_from_raw_data(klass, item, headers) for item, headers in items]
+
+    def _created_stop(self) -> Optional[Callable[[dict], bool]]:
+        """Stop of listing sorted by creation date descending on the first item created before period."""
+        if not self.period_from:
+            return None
+        period_from = self.period_from.strftime(GITHUB_DATE_PATTERN)
+        return lambda item: item['created_at'] < period_from
+
+    def _filter_created(self, objects: list) -> list:
+        return [i for i in objects if (not self.period_from or self.period_from <= i.created_at) and
+                (not self.period_to or i.created_at <= self.period_to)]
+
+    async def _prefetch_pulls(self, fetcher: AsyncFetcher, repo: Repository, state: str):
+        items = await fetcher.get_all(
+            f'{repo.url}/pulls', {'state': state, 'sort': 'created', 'direction': 'desc'}, self._created_stop())
+        prs = self._filter_created([PullRequestRecord(item) for item, _ in items])
+        self.data_cache.set(repo, f'pulls:{state}', prs, self.period_from, self.period_to)
+
+    async def _prefetch_issues(self, fetcher: AsyncFetcher, repo: Repository, state: str):
+        items = await fetcher.get_all(
+            f'{repo.url}/issues', {'state': state, 'sort': 'created', 'direction': 'desc'}, self._created_stop())
+        issues = self._filter_created([IssueRecord(item) for item, _ in items])
+        self.data_cache.set(repo, f'issues:{state}', issues, self.period_from, self.period_to)
+
+    async def _prefetch_commits(self, fetcher: AsyncFetcher, repo: Repository):
+        params = {'since': self.period_from.strftime(GITHUB_DATE_PATTERN)} if self.period_from else {}
+        items = await fetcher.get_all(f'{repo.url}/commits', params)
+        self.data_cache.set(repo, 'commits', [CommitRecord(item, headers) for item, headers in items], self.period_from)
+
+    async def _prefetch_branches(self, fetcher: AsyncFetcher, repo: Repository):
+        items = await fetcher.get_all(f'{repo.url}/branches')
+        self.data_cache.set(repo, 'branches', self._make(Branch, items))
+
+    async def _prefetch_team(self, fetcher: AsyncFetcher, team: Team, with_pulls: bool, skipped: set[str]):
+        # repos of teams collected together with repos are listed by the run before prefetching
+        team_repos = self.data_cache.get(team, 'repos')
+        if team_repos is None:
+            team_repos = self._make(Repository, await fetcher.get_all(f'{team.url}/repos'))
+            self.data_cache.set(team, 'repos', team_repos)
+        if with_pulls:
+            await asyncio.gather(*[
+                self._prefetch_pulls(fetcher, repo, self.plan.get_fetch_state('team', 'pulls', 'open', repo))
+                for repo in team_repos if repo.full_name not in skipped])
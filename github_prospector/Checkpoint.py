@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from typing import Iterator, Optional
+from urllib.parse import urlencode
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)',
+    'CREATE TABLE IF NOT EXISTS results (object_type TEXT, name TEXT, metric TEXT, value TEXT, '
+    'PRIMARY KEY (object_type, name, metric))',
+    'CREATE TABLE IF NOT EXISTS pages (listing TEXT, page INTEGER, headers TEXT, data BLOB, next_url TEXT, '
+    'PRIMARY KEY (listing, page))',
+)
+
+
+class CheckpointLocked(Exception):
+    """Checkpoint is used by another run."""
+
+
+class Checkpoint:
+    """Durable progress of a run (SQLite) in the output directory: results of completed (object, metric)
+    and fetched pages of paginated listings with the cursor of the next page.
+
+    Every query, period and objects has its own checkpoint file, locked by the run using it, so runs sharing
+    the output directory don't touch checkpoints of each other. A resumed run of the same query, period and
+    objects skips completed results and continues listings from their cursors. The checkpoint is removed when
+    the run completes."""
+
+    FILE_NAME = 'checkpoint-{}.sqlite'
+
+    active: Optional['Checkpoint'] = None  # checkpoint of the current run, listings read and write pages to it
+
+    def __init__(self, output_dir: str, fingerprint: str, resume: bool = False):
+        """Raises CheckpointLocked if the checkpoint is used by another run of the same query."""
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        self.path = os.path.join(output_dir, self.FILE_NAME.format(
+            hashlib.sha1(fingerprint.encode()).hexdigest()[:16]))
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=0, check_same_thread=False)
+        try:
+            # the lock of the first write is held until the run closes the checkpoint
+            self._db.execute('PRAGMA locking_mode=EXCLUSIVE')
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('BEGIN EXCLUSIVE')
+        except sqlite3.OperationalError as e:
+            self._db.close()
+            raise CheckpointLocked(self.path) from e
+        for statement in SCHEMA:
+            self._db.execute(statement)
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+        self.resumed = bool(resume and row and row[0] == fingerprint)
+        if not self.resumed:
+            self._db.execute('DELETE FROM results')
+            self._db.execute('DELETE FROM pages')
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)", (fingerprint,))
+        self._db.commit()
+        self._results: dict[tuple, object] = {}
+        if self.resumed:
+            for object_type, name, metric, value in self._db.execute('SELECT * FROM results'):
+                self._results[(object_type, name, metric)] = json.loads(value)
+
+    @staticmethod
+    def make_fingerprint(query: str, config) -> str:
+        """Identity of run: what results depend on."""
+        return json.dumps({
+            'query': query,
+            'start_date': str(getattr(config, 'start_date', None)),
+            'end_date': str(getattr(config, 'end_date', None)),
+            'repos': [getattr(i, 'full_name', str(i)) for i in getattr(config, 'repos', None) or []],
+            'teams': [getattr(i, 'slug', str(i)) for i in getattr(config, 'teams', None) or []],
+            'users': [getattr(i, 'login', str(i)) for i in getattr(config, 'users', None) or []],
+        }, sort_keys=True)
+
+    def has_result(self, object_type: str, name: str, metric_name: str) -> bool:
+        return (object_type, name, metric_name) in self._results
+
+    def get_result(self, object_type: str, name: str, metric_name: str):
+        return self._results[(object_type, name, metric_name)]
+
+    def add_result(self, object_type: str, name: str, metric_name: str, result):
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                             (object_type, name, metric_name, json.dumps(result, default=str)))
+
+    @staticmethod
+    def make_listing_key(url: str, params: dict = None) -> str:
+        return f'{url}?{urlencode(sorted((params or {}).items()))}'
+
+    def get_pages(self, listing: str) -> Iterator[tuple[dict, object, Optional[str]]]:
+        """Stored pages of listing in order: (headers, data, url of next page)."""
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT headers, data, next_url FROM pages WHERE listing = ? ORDER BY page', (listing,)).fetchall()
+        for headers, data, next_url in rows:
+            yield json.loads(headers), json.loads(zlib.decompress(data)), next_url
+
+    def add_page(self, listing: str, page: int, headers: dict, data, next_url: Optional[str]):
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)', (
+                listing, page, json.dumps(dict(headers)), zlib.compress(json.dumps(data).encode()), next_url))
+
+    def complete(self):
+        """Run is completed, its checkpoint isn't needed anymore."""
+        self.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
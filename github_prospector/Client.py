@@ -0,0 +1,147 @@
+import contextlib
+import contextvars
+import optparse
+import os
+import threading
+import time
+
+import requests
+from github import Github
+from github.MainClass import DEFAULT_BASE_URL
+from github.Requester import Requester, RequestsResponse
+
+from github_prospector.HttpCache import HttpCache, CachedResponse
+from github_prospector.RateLimiter import MAX_RETRIES, get_tokens, scheduler
+from github_prospector.settings import DEFAULT_CACHE_SIZE
+from github_prospector.Telemetry import telemetry
+
+FETCH_CONCURRENCY = 8  # parallel requests of one object's data, e.g. protection of its branches
+
+_raise_accepted = contextvars.ContextVar('raise_accepted', default=False)
+
+
+class AcceptedException(Exception):
+    """GitHub answered 202: data is computed in background, e.g. statistics of repository."""
+
+
+@contextlib.contextmanager
+def raise_accepted():
+    """202 responses to requests of the block raise AcceptedException, PyGithub would retry them without limit."""
+    token = _raise_accepted.set(True)
+    try:
+        yield
+    finally:
+        _raise_accepted.reset(token)
+
+
+class PooledConnection:
+    """Connection mimicking httplib's one, which sends requests through a session shared by all threads.
+
+    PyGithub keeps one connection object per client and stores request data in it, so the same client
+    can't be used from several threads. Injected connection classes are created per request instead,
+    while sessions (and their connection pools) are kept per host here."""
+
+    protocol = 'https'
+    default_port = 443
+    pool_size = requests.adapters.DEFAULT_POOLSIZE
+    http_cache: HttpCache = None
+
+    _sessions: dict[tuple, requests.Session] = {}
+    _sessions_lock = threading.Lock()
+
+    def __init__(self, host, port=None, strict=False, timeout=None, retry=None, pool_size=None, **kwargs):
+        self.host = host
+        self.port = port if port else self.default_port
+        self.timeout = timeout
+        self.verify = kwargs.get('verify', True)
+        self.retry = retry if retry is not None else requests.adapters.DEFAULT_RETRIES
+        self.session = self.get_session(self.protocol, self.host, self.port, self.retry)
+
+    @classmethod
+    def get_session(cls, protocol: str, host: str, port: int, retry) -> requests.Session:
+        key = (protocol, host, port)
+        with cls._sessions_lock:
+            if key not in cls._sessions:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    max_retries=retry, pool_connections=cls.pool_size, pool_maxsize=cls.pool_size)
+                session.mount(f'{protocol}://', adapter)
+                cls._sessions[key] = session
+            return cls._sessions[key]
+
+    def request(self, verb, url, input, headers):
+        self.verb = verb
+        self.url = url
+        self.input = input
+        self.headers = headers
+
+    def getresponse(self):
+        """Send request paced by the rate limit scheduler, rate limited requests are retried after pause."""
+        url = f'{self.protocol}://{self.host}:{self.port}{self.url}'
+        for attempt in range(MAX_RETRIES + 1):
+            headers, bucket = scheduler.route(url, self.headers)
+            scheduler.wait(bucket)
+            response = self._send(url, headers)
+            if response.status == 202 and _raise_accepted.get():
+                raise AcceptedException(url)
+            if not scheduler.update(bucket, response.status, response.headers, response.text) or attempt == MAX_RETRIES:
+                return response
+
+    def _send(self, url: str, headers: dict):
+        verb = getattr(self.session, self.verb.lower())
+        cache = self.http_cache if self.verb == 'GET' else None
+        cached = None
+        if cache:
+            # responses are cached per pool of tokens, not per token the request was routed to
+            key = cache.make_key(url, self.headers or {})
+            cached = cache.get(key)
+            if cached:
+                headers.update(cache.conditional_headers(cached))
+        started = time.perf_counter()
+        r = verb(url, headers=headers, data=self.input, timeout=self.timeout, verify=self.verify,
+                 allow_redirects=False)
+        telemetry.record_request(r.status_code, len(r.content), time.perf_counter() - started)
+        if cached and r.status_code == 304:
+            status, cached_headers, body = cached[2:]
+            # rate limits of the stored response are outdated
+            cached_headers.update({k.lower(): v for k, v in r.headers.items() if k.lower().startswith('x-ratelimit')})
+            return CachedResponse(status, cached_headers, body)
+        if cache and r.status_code == 200:
+            cache.set(key, r.status_code, {k.lower(): v for k, v in r.headers.items()}, r.text)
+        return RequestsResponse(r)
+
+    def close(self):
+        return
+
+
+class PooledHTTPConnection(PooledConnection):
+    protocol = 'http'
+    default_port = 80
+
+
+class PooledHTTPSConnection(PooledConnection):
+    protocol = 'https'
+    default_port = 443
+
+
+def setup_connections(config: optparse.Values):
+    """Make PyGithub send requests through pooled thread-safe connections."""
+    workers = getattr(config, 'workers', 1) or 1
+    PooledConnection.pool_size = max(requests.adapters.DEFAULT_POOLSIZE, workers * FETCH_CONCURRENCY)
+    cache_dir = getattr(config, 'cache_dir', None)
+    if cache_dir and not getattr(config, 'no_cache', False):
+        if PooledConnection.http_cache is None or PooledConnection.http_cache.path != os.path.join(
+                cache_dir, HttpCache.FILE_NAME):
+            max_size = (getattr(config, 'cache_size', None) or DEFAULT_CACHE_SIZE) * 1024 * 1024
+            PooledConnection.http_cache = HttpCache(cache_dir, max_size)
+    Requester.injectConnectionClasses(PooledHTTPConnection, PooledHTTPSConnection)
+
+
+def get_api_url(config: optparse.Values) -> str:
+    return (getattr(config, 'api_url', None) or DEFAULT_BASE_URL).rstrip('/')
+
+
+def create_github(config: optparse.Values) -> Github:
+    """Create GitHub client by config. Requests of client with a pool of tokens are routed between them."""
+    setup_connections(config)
+    return Github(','.join(get_tokens(getattr(config, 'github_token'))), base_url=get_api_url(config))
@@ -0,0 +1,70 @@
+import threading
+from typing import Callable
+
+from github_prospector.Telemetry import telemetry
+
+
+class DataCache:
+    """Run-scoped storage of collections fetched from GitHub.
+
+    Metrics of the same object (repository, team) read shared data from here,
+    so every collection is fetched only once per run. Safe for use from several workers."""
+
+    def __init__(self):
+        self._data: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        self._key_locks: dict[tuple, threading.Lock] = {}
+
+    @staticmethod
+    def make_key(obj: object, resource: str, period_from=None, period_to=None) -> tuple:
+        """Key of collection: (object, resource, period). Object is GitHub's one or its string key."""
+        if isinstance(obj, str):
+            return obj, resource, period_from, period_to
+        return getattr(obj, 'url', None) or id(obj), resource, period_from, period_to
+
+    def get_or_fetch(self, obj: object, resource: str, fetcher: Callable, period_from=None, period_to=None):
+        """Return cached collection or fetch and store it."""
+        key = self.make_key(obj, resource, period_from, period_to)
+        with self._lock:
+            if key in self._data:
+                telemetry.record_cache_hit()
+                return self._data[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key in self._data:
+                telemetry.record_cache_hit()  # fetched by another worker meanwhile
+            else:
+                self._data[key] = fetcher()
+        return self._data[key]
+
+    def get(self, obj: object, resource: str, period_from=None, period_to=None, default=None):
+        """Return cached collection without fetching it."""
+        key = self.make_key(obj, resource, period_from, period_to)
+        with self._lock:
+            if key in self._data:
+                telemetry.record_cache_hit()
+            return self._data.get(key, default)
+
+    def set(self, obj: object, resource: str, value, period_from=None, period_to=None):
+        """Store collection fetched elsewhere, e.g. prefetched by the async engine."""
+        key = self.make_key(obj, resource, period_from, period_to)
+        with self._lock:
+            self._data[key] = value
+
+    def evict(self, obj: object):
+        """Drop collections of object and of its items, e.g. reviews of repository's pull requests,
+        when all its metrics are collected."""
+        key = self.make_key(obj, '')[0]
+        prefix = f'{key}/' if isinstance(key, str) else None  # urls of items are nested in url of object
+        with self._lock:
+            for i in [i for i in self._data
+                      if i[0] == key or prefix and isinstance(i[0], str) and i[0].startswith(prefix)]:
+                del self._data[i]
+                self._key_locks.pop(i, None)
+
+    def clear(self, keep: str = None):
+        """Drop all collections, except of string keys starting with keep, e.g. names of users."""
+        with self._lock:
+            for key in [i for i in self._data if not (keep and isinstance(i[0], str) and i[0].startswith(keep))]:
+                del self._data[key]
+                self._key_locks.pop(key, None)
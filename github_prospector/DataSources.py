@@ -0,0 +1,155 @@
+import optparse
+from typing import Iterable, Iterator, Optional
+
+from github.Repository import Repository
+
+from github_prospector.DataCache import DataCache
+from github_prospector.EventStore import get_stored_items
+from github_prospector.IncrementalStore import get_synced_items
+from github_prospector.Records import (CommitRecord, IssueRecord, PullRequestRecord, ReviewRecord, iter_raw,
+                                       search_created_between)
+from github_prospector.utils import filter_between, take_created_between, GITHUB_DATE_PATTERN
+
+STATES = ('open', 'closed', 'all')
+
+
+def _filter_state(items: list, state: str) -> list:
+    return items if state == 'all' else [i for i in items if i.state == state]
+
+
+def _fetch(config: optparse.Values, data_cache: DataCache, repository: Repository, resource: str, state: str,
+           period_from, period_to) -> list:
+    """Items of resource ('pulls' or 'issues') in state created in period, fetched by the configured way."""
+    record_class = PullRequestRecord if resource == 'pulls' else IssueRecord
+    if getattr(config, 'events', False):
+        items = _filter_state([record_class(raw) for raw in get_stored_items(
+            config, data_cache, repository, resource, lambda: [raw for raw, _ in iter_raw(
+                repository._requester, f'{repository.url}/{resource}', {'state': 'all'})])], state)
+        # the same order as of listing
+        items.sort(key=lambda i: (i.created_at, i.number), reverse=True)
+        return [i for i in filter_between(items, 'created_at', period_to, period_from)]
+    if getattr(config, 'incremental', False):
+        items = _filter_state(get_synced_items(config, data_cache, repository, resource), state)
+        return [i for i in filter_between(items, 'created_at', period_to, period_from)]
+    if getattr(config, 'search', False) and (period_from or period_to):
+        qualifiers = [f'repo:{repository.full_name}', 'is:pr' if resource == 'pulls' else 'is:issue']
+        if state != 'all':
+            qualifiers.append(f'is:{state}')
+        items = search_created_between(repository._requester, qualifiers, period_from, period_to)
+        if items is not None:
+            return [record_class(raw) for raw in items]
+    return list(_list(repository, resource, state, period_from, period_to))
+
+
+def _list(repository: Repository, resource: str, state: str, period_from, period_to) -> Iterator:
+    """Items of listing created in period, newest first; pages older than the period aren't fetched."""
+    record_class = PullRequestRecord if resource == 'pulls' else IssueRecord
+    params = {'state': state, 'sort': 'created', 'direction': 'desc'}
+    items = (record_class(raw) for raw, _ in iter_raw(repository._requester, f'{repository.url}/{resource}', params))
+    return take_created_between(items, period_from, period_to)
+
+
+def _can_stream(config: optparse.Values, period_from, period_to) -> bool:
+    """Items are listed page by page from the api, other ways read stored or searched collections."""
+    return not (getattr(config, 'events', False) or getattr(config, 'incremental', False) or
+                getattr(config, 'search', False) and (period_from or period_to))
+
+
+def _iter(config: optparse.Values, data_cache: DataCache, repository: Repository, resource: str, state: str,
+          period_from, period_to, fetch_state: Optional[str], shared: bool) -> Iterable:
+    """Items of resource in state created in period. Collection of the only reader isn't kept: its pages are
+    filtered as they arrive, so only the current page is held, unless it's in the data cache already."""
+    fetch_state = fetch_state or state
+    cached = data_cache.get(repository, f'{resource}:{fetch_state}', period_from, period_to)
+    if cached is not None:
+        return _filter_state(cached, state)
+    if shared or not _can_stream(config, period_from, period_to):
+        return (get_pulls if resource == 'pulls' else get_issues)(
+            config, data_cache, repository, state, period_from, period_to, fetch_state)
+    return _list(repository, resource, state, period_from, period_to)
+
+
+def iter_pulls(config: optparse.Values, data_cache: DataCache, repository: Repository, state: str = 'all',
+               period_from=None, period_to=None, fetch_state: Optional[str] = None,
+               shared: bool = True) -> Iterable[PullRequestRecord]:
+    """Pull requests like get_pulls, streamed page by page if they aren't shared with other metrics."""
+    return _iter(config, data_cache, repository, 'pulls', state, period_from, period_to, fetch_state, shared)
+
+
+def iter_issues(config: optparse.Values, data_cache: DataCache, repository: Repository, state: str = 'all',
+                period_from=None, period_to=None, fetch_state: Optional[str] = None,
+                shared: bool = True) -> Iterable[IssueRecord]:
+    """Issues like get_issues, streamed page by page if they aren't shared with other metrics."""
+    return _iter(config, data_cache, repository, 'issues', state, period_from, period_to, fetch_state, shared)
+
+
+def get_pulls(config: optparse.Values, data_cache: DataCache, repository: Repository, state: str = 'all',
+              period_from=None, period_to=None, fetch_state: Optional[str] = None) -> list[PullRequestRecord]:
+    """Pull requests of repository in state created in period, fetched once per run.
+    fetch_state is the state planned to be fetched for all metrics, e.g. 'all' covers open and closed ones."""
+    fetch_state = fetch_state or state
+    prs = data_cache.get_or_fetch(
+        repository, f'pulls:{fetch_state}',
+        lambda: _fetch(config, data_cache, repository, 'pulls', fetch_state, period_from, period_to),
+        period_from, period_to)
+    return _filter_state(prs, state)
+
+
+def get_issues(config: optparse.Values, data_cache: DataCache, repository: Repository, state: str = 'all',
+               period_from=None, period_to=None, fetch_state: Optional[str] = None) -> list[IssueRecord]:
+    """Issues (with pull requests, as GitHub lists them) of repository in state created in period,
+    fetched once per run."""
+    fetch_state = fetch_state or state
+    issues = data_cache.get_or_fetch(
+        repository, f'issues:{fetch_state}',
+        lambda: _fetch(config, data_cache, repository, 'issues', fetch_state, period_from, period_to),
+        period_from, period_to)
+    return _filter_state(issues, state)
+
+
+def get_reviews(config: optparse.Values, data_cache: DataCache, repository: Repository,
+                pr: PullRequestRecord) -> list[ReviewRecord]:
+    """Reviews of pull request in the order of listing, fetched once per run."""
+
+    def fetch():
+        url = f'{pr.url}/reviews'
+        if getattr(config, 'events', False):
+            raw_reviews = get_stored_items(config, data_cache, repository, f'reviews:{pr.number}',
+                                           lambda: [raw for raw, _ in iter_raw(repository._requester, url)])
+            # the same order as of listing
+            raw_reviews = sorted(raw_reviews, key=lambda raw: (raw.get('submitted_at') or '', raw['id']))
+        else:
+            raw_reviews = [raw for raw, _ in iter_raw(repository._requester, url)]
+        return [ReviewRecord(raw) for raw in raw_reviews]
+
+    return data_cache.get_or_fetch(pr, 'review_records', fetch)
+
+
+def get_stored_commits(config: optparse.Values, data_cache: DataCache, repository: Repository,
+                       period_from=None) -> list[CommitRecord]:
+    """Commits of default branch since period_from from the event store, newest first like the listing."""
+
+    def fetch():
+        return [dict(raw, last_modified=headers.get('last-modified')) for raw, headers in iter_raw(
+            repository._requester, f'{repository.url}/commits')]
+
+    items = get_stored_items(config, data_cache, repository, 'commits', fetch)
+    if period_from:
+        since = period_from.strftime(GITHUB_DATE_PATTERN)
+        items = [i for i in items if i['commit']['author']['date'] >= since]
+    items = sorted(items, key=lambda i: i['commit']['author']['date'], reverse=True)
+    return [CommitRecord(raw, {'last-modified': raw.get('last_modified')}) for raw in items]
+
+
+def get_commits(config: optparse.Values, data_cache: DataCache, repository: Repository,
+                period_from=None) -> list[CommitRecord]:
+    """Commits of default branch since period_from, newest first, fetched once per run."""
+
+    def fetch():
+        if getattr(config, 'events', False):
+            return get_stored_commits(config, data_cache, repository, period_from)
+        params = {'since': period_from.strftime(GITHUB_DATE_PATTERN)} if period_from else {}
+        return [CommitRecord(raw, headers) for raw, headers in iter_raw(
+            repository._requester, f'{repository.url}/commits', params)]
+
+    return data_cache.get_or_fetch(repository, 'commits', fetch, period_from)
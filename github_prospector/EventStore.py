@@ -0,0 +1,165 @@
+import json
+import optparse
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import Callable
+
+from github.Repository import Repository
+
+from github_prospector.DataCache import DataCache
+from github_prospector.settings import DEFAULT_RECONCILE_INTERVAL
+
+DELIVERIES_TTL = 7 * 24 * 3600  # seconds, ids of deliveries are kept for dropping redelivered webhooks
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS items (repo TEXT, resource TEXT, id TEXT, updated_at TEXT, received_at REAL, '
+    'raw TEXT, PRIMARY KEY (repo, resource, id))',
+    'CREATE TABLE IF NOT EXISTS synced (repo TEXT, resource TEXT, synced_at REAL, stale INTEGER, '
+    'PRIMARY KEY (repo, resource))',
+    'CREATE TABLE IF NOT EXISTS deliveries (id TEXT PRIMARY KEY, received_at REAL)',
+)
+
+
+def _get_id(raw: dict) -> str:
+    return str(raw.get('id') or raw.get('sha') or raw.get('name'))
+
+
+def _push_commit_to_raw(commit: dict) -> dict:
+    """Commit of push webhook in the shape of commits api, last_modified is its date like Last-Modified of page."""
+    date = datetime.fromisoformat(commit['timestamp']).astimezone(timezone.utc)
+    username = commit['author'].get('username')
+    return {
+        'sha': commit['id'],
+        'author': {'login': username} if username else None,
+        'commit': {'author': {'name': commit['author']['name'], 'date': date.strftime('%Y-%m-%dT%H:%M:%SZ')}},
+        'last_modified': format_datetime(date, usegmt=True),
+    }
+
+
+class EventStore:
+    """Local (SQLite) state of repositories built from GitHub webhooks: pull requests, issues, reviews of pull
+    requests and commits of default branch. Events which can't be applied, e.g. changed branch protection, mark
+    the resource stale.
+
+    Resources are reconciled by polling when they are stale, weren't polled for the reconcile interval, or
+    never were; polled items replace ones received before polling, newer events are kept."""
+
+    FILE_NAME = 'events_state.sqlite'
+
+    _instances: dict[str, 'EventStore'] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        for statement in SCHEMA:
+            self._db.execute(statement)
+        self._db.commit()
+
+    @classmethod
+    def open(cls, state_dir: str) -> 'EventStore':
+        """Return store of directory, one per process."""
+        path = os.path.join(state_dir, cls.FILE_NAME)
+        with cls._instances_lock:
+            if path not in cls._instances:
+                if not os.path.exists(state_dir):
+                    os.makedirs(state_dir)
+                cls._instances[path] = cls(path)
+            return cls._instances[path]
+
+    def _upsert(self, repo: str, resource: str, items: list[dict], received_at: float):
+        """Items replace stored ones unless those were updated later, e.g. events delivered out of order."""
+        self._db.executemany(
+            'INSERT INTO items VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (repo, resource, id) DO UPDATE SET '
+            'updated_at = excluded.updated_at, received_at = excluded.received_at, raw = excluded.raw '
+            'WHERE excluded.updated_at >= items.updated_at',
+            [(repo, resource, _get_id(i), i.get('updated_at') or '', received_at, json.dumps(i)) for i in items])
+
+    def apply(self, event: str, payload: dict, delivery: str = None) -> bool:
+        """Apply webhook to the store. Returns False if it's ignored: redelivered, not supported or not applicable,
+        e.g. push to other branch than the default one."""
+        repository = payload.get('repository')
+        if not repository:
+            return False
+        repo = repository['full_name']
+        action = payload.get('action')
+        now = time.time()
+        with self._lock, self._db:
+            if delivery:
+                self._db.execute('DELETE FROM deliveries WHERE received_at < ?', (now - DELIVERIES_TTL,))
+                if self._db.execute('SELECT 1 FROM deliveries WHERE id = ?', (delivery,)).fetchone():
+                    return False
+                self._db.execute('INSERT INTO deliveries VALUES (?, ?)', (delivery, now))
+            if event == 'pull_request':
+                self._upsert(repo, 'pulls', [payload['pull_request']], now)
+            elif event == 'pull_request_review':
+                self._upsert(repo, f'reviews:{payload["pull_request"]["number"]}', [payload['review']], now)
+            elif event == 'issues' and action in ('deleted', 'transferred'):
+                self._db.execute('DELETE FROM items WHERE repo = ? AND resource = ? AND id = ?',
+                                 (repo, 'issues', _get_id(payload['issue'])))
+            elif event == 'issues':
+                self._upsert(repo, 'issues', [payload['issue']], now)
+            elif event == 'push':
+                if not payload['ref'].startswith('refs/heads/'):
+                    return False
+                if payload.get('created') or payload.get('deleted'):
+                    self._mark_stale(repo, 'branch_protection')
+                if payload['ref'] != f'refs/heads/{repository["default_branch"]}':
+                    return bool(payload.get('created') or payload.get('deleted'))
+                if payload.get('forced'):
+                    self._mark_stale(repo, 'commits')  # commits could be dropped from history
+                else:
+                    self._upsert(repo, 'commits', [_push_commit_to_raw(i) for i in payload.get('commits', [])], now)
+            elif event == 'branch_protection_rule':
+                self._mark_stale(repo, 'branch_protection')
+            else:
+                return False
+        return True
+
+    def _mark_stale(self, repo: str, resource_prefix: str):
+        self._db.execute('UPDATE synced SET stale = 1 WHERE repo = ? AND resource LIKE ?',
+                         (repo, f'{resource_prefix}%'))
+
+    def needs_reconcile(self, repo: str, resource: str, max_age: float) -> bool:
+        with self._lock:
+            row = self._db.execute(
+                'SELECT synced_at, stale FROM synced WHERE repo = ? AND resource = ?', (repo, resource)).fetchone()
+        return not row or row[1] or row[0] < time.time() - max_age
+
+    def reconcile(self, repo: str, resource: str, items: list[dict], started: float):
+        """Replace items received before polling started by polled ones."""
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM items WHERE repo = ? AND resource = ? AND received_at < ?',
+                             (repo, resource, started))
+            self._upsert(repo, resource, items, started)
+            self._db.execute('INSERT OR REPLACE INTO synced VALUES (?, ?, ?, 0)', (repo, resource, started))
+
+    def get_items(self, repo: str, resource: str) -> list[dict]:
+        """Items in order of their storing."""
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT raw FROM items WHERE repo = ? AND resource = ? ORDER BY rowid', (repo, resource)).fetchall()
+        return [json.loads(raw) for raw, in rows]
+
+
+def get_stored_items(config: optparse.Values, data_cache: DataCache, repository: Repository, resource: str,
+                     fetch: Callable[[], list[dict]]) -> list[dict]:
+    """Raw items of resource of repository from the event store, resource is reconciled by fetch() if needed.
+    Read once per run."""
+
+    def read():
+        store = EventStore.open(getattr(config, 'cache_dir'))
+        repo_name = repository.full_name
+        max_age = (getattr(config, 'reconcile_interval', None) or DEFAULT_RECONCILE_INTERVAL) * 3600
+        if store.needs_reconcile(repo_name, resource, max_age):
+            started = time.time()
+            store.reconcile(repo_name, resource, fetch(), started)
+        return store.get_items(repo_name, resource)
+
+    return data_cache.get_or_fetch(repository, f'events:{resource}', read)
@@ -0,0 +1,268 @@
+import json
+import optparse
+from datetime import datetime
+from typing import Optional
+from urllib.parse import urlparse
+
+from github.GithubException import GithubException, RateLimitExceededException
+from github.Repository import Repository
+
+from github_prospector.Client import PooledHTTPConnection, PooledHTTPSConnection, get_api_url, setup_connections
+from github_prospector.DataCache import DataCache
+from github_prospector.RateLimiter import get_tokens
+from github_prospector.utils import (get_created_qualifier, get_branch_patterns, match_branch_patterns,
+                                     GITHUB_DATE_PATTERN)
+
+GRAPHQL_BATCH_SIZE = 20  # repositories per query
+
+REPO_COUNTS_FIELDS = {
+    'open_prs': 'pullRequests(states: OPEN) { totalCount }',
+    'closed_prs': 'pullRequests(states: [CLOSED, MERGED]) { totalCount }',
+    'merged_prs': 'pullRequests(states: MERGED) { totalCount }',
+    'open_issues': 'issues(states: OPEN) { totalCount }',
+    'closed_issues': 'issues(states: CLOSED) { totalCount }',
+}
+
+REPO_COUNTS_SEARCH_QUALIFIERS = {
+    'open_prs': 'is:pr is:open',
+    'closed_prs': 'is:pr is:closed',
+    'merged_prs': 'is:pr is:merged',
+    'open_issues': 'is:issue is:open',
+    'closed_issues': 'is:issue is:closed',
+}
+
+
+class GraphQLClient:
+    """Client of GitHub's GraphQL api, sends requests through the same pooled connections as PyGithub."""
+
+    def __init__(self, config: optparse.Values):
+        setup_connections(config)
+        self.config = config
+        api_url = get_api_url(config)
+        # enterprise server serves rest api on /api/v3 and graphql on /api/graphql
+        self.url = urlparse(api_url[:-len('/v3')] + '/graphql' if api_url.endswith('/v3') else api_url + '/graphql')
+
+    def query(self, query: str, variables: dict = None) -> dict:
+        """Run query and return its data."""
+        connection_class = PooledHTTPSConnection if self.url.scheme == 'https' else PooledHTTPConnection
+        cnx = connection_class(self.url.hostname, self.url.port)
+        headers = {
+            'Authorization': f"bearer {','.join(get_tokens(getattr(self.config, 'github_token')))}",
+            'Content-Type': 'application/json',
+            'User-Agent': 'PyGithub/Python',
+        }
+        cnx.request('POST', self.url.path, json.dumps({'query': query, 'variables': variables or {}}), headers)
+        response = cnx.getresponse()
+        headers = dict(response.getheaders())
+        output = json.loads(response.read() or '{}')
+        errors = output.get('errors') if isinstance(output, dict) else None
+        if errors and any(e.get('type') == 'RATE_LIMITED' for e in errors):
+            raise RateLimitExceededException(response.status, output, headers)
+        # not found objects of batched query are null in data, others are still usable
+        if response.status >= 400 or not output.get('data') or any(e.get('type') != 'NOT_FOUND' for e in errors or []):
+            raise GithubException(response.status, output, headers)
+        return output['data']
+
+
+def get_batch(repository: Repository, repos: list[Repository]) -> list[Repository]:
+    """Batch of repos the repository is collected with."""
+    names = [repo.full_name for repo in repos]
+    if repository.full_name not in names:
+        return [repository]
+    start = names.index(repository.full_name) // GRAPHQL_BATCH_SIZE * GRAPHQL_BATCH_SIZE
+    return repos[start:start + GRAPHQL_BATCH_SIZE]
+
+
+def _build_counts_query(repos: list[Repository], period_from=None, period_to=None) -> str:
+    aliases = []
+    for i, repo in enumerate(repos):
+        owner, name = repo.full_name.split('/', 1)
+        if period_from or period_to:
+            created = get_created_qualifier(period_from, period_to)
+            for field, qualifiers in REPO_COUNTS_SEARCH_QUALIFIERS.items():
+                search_query = json.dumps(f'repo:{repo.full_name} {qualifiers} {created}')
+                aliases.append(f'r{i}_{field}: search(type: ISSUE, query: {search_query}) {{ issueCount }}')
+        else:
+            fields = ' '.join(f'{field}: {connection}' for field, connection in REPO_COUNTS_FIELDS.items())
+            aliases.append(f'r{i}: repository(owner: {json.dumps(owner)}, name: {json.dumps(name)}) {{ {fields} }}')
+    return 'query { %s }' % ' '.join(aliases)
+
+
+def fetch_repos_counts(config: optparse.Values, repos: list[Repository], period_from=None, period_to=None) -> dict:
+    """Count pull requests and issues per state for repos with one aliased query.
+    Returns {full_name: {count_name: count}}."""
+    data = GraphQLClient(config).query(_build_counts_query(repos, period_from, period_to))
+    results = {}
+    for i, repo in enumerate(repos):
+        if period_from or period_to:
+            results[repo.full_name] = {
+                field: data[f'r{i}_{field}']['issueCount'] for field in REPO_COUNTS_SEARCH_QUALIFIERS
+            }
+        elif data.get(f'r{i}'):
+            results[repo.full_name] = {field: data[f'r{i}'][field]['totalCount'] for field in REPO_COUNTS_FIELDS}
+    return results
+
+
+def get_repo_counts(config: optparse.Values, data_cache: DataCache, repository: Repository,
+                    period_from=None, period_to=None) -> dict:
+    """Counts of repository, fetched together with its batch once per run."""
+    batch = get_batch(repository, getattr(config, 'repos', None) or [])
+    key = 'graphql:' + ','.join(repo.full_name for repo in batch)
+    counts = data_cache.get_or_fetch(
+        key, 'counts', lambda: fetch_repos_counts(config, batch, period_from, period_to), period_from, period_to)
+    return counts.get(repository.full_name, {})
+
+
+BRANCH_PROTECTION_RULE_FIELDS = (
+    'pattern requiresApprovingReviews requiredApprovingReviewCount dismissesStaleReviews requiresCodeOwnerReviews '
+    'isAdminEnforced requiresLinearHistory allowsForcePushes allowsDeletions restrictsPushes '
+    'pushAllowances(first: 100) { nodes { actor { __typename ... on User { login } ... on Team { name } '
+    '... on App { name } } } }'
+)
+REFS_PAGE_FIELDS = 'nodes { name } pageInfo { hasNextPage endCursor }'
+REFS_PAGE_QUERY = '''query ($owner: String!, $name: String!, $after: String) {
+  repository(owner: $owner, name: $name) {
+    refs(refPrefix: "refs/heads/", first: 100, after: $after) { %s }
+  }
+}''' % REFS_PAGE_FIELDS
+
+
+def _build_branch_protection_query(repos: list[Repository]) -> str:
+    aliases = []
+    for i, repo in enumerate(repos):
+        owner, name = repo.full_name.split('/', 1)
+        aliases.append(
+            f'r{i}: repository(owner: {json.dumps(owner)}, name: {json.dumps(name)}) {{ '
+            f'refs(refPrefix: "refs/heads/", first: 100) {{ {REFS_PAGE_FIELDS} }} '
+            # repositories rarely have more than 100 rules, so they aren't paginated
+            f'branchProtectionRules(first: 100) {{ nodes {{ {BRANCH_PROTECTION_RULE_FIELDS} }} }} }}'
+        )
+    return 'query { %s }' % ' '.join(aliases)
+
+
+def _get_rule_of_branch(branch: str, rules: list[dict]) -> Optional[dict]:
+    """Rule protecting branch: rule with exact branch name has priority over wildcard ones."""
+    matching = [rule for rule in rules if match_branch_patterns(branch, [rule['pattern']])]
+    for rule in matching:
+        if rule['pattern'] == branch:
+            return rule
+    return matching[0] if matching else None
+
+
+def _rule_to_branch_info(branch: str, rule: Optional[dict]) -> dict:
+    """Convert GraphQL rule to the format of RepositoryInfoMetrics.get_branch_info."""
+    branch_data = {
+        'name': branch,
+        'protected': rule is not None,
+    }
+    if rule is None:
+        return branch_data
+    actors = [node['actor'] for node in rule['pushAllowances']['nodes'] if node.get('actor')] \
+        if rule['restrictsPushes'] else []
+    requires_reviews = rule['requiresApprovingReviews']
+    branch_data['protection'] = {
+        'restrictions': {
+            'users': [actor['login'] for actor in actors if actor['__typename'] == 'User'],
+            'teams': [actor['name'] for actor in actors if actor['__typename'] == 'Team'],
+            'apps': [actor['name'] for actor in actors if actor['__typename'] == 'App'],
+        },
+        'required_pull_request_reviews': {
+            'dismiss_stale_reviews': rule['dismissesStaleReviews'] if requires_reviews else {},
+            'require_code_owner_reviews': rule['requiresCodeOwnerReviews'] if requires_reviews else {},
+            'required_approving_review_count': rule['requiredApprovingReviewCount'] if requires_reviews else {},
+        },
+        'enforce_admins': rule['isAdminEnforced'],
+        'required_linear_history': rule['requiresLinearHistory'],
+        'allow_force_pushes': rule['allowsForcePushes'],
+        'allow_deletions': rule['allowsDeletions'],
+    }
+    return branch_data
+
+
+def fetch_repos_branch_protection(config: optparse.Values, repos: list[Repository]) -> dict:
+    """Branch protection of all branches of repos: protection rules and first page of branches are fetched
+    with one aliased query, next pages of branches - per repository. Rules are matched to branches locally.
+    Returns {full_name: {branch: branch_info}}."""
+    client = GraphQLClient(config)
+    data = client.query(_build_branch_protection_query(repos))
+    patterns = get_branch_patterns(config)
+    results = {}
+    for i, repo in enumerate(repos):
+        repo_data = data.get(f'r{i}')
+        if not repo_data:
+            continue
+        refs = repo_data['refs']
+        branches = [node['name'] for node in refs['nodes']]
+        while refs['pageInfo']['hasNextPage']:
+            owner, name = repo.full_name.split('/', 1)
+            refs = client.query(REFS_PAGE_QUERY, {
+                'owner': owner, 'name': name, 'after': refs['pageInfo']['endCursor']
+            })['repository']['refs']
+            branches.extend(node['name'] for node in refs['nodes'])
+        if patterns:
+            branches = [branch for branch in branches if match_branch_patterns(branch, patterns)]
+        rules = repo_data['branchProtectionRules']['nodes']
+        results[repo.full_name] = {
+            branch: _rule_to_branch_info(branch, _get_rule_of_branch(branch, rules)) for branch in branches
+        }
+    return results
+
+
+def get_repo_branch_protection(config: optparse.Values, data_cache: DataCache, repository: Repository) -> dict:
+    """Branch protection of repository, fetched together with its batch once per run."""
+    batch = get_batch(repository, getattr(config, 'repos', None) or [])
+    key = 'graphql:' + ','.join(repo.full_name for repo in batch)
+    protection = data_cache.get_or_fetch(
+        key, 'branch_protection', lambda: fetch_repos_branch_protection(config, batch))
+    return protection.get(repository.full_name, {})
+
+
+OPEN_PRS_REVIEWS_QUERY = '''query ($owner: String!, $name: String!, $after: String) {
+  repository(owner: $owner, name: $name) {
+    pullRequests(states: OPEN, first: 50, after: $after) {
+      nodes {
+        number
+        author { login ... on User { name } }
+        reviews(first: 100) { nodes { author { login ... on User { name } } submittedAt state } }
+      }
+      pageInfo { hasNextPage endCursor }
+    }
+  }
+}'''
+
+
+def _format_user(author: Optional[dict]) -> tuple:
+    """(name, login) of author, deleted users are null in GraphQL and `ghost` in REST."""
+    if not author:
+        return None, 'ghost'
+    return author.get('name'), author['login']
+
+
+def fetch_open_prs_reviews(config: optparse.Values, repository: Repository) -> dict:
+    """Authors and reviews of all open pull requests of repository, a query per 50 pull requests.
+    Returns {number: {'author': (name, login), 'reviews': [(name, login, submitted_at, state)]}}."""
+    client = GraphQLClient(config)
+    owner, name = repository.full_name.split('/', 1)
+    results = {}
+    after = None
+    while True:
+        prs = client.query(OPEN_PRS_REVIEWS_QUERY, {'owner': owner, 'name': name, 'after': after})
+        prs = prs['repository']['pullRequests']
+        for pr in prs['nodes']:
+            results[pr['number']] = {
+                'author': _format_user(pr['author']),
+                'reviews': [
+                    (*_format_user(review['author']),
+                     datetime.strptime(review['submittedAt'], GITHUB_DATE_PATTERN) if review['submittedAt'] else None,
+                     review['state'])
+                    for review in pr['reviews']['nodes']
+                ],
+            }
+        if not prs['pageInfo']['hasNextPage']:
+            return results
+        after = prs['pageInfo']['endCursor']
+
+
+def get_open_prs_reviews(config: optparse.Values, data_cache: DataCache, repository: Repository) -> dict:
+    """Authors and reviews of open pull requests of repository, fetched once per run."""
+    return data_cache.get_or_fetch(repository, 'open_prs_reviews', lambda: fetch_open_prs_reviews(config, repository))
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+
+class CachedResponse:
+    """Mimic of httplib's response served from the cache."""
+
+    def __init__(self, status: int, headers: dict, text: str):
+        self.status = status
+        self.headers = headers
+        self.text = text
+
+    def getheaders(self):
+        return self.headers.items()
+
+    def read(self):
+        return self.text
+
+
+class HttpCache:
+    """On-disk (SQLite) storage of GET responses with their ETag/Last-Modified validators.
+
+    Stored responses are revalidated with conditional requests, GitHub answers 304 for unchanged ones
+    and those aren't counted against the rate limit. Size of stored bodies is capped,
+    least recently used responses are evicted."""
+
+    FILE_NAME = 'http_cache.sqlite'
+
+    def __init__(self, cache_dir: str, max_size: int):
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self.path = os.path.join(cache_dir, self.FILE_NAME)
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, status INTEGER, headers TEXT, body TEXT, '
+            'size INTEGER, accessed_at REAL)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)')
+        self._size = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    @staticmethod
+    def make_key(url: str, headers: dict) -> str:
+        """Responses differ by credentials and media type, so both are part of the key."""
+        raw = '\n'.join((url, headers.get('Authorization') or '', headers.get('Accept') or ''))
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[tuple]:
+        """Return (etag, last_modified, status, headers, body) of stored response."""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT etag, last_modified, status, headers, body FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (time.time(), key))
+        etag, last_modified, status, headers, body = row
+        return etag, last_modified, status, json.loads(headers), body
+
+    def set(self, key: str, status: int, headers: dict, body: str):
+        etag = headers.get('etag')
+        last_modified = headers.get('last-modified')
+        if not etag and not last_modified:
+            return
+        size = len(body)
+        if size > self.max_size:
+            return
+        with self._lock:
+            prev = self._db.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            self._db.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, etag, last_modified, status, json.dumps(headers), body, size, time.time())
+            )
+            self._size += size - (prev[0] if prev else 0)
+            if self._size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        """Remove least recently used responses until total size fits the cap."""
+        target = self.max_size * 0.9
+        rows = self._db.execute('SELECT key, size FROM responses ORDER BY accessed_at').fetchall()
+        evicted = []
+        for key, size in rows:
+            if self._size <= target:
+                break
+            evicted.append((key,))
+            self._size -= size
+        self._db.executemany('DELETE FROM responses WHERE key = ?', evicted)
+
+    def conditional_headers(self, cached: tuple) -> dict:
+        etag, last_modified = cached[:2]
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def close(self):
+        with self._lock:
+            self._db.close()
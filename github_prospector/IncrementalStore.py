@@ -0,0 +1,119 @@
+import json
+import optparse
+import os
+import sqlite3
+import threading
+from typing import Optional
+
+from github.Repository import Repository
+
+from github_prospector.DataCache import DataCache
+from github_prospector.Records import IssueRecord, PullRequestRecord, iter_raw
+
+
+class IncrementalStore:
+    """Local (SQLite) state of repositories' pull requests and issues.
+
+    Keeps fetched items and a watermark per repository and resource - the last seen `updated_at`,
+    so next runs fetch only items changed since then."""
+
+    FILE_NAME = 'incremental_state.sqlite'
+
+    _instances: dict[str, 'IncrementalStore'] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS items ('
+            'repo TEXT, resource TEXT, id INTEGER, updated_at TEXT, raw TEXT, PRIMARY KEY (repo, resource, id))'
+        )
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS watermarks (repo TEXT, resource TEXT, updated_at TEXT, '
+            'PRIMARY KEY (repo, resource))'
+        )
+        self._db.commit()
+
+    @classmethod
+    def open(cls, state_dir: str) -> 'IncrementalStore':
+        """Return store of directory, one per process."""
+        path = os.path.join(state_dir, cls.FILE_NAME)
+        with cls._instances_lock:
+            if path not in cls._instances:
+                if not os.path.exists(state_dir):
+                    os.makedirs(state_dir)
+                cls._instances[path] = cls(path)
+            return cls._instances[path]
+
+    def get_watermark(self, repo: str, resource: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                'SELECT updated_at FROM watermarks WHERE repo = ? AND resource = ?', (repo, resource)
+            ).fetchone()
+        return row[0] if row else None
+
+    def merge(self, repo: str, resource: str, items: list[dict]):
+        """Upsert changed items and move watermark forward in one transaction."""
+        if not items:
+            return
+        watermark = max(i['updated_at'] for i in items)
+        with self._lock, self._db:
+            self._db.executemany(
+                'INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?)',
+                [(repo, resource, i['id'], i['updated_at'], json.dumps(i)) for i in items]
+            )
+            self._db.execute(
+                'INSERT INTO watermarks VALUES (?, ?, ?) ON CONFLICT (repo, resource) '
+                'DO UPDATE SET updated_at = MAX(updated_at, excluded.updated_at)',
+                (repo, resource, watermark)
+            )
+
+    def get_items(self, repo: str, resource: str) -> list[dict]:
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT raw FROM items WHERE repo = ? AND resource = ?', (repo, resource)
+            ).fetchall()
+        return [json.loads(raw) for raw, in rows]
+
+
+def _fetch_pulls_delta(repository: Repository, watermark: Optional[str]) -> list[dict]:
+    """Pull requests updated since watermark: newest updated first, stop on the first older one."""
+    delta = []
+    params = {'state': 'all', 'sort': 'updated', 'direction': 'desc'}
+    for raw, _ in iter_raw(repository._requester, f'{repository.url}/pulls', params):
+        if watermark and raw['updated_at'] < watermark:
+            break
+        delta.append(raw)
+    return delta
+
+
+def _fetch_issues_delta(repository: Repository, watermark: Optional[str]) -> list[dict]:
+    """Issues updated since watermark."""
+    params = {'state': 'all', 'since': watermark} if watermark else {'state': 'all'}
+    return [raw for raw, _ in iter_raw(repository._requester, f'{repository.url}/issues', params)]
+
+
+RESOURCES = {
+    'pulls': (PullRequestRecord, _fetch_pulls_delta),
+    'issues': (IssueRecord, _fetch_issues_delta),
+}
+
+
+def get_synced_items(config: optparse.Values, data_cache: DataCache, repository: Repository, resource: str) -> list:
+    """Sync resource ('pulls' or 'issues') of repository with the local store
+    and return all stored items as records, newest created first like listings. Syncs once per run."""
+    record_class, fetch_delta = RESOURCES[resource]
+
+    def sync():
+        store = IncrementalStore.open(getattr(config, 'cache_dir'))
+        repo_name = repository.full_name
+        store.merge(repo_name, resource, fetch_delta(repository, store.get_watermark(repo_name, resource)))
+        # the store keeps items in the order of syncs
+        items = [record_class(raw) for raw in store.get_items(repo_name, resource)]
+        items.sort(key=lambda i: (i.created_at, i.number), reverse=True)
+        return items
+
+    return data_cache.get_or_fetch(repository, f'synced_{resource}', sync)
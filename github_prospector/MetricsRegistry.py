@@ -0,0 +1,226 @@
+import ast
+import importlib
+import importlib.util
+import json
+import os
+import threading
+from importlib.metadata import entry_points
+from typing import Optional
+
+from github_prospector.settings import DEFAULT_CACHE_DIR
+
+METRICS_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'metrics')
+ENTRY_POINTS_GROUP = 'github_prospector.metrics'
+MANIFEST_VERSION = 3
+
+
+def _parse_data_sources(decorators: list) -> tuple[Optional[list], dict]:
+    """Sources and alternatives declared with @data_sources(...) decorator, (None, {}) if metric has none."""
+    for decorator in decorators:
+        if isinstance(decorator, ast.Call) and getattr(decorator.func, 'id', None) == 'data_sources':
+            sources = [ast.literal_eval(arg) for arg in decorator.args]
+            alternatives = {}
+            for keyword in decorator.keywords:
+                value = ast.literal_eval(keyword.value)
+                alternatives[keyword.arg] = [value] if isinstance(value, str) else list(value)
+            return sources, alternatives
+    return None, {}
+
+
+def _parse_classes(tree: ast.Module, module_name: str) -> dict:
+    """{'classes': {name: (assigned MetricsType or None, names of base classes)},
+    'imported': {name in module: (module name, class name)}} of module."""
+    classes, imported = {}, {}
+    for node in tree.body:
+        if isinstance(node, ast.ImportFrom):
+            source = importlib.util.resolve_name('.' * node.level + (node.module or ''),
+                                                 module_name.rpartition('.')[0]) if node.level else node.module
+            imported.update({i.asname or i.name: (source, i.name) for i in node.names})
+        elif isinstance(node, ast.ClassDef):
+            metrics_type = None
+            for item in node.body:
+                # MetricsType = MetricsTypes.REPO
+                if isinstance(item, ast.Assign) and \
+                        any(getattr(t, 'id', None) == 'MetricsType' for t in item.targets) and \
+                        isinstance(item.value, ast.Attribute):
+                    metrics_type = item.value.attr
+            classes[node.name] = metrics_type, [i.id for i in node.bases if isinstance(i, ast.Name)]
+    return {'classes': classes, 'imported': imported}
+
+
+def _parse_imported_module(module_name: str, parsed: dict) -> Optional[dict]:
+    """Classes of module found by its name, see _parse_classes; parsed is {path: classes} of parsed modules."""
+    try:
+        spec = importlib.util.find_spec(module_name)
+    except (ImportError, ValueError):
+        return None
+    if spec is None or not spec.origin or not spec.origin.endswith('.py'):
+        return None
+    if spec.origin not in parsed:
+        with open(spec.origin, encoding='utf-8') as f:
+            parsed[spec.origin] = _parse_classes(ast.parse(f.read(), spec.origin), module_name)
+    return parsed[spec.origin]
+
+
+def _get_metrics_type(module: dict, class_name: str, parsed: dict) -> Optional[str]:
+    """MetricsType assigned in class or inherited from its first base class having one, the base class is defined
+    in the module or imported from another one."""
+    metrics_type, bases = module['classes'][class_name]
+    for base in bases:
+        if metrics_type:
+            break
+        if base in module['classes'] and base != class_name:
+            metrics_type = _get_metrics_type(module, base, parsed)
+        elif base in module['imported']:
+            source, name = module['imported'][base]
+            base_module = _parse_imported_module(source, parsed)
+            if base_module and name in base_module['classes']:
+                metrics_type = _get_metrics_type(base_module, name, parsed)
+    return metrics_type
+
+
+def parse_metrics_module(path: str, module_name: str, class_names: Optional[list[str]] = None,
+                         dependencies: Optional[dict] = None) -> dict:
+    """Metrics of module found in its source without importing it: properties ending with _metric
+    defined in classes ending with Metrics. Returns {metric full name: info}.
+    Modules of base classes metrics inherit their type from are added to dependencies {path: mtime}."""
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read(), path)
+    module = _parse_classes(tree, module_name)
+    parsed = {path: module}
+    metrics = {}
+    for node in tree.body:
+        if not isinstance(node, ast.ClassDef) or not node.name.endswith('Metrics'):
+            continue
+        if class_names and node.name not in class_names:
+            continue
+        metrics_type = _get_metrics_type(module, node.name, parsed) or 'BASE'
+        for item in node.body:
+            if isinstance(item, ast.FunctionDef) and item.name.endswith('_metric') and any(
+                    getattr(d, 'id', None) == 'property' for d in item.decorator_list):
+                sources, alternatives = _parse_data_sources(item.decorator_list)
+                metrics[f'{node.name.lower()}.{item.name}'] = {
+                    'class_name': node.name,
+                    'metric_name': item.name,
+                    'module_name': module_name,
+                    'type': metrics_type,
+                    'doc': ast.get_docstring(item, clean=False),
+                    'sources': sources,
+                    'alternatives': alternatives,
+                }
+    if dependencies is not None:
+        dependencies.update({i: os.path.getmtime(i) for i in parsed if i != path})
+    return metrics
+
+
+class MetricsRegistry:
+    """Metrics of package modules and of third-party packages registered in entry points group
+    `github_prospector.metrics` (entry point is a module, or module:Class).
+
+    Modules are parsed instead of imported, parsed metrics are kept in a manifest invalidated by mtime of modules
+    and of modules of their base classes.
+    Classes are imported on first use, only modules of requested metrics get imported."""
+
+    MANIFEST_NAME = 'metrics_manifest.json'
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR):
+        self.manifest_path = os.path.join(cache_dir, self.MANIFEST_NAME)
+        self._metrics: Optional[dict] = None
+        self._classes: dict[str, type] = {}
+        self._lock = threading.Lock()
+
+    def set_cache_dir(self, cache_dir: str):
+        """Keep the manifest in cache directory of run (--cache-dir)."""
+        self.manifest_path = os.path.join(cache_dir, self.MANIFEST_NAME)
+
+    @staticmethod
+    def _get_sources() -> list[tuple]:
+        """(path, module name, class names or None) of modules with metrics."""
+        sources = [
+            (os.path.join(METRICS_DIR, i), f'github_prospector.metrics.{i[:-3]}', None)
+            for i in sorted(os.listdir(METRICS_DIR)) if i.endswith('.py') and i not in ('Base.py', '__init__.py')
+        ]
+        eps = entry_points()
+        group = eps.select(group=ENTRY_POINTS_GROUP) if hasattr(eps, 'select') else eps.get(ENTRY_POINTS_GROUP, [])
+        for ep in group:
+            module_name, _, class_name = ep.value.partition(':')
+            spec = importlib.util.find_spec(module_name.strip())
+            if spec is None or not spec.origin:
+                print(f'! Metrics module of entry point {ep.name} not found: {ep.value}')
+                continue
+            sources.append((spec.origin, module_name.strip(), [class_name.strip()] if class_name else None))
+        return sources
+
+    @staticmethod
+    def _get_mtime(path: str) -> Optional[float]:
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return None
+
+    def _load_manifest(self) -> dict:
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+            return manifest['modules'] if manifest.get('version') == MANIFEST_VERSION else {}
+        except (OSError, ValueError, KeyError):
+            return {}
+
+    def _save_manifest(self, modules: dict):
+        try:
+            os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+            tmp_path = f'{self.manifest_path}.{os.getpid()}'
+            with open(tmp_path, 'w') as f:
+                json.dump({'version': MANIFEST_VERSION, 'modules': modules}, f)
+            os.replace(tmp_path, self.manifest_path)
+        except OSError:
+            pass  # manifest is only a cache
+
+    def get_all(self) -> dict:
+        """All metrics: {metric full name: {'class_name', 'metric_name', 'module_name', 'type', 'doc', 'sources',
+        'alternatives'}}."""
+        with self._lock:
+            if self._metrics is None:
+                cached = self._load_manifest()
+                modules = {}
+                for path, module_name, class_names in self._get_sources():
+                    key = f'{module_name}:{",".join(class_names or [])}'
+                    mtime = os.path.getmtime(path)
+                    if key in cached and cached[key]['path'] == path and cached[key]['mtime'] == mtime and \
+                            all(self._get_mtime(i) == i_mtime for i, i_mtime in cached[key]['dependencies'].items()):
+                        modules[key] = cached[key]
+                    else:
+                        dependencies = {}
+                        modules[key] = {
+                            'path': path, 'mtime': mtime,
+                            'metrics': parse_metrics_module(path, module_name, class_names, dependencies),
+                            'dependencies': dependencies,
+                        }
+                if modules != cached:
+                    self._save_manifest(modules)
+                self._metrics = {}
+                for module in modules.values():
+                    self._metrics.update(module['metrics'])
+            return self._metrics
+
+    def get_names_of_type(self, metric_names: list[str], object_type: str) -> list[str]:
+        """Metrics of names collected for objects of type: repo, team or user."""
+        metrics = self.get_all()
+        return [i for i in metric_names if i in metrics and metrics[i]['type'].lower() == object_type]
+
+    def get_class(self, metric_name: str) -> type:
+        """Class of metric, its module is imported once."""
+        metric = self.get_all()[metric_name]
+        key = f"{metric['module_name']}.{metric['class_name']}"
+        if key not in self._classes:
+            module = importlib.import_module(metric['module_name'])
+            self._classes[key] = getattr(module, metric['class_name'])
+        return self._classes[key]
+
+    def print_all(self):
+        print("All existing metrics: ")
+        for name, metric in self.get_all().items():
+            print(name, f"Desc: {metric['doc']}")
+
+
+registry = MetricsRegistry()
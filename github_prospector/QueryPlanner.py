@@ -0,0 +1,81 @@
+import optparse
+from typing import Iterable, Optional
+
+
+def parse_source(source: str) -> tuple[str, Optional[str]]:
+    """'pulls:open' -> ('pulls', 'open'), 'branches' -> ('branches', None)."""
+    resource, _, state = source.partition(':')
+    return resource, state or None
+
+
+def merge_states(states: set) -> Optional[str]:
+    """State to fetch covering all requested ones: open or closed alone, otherwise all."""
+    states = set(states) - {None}
+    if not states:
+        return None
+    return states.pop() if len(states) == 1 else 'all'
+
+
+class QueryPlan:
+    """Data fetched for requested metrics: union of sources they declare, per type of object.
+
+    Sources are `resource` or `resource:state` (open, closed or all); metrics of the same object share
+    fetched data, so a resource is fetched once in the widest requested state, e.g. open and closed pull
+    requests are one listing of all. A resource read by the only metric isn't kept, it's streamed to the metric.
+    Metrics without declared sources fetch their data themselves."""
+
+    def __init__(self, metric_names: list[str], metrics: dict, config: optparse.Values):
+        """metrics are all metrics of the registry: {name: {'type', 'sources', 'alternatives', ...}}."""
+        self.config = config
+        self.repos = {getattr(i, 'full_name', None) for i in getattr(config, 'repos', None) or []}
+        self.team_repos: set[str] = set()  # repos of teams of the run, see add_team_repos
+        self.sources: dict[str, dict[str, Optional[str]]] = {}
+        self.consumers: dict[tuple, int] = {}  # (object type, resource): count of metrics reading it
+        states: dict[tuple, set] = {}
+        for name in metric_names:
+            metric = metrics.get(name) or {}
+            object_type = getattr(metric.get('type'), 'value', metric.get('type') or '').lower()
+            # user metrics are computed from data of repos, it's fetched together with data of repo metrics
+            object_types = (object_type, 'repo') if object_type == 'user' and getattr(config, 'users', None) \
+                else (object_type,)
+            for source in self.get_metric_sources(metric, config) or []:
+                resource, state = parse_source(source)
+                for i in object_types:
+                    states.setdefault((i, resource), set()).add(state)
+                    self.consumers[i, resource] = self.consumers.get((i, resource), 0) + 1
+        for (object_type, resource), resource_states in states.items():
+            self.sources.setdefault(object_type, {})[resource] = merge_states(resource_states)
+
+    @staticmethod
+    def get_metric_sources(metric: dict, config: optparse.Values) -> Optional[list[str]]:
+        """Sources of metric by options of run: alternatives declared for an enabled option replace default ones,
+        e.g. count metrics collected with --graphql."""
+        for option, sources in (metric.get('alternatives') or {}).items():
+            if getattr(config, option, False):
+                return sources
+        return metric.get('sources')
+
+    def get_resources(self, object_type: str) -> dict[str, Optional[str]]:
+        """{resource: state to fetch} of objects of type (repo, team, user)."""
+        return self.sources.get(object_type, {})
+
+    def is_shared(self, object_type: str, resource: str) -> bool:
+        """Resource of an object is read by several metrics, or by undeclared ones, so it's kept once fetched."""
+        return self.consumers.get((object_type, resource)) != 1
+
+    def add_team_repos(self, names: Iterable[str]):
+        """Repos of a team of the run, they are added before collection, so a repo read by repo and team metrics
+        is fetched in the same state for both."""
+        self.team_repos.update(names)
+
+    def get_fetch_state(self, object_type: str, resource: str, state: str, repository=None) -> str:
+        """State of resource fetched for all metrics of the object type, it covers the requested state.
+        Resource of repository is fetched once in one state for all metrics reading it: of the repo, of its teams
+        and of users, e.g. pull requests of a repo in --repos and in a team of the run."""
+        states = {self.get_resources(object_type).get(resource), state}
+        if repository is not None:
+            if repository.full_name in self.repos:
+                states.add(self.get_resources('repo').get(resource))
+            if repository.full_name in self.team_repos:
+                states.add(self.get_resources('team').get(resource))
+        return merge_states(states)
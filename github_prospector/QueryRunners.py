@@ -1,19 +1,32 @@
-import importlib
 import optparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, Optional
 
-from github.NamedUser import NamedUser
 from github.Repository import Repository
 from github.Team import Team
 
-from github_prospector.metrics.Base import get_all_metrics, MetricsTypes
+from github_prospector.Checkpoint import Checkpoint, CheckpointLocked
+from github_prospector.DataCache import DataCache
+from github_prospector.metrics.Base import get_all_metrics, github_rate_limit_decorator, MetricsTypes
+from github_prospector.MetricsRegistry import registry
+from github_prospector.QueryPlanner import QueryPlan
+from github_prospector.Telemetry import telemetry
+from github_prospector.UserIndex import UserIndex, index_repo
 
 
 class QueryRunner:
     """Class for working with query."""
 
-    def __init__(self, queries: str, config: optparse.Values):
-
+    def __init__(self, queries: str, config: optparse.Values, on_result: Callable = None, keep_results: bool = True,
+                 data_cache: DataCache = None, verbose: bool = True):
+        """on_result(object_type, name, metric_name, result) is called as soon as result of object is collected,
+        results aren't kept in *_results without keep_results, e.g. when they are streamed to report.
+        data_cache can be shared by runs, e.g. names of users stay in it, while objects' data is dropped."""
         self.config = config
+        self.on_result = on_result
+        self.keep_results = keep_results
+        self.verbose = verbose
         self.__queries = queries
         self.__existing_metrics = get_all_metrics()
         self.__existing_teams_metrics = {
@@ -26,13 +39,19 @@ class QueryRunner:
             k: v for k, v in self.__existing_metrics.items() if v.get('type') == MetricsTypes.USER
         }
         self.parsed_queries = self.__validate_queries(self.__parse_queries(queries))
+        self.plan = QueryPlan(self.parsed_queries, self.__existing_metrics, config)
         self.repos: list[Repository] = getattr(config, 'repos')
         self.teams: list[Team] = getattr(config, 'teams')
-        self.users: list[NamedUser] = getattr(config, 'users')
+        self.users: list[str] = getattr(config, 'users')
         self.repos_results: dict = {}
         self.teams_results: dict = {}
         self.users_results: dict = {}
+        self.data_cache = data_cache or DataCache()
+        self.checkpoint: Optional[Checkpoint] = None
+        self.user_index: Optional[UserIndex] = None
         self.current_step = 0
+        self._teams_repos: dict[str, set[str]] = {}  # full names of repos of teams to collect, see _plan_team_repos
+        self._teams_repos_lock = threading.Lock()
 
     def __parse_queries(self, query: str):
         queries = [i.strip() for i in query.split(',')]
@@ -50,64 +69,202 @@ class QueryRunner:
         return validated_queries
 
     def print_status(self, prefix, name, metric_name):
+        if not self.verbose:
+            return
         print(' ' * 100, end='\r')
         print(f'{prefix}: {name}, Metric: {metric_name} ✔', end='\r')
 
     def run(self):
-        for metric_name in self.parsed_queries:
-            if self.repos and metric_name in self.__existing_repos_metrics:
-                self._run_repos_collect(metric_name)
-            elif self.teams and metric_name in self.__existing_teams_metrics:
-                self._run_teams_collect(metric_name)
-            elif self.users and metric_name in self.__existing_users_metrics:
-                self._run_users_collect()
-            else:
-                print(f'Metric: {metric_name} not found or you not set required parameters!')
+        """Collect metrics object by object: all requested metrics of an object are computed from data fetched
+        for them once (see QueryPlan), then the data is dropped."""
+        self._open_checkpoint()
+        try:
+            repos_metrics, teams_metrics, users_metrics = [], [], []
+            for metric_name in self.parsed_queries:
+                if self.repos and metric_name in self.__existing_repos_metrics:
+                    repos_metrics.append(metric_name)
+                elif self.teams and metric_name in self.__existing_teams_metrics:
+                    teams_metrics.append(metric_name)
+                elif self.users and metric_name in self.__existing_users_metrics:
+                    users_metrics.append(metric_name)
+                else:
+                    print(f'Metric: {metric_name} not found or you not set required parameters!')
+            if users_metrics and not self.repos:
+                print('User metrics are computed from activity in repos, set --repos')
+                users_metrics = []
+            # users are indexed while repos are collected, unless all their metrics are in checkpoint
+            if any(self._is_pending('user', i, users_metrics) for i in (self.users if users_metrics else [])):
+                self.user_index = UserIndex()
+            if teams_metrics and (repos_metrics or self.user_index is not None or self.plan.get_resources('team')):
+                self._plan_team_repos(teams_metrics)
+            if getattr(self.config, 'engine', 'sync') == 'async':
+                self._prefetch()
+            # teams go first: data of their repos is kept for repos collected after them, while data of
+            # collected repos is dropped
+            if teams_metrics:
+                self._run_teams_collect(teams_metrics)
+            if repos_metrics or self.user_index is not None:
+                self._run_repos_collect(repos_metrics)
+            if users_metrics:
+                self._run_users_collect(users_metrics)
+        except BaseException:
+            if self.checkpoint:
+                self.checkpoint.close()
+                print('\nRun is interrupted, rerun it with --resume to continue from checkpoint')
+            raise
+        finally:
+            Checkpoint.active = None
+        if self.checkpoint:
+            self.checkpoint.complete()
 
-    def _run_teams_collect(self, metric_name):
-        self.current_step = 0
+    def _open_checkpoint(self):
+        """With --checkpoint (or --resume) completed results and fetched pages are stored in the output directory,
+        so an interrupted run can be resumed."""
+        output_dir = getattr(self.config, 'output_dir', None)
+        resume = getattr(self.config, 'resume', False)
+        if not output_dir or not (resume or getattr(self.config, 'checkpoint', False)):
+            return
+        try:
+            self.checkpoint = Checkpoint(output_dir, Checkpoint.make_fingerprint(self.__queries, self.config), resume)
+        except CheckpointLocked as e:
+            print(f'! Checkpoint {e} is used by another run of the query, this run isn\'t checkpointed')
+            return
+        Checkpoint.active = self.checkpoint
+        if self.checkpoint.resumed:
+            print(f'Resuming from checkpoint: {self.checkpoint.path}')
+        elif resume and self.verbose:
+            print('! No checkpoint of the same query, period and objects, the run starts from scratch')
+
+    def _is_pending(self, prefix: str, obj: object, metrics: Iterable) -> bool:
+        """Object has requested metrics not collected before checkpoint."""
+        return not self.checkpoint or any(not self.checkpoint.has_result(prefix, self._get_name(obj), name)
+                                          for name in self.parsed_queries if name in metrics)
+
+    @staticmethod
+    def _get_name(obj: object) -> str:
+        """Name of object in results: name of repo or team, login of user."""
+        return obj if isinstance(obj, str) else obj.name
+
+    @github_rate_limit_decorator
+    def _plan_team_repos(self, metric_names: list[str]):
+        """Repos of teams are listed before collection, so data of a repo read by repo and team metrics is fetched
+        once, in the state planned for both, and data of a repo of several teams is kept until the last of them is
+        collected. Teams' metrics read the listing from the data cache."""
+        shared = set(self.plan.get_resources('team')) & set(self.plan.get_resources('repo'))
         for team in self.teams:
-            team_name = team.name
-            self.print_status('Team', team_name, metric_name)
-            if self.teams_results.get(team_name) is None:
-                self.teams_results[f'{team_name}'] = {metric_name: self.run_single(metric_name, team)}
-            else:
-                tmp = self.teams_results.get(team_name)
-                results = self.run_single(metric_name, team)
-                if not results:
-                    continue
-                tmp[metric_name] = self.run_single(metric_name, team)
-                self.teams_results[team_name] = tmp
-            self.current_step += 1
+            if self._is_pending('team', team, metric_names):
+                with telemetry.scope('team', team.name, 'repos'):
+                    repos = self.data_cache.get_or_fetch(team, 'repos', lambda: [i for i in team.get_repos()])
+                self._teams_repos[team.name] = {i.full_name for i in repos}
+                if shared:
+                    self.plan.add_team_repos(i.full_name for i in repos)
+
+    def _evict_team(self, team: Team):
+        """Drop data of collected team and of its repos, except of repos collected later: of --repos and of teams
+        not collected yet."""
+        repos = self.data_cache.get(team, 'repos') or []
+        with self._teams_repos_lock:
+            self._teams_repos.pop(team.name, None)
+            kept = self.plan.repos.union(*self._teams_repos.values())
+        for repo in repos:
+            if repo.full_name not in kept:
+                self.data_cache.evict(repo)
+        self.data_cache.evict(team)
+
+    def _prefetch(self):
+        """Fetch collections of all objects concurrently with the async engine."""
+        from github_prospector.AsyncEngine import AsyncEngine  # aiohttp is imported only for async engine
+        if self.verbose:
+            print('Prefetching data...')
+        repos = [i for i in self.repos or []
+                 if self.user_index is not None or self._is_pending('repo', i, self.__existing_repos_metrics)]
+        teams = [i for i in self.teams or [] if self._is_pending('team', i, self.__existing_teams_metrics)]
+        requests_count = AsyncEngine(self.config, self.data_cache).prefetch(self.plan, repos, teams)
+        if self.verbose:
+            print(f'Prefetch Done! Requests: {requests_count}')
+
+    def _run_teams_collect(self, metric_names: list[str]):
+        self.current_step = 0
+        for team, results in self._collect('Team', self.teams, metric_names):
+            self.current_step += len(results)
+            if not self.keep_results:
+                continue
+            for metric_name, result in results.items():
+                if self.teams_results.get(team.name) is None:
+                    self.teams_results[team.name] = {metric_name: result}
+                elif result:
+                    self.teams_results[team.name][metric_name] = result
         self.__done('Teams')
 
-    def _run_users_collect(self):
-        pass
+    def _run_users_collect(self, metric_names: list[str]):
+        self.current_step = 0
+        for login, results in self._collect('User', self.users, metric_names):
+            self.current_step += len(results)
+            if self.keep_results:
+                self.users_results.setdefault(login, {}).update(results)
+        self.__done('Users')
 
-    def _run_repos_collect(self, metric_name):
+    def _run_repos_collect(self, metric_names: list[str]):
         self.current_step = 0
-        for repo in self.repos:
-            repo_name = repo.name
-            self.print_status('Repo', repo_name, metric_name)
-            if self.repos_results.get(repo_name) is None:
-                self.repos_results[repo_name] = {metric_name: self.run_single(metric_name, repo)}
-            else:
-                tmp = self.repos_results.get(repo_name)
-                tmp[metric_name] = self.run_single(metric_name, repo)
-                self.repos_results[repo_name] = tmp
-            self.current_step += 1
+        for repo, results in self._collect('Repo', self.repos, metric_names):
+            self.current_step += len(results)
+            if self.keep_results and results:
+                self.repos_results.setdefault(repo.name, {}).update(results)
         self.__done('Repos')
 
+    def _collect(self, prefix: str, objects: list, metric_names: list[str]) -> Iterator[tuple]:
+        """Run metrics for every object, objects are collected in a pool of workers if set.
+        Yields pairs (object, {metric name: result}) in the order of objects."""
+
+        object_type = prefix.lower()
+
+        def run_metric(obj, metric_name: str):
+            name = self._get_name(obj)
+            if self.checkpoint and self.checkpoint.has_result(object_type, name, metric_name):
+                result = self.checkpoint.get_result(object_type, name, metric_name)
+            else:
+                self.print_status(prefix, name, metric_name)
+                with telemetry.scope(object_type, name, metric_name):
+                    result = self.run_single(metric_name, obj)
+                if self.checkpoint:
+                    self.checkpoint.add_result(object_type, name, metric_name, result)
+            if self.on_result:
+                self.on_result(object_type, name, metric_name, result)
+            return result
+
+        def run(obj):
+            try:
+                if object_type == 'repo' and self.user_index is not None:
+                    # data of repo is fetched once for its metrics and the user index
+                    self.print_status(prefix, obj.name, 'user index')
+                    with telemetry.scope(object_type, obj.name, 'user index'):
+                        index_repo(self.config, self.data_cache, self.plan, self.user_index, obj)
+                return {metric_name: run_metric(obj, metric_name) for metric_name in metric_names}
+            finally:
+                if object_type == 'team':
+                    self._evict_team(obj)
+                else:
+                    self.data_cache.evict(obj)
+
+        workers = getattr(self.config, 'workers', 1) or 1
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                yield from zip(objects, executor.map(run, objects))
+        else:
+            for obj in objects:
+                yield obj, run(obj)
+
     def run_single(self, metric_name: str, obj: object):
         current_metric = self.__existing_metrics.get(metric_name)
         if not current_metric:
             print(f'Error, {current_metric} not found!')
             return {}
-        module = importlib.import_module(current_metric['module_name'])
-        _class = getattr(module, current_metric['class_name'])
-        tmp = _class(self.config, obj)
+        _class = registry.get_class(metric_name)
+        tmp = _class(self.config, obj, data_cache=self.data_cache, plan=self.plan, user_index=self.user_index)
         return getattr(tmp, current_metric['metric_name'])
 
     def __done(self, prefix: str = ''):
+        if not self.verbose:
+            return
         print(' ' * 100, end='\r')
         print(f'{prefix} Done!\n{prefix} metrics collected: {self.current_step}')
@@ -0,0 +1,146 @@
+import random
+import threading
+import time
+from typing import Optional
+
+from github_prospector.Telemetry import telemetry
+
+PACING_THRESHOLD = 0.2  # part of the limit left, after which requests are spread till reset
+SECONDARY_LIMIT_BACKOFF = 60  # seconds, GitHub asks to wait at least a minute without Retry-After
+MAX_BACKOFF = 15 * 60
+MAX_RETRIES = 5
+
+
+def get_resource(url: str) -> str:
+    """Api resource of request, rate limits are counted per resource."""
+    if url.split('?')[0].endswith('/graphql'):
+        return 'graphql'
+    if '/search/' in url:
+        return 'search'
+    return 'core'
+
+
+def get_tokens(token: Optional[str]) -> list[str]:
+    """Tokens of pool set as comma separated list."""
+    return [i.strip() for i in (token or '').split(',') if i.strip()]
+
+
+class _Budget:
+    def __init__(self):
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None
+        self.reset: Optional[float] = None
+        self.next_slot = 0.0
+        self.paused_until = 0.0
+        self.secondary_attempts = 0
+
+
+class RateLimitScheduler:
+    """Paces requests by rate limit headers of responses instead of waiting for exceeded limits.
+
+    Limits are tracked per bucket - token and api resource. Requests go at full speed while enough of the limit
+    is left, then the remaining requests are spread evenly till reset. Exceeded primary limits pause all requests
+    of the bucket till reset, secondary (abuse) limits - for Retry-After or exponential backoff with jitter.
+    Requests authorized with a pool of tokens are routed to the token with the most remaining budget."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._budgets: dict[tuple, _Budget] = {}
+        self.slept = 0.0
+
+    def _get_budget(self, bucket: tuple) -> _Budget:
+        if bucket not in self._budgets:
+            self._budgets[bucket] = _Budget()
+        return self._budgets[bucket]
+
+    def get_limits(self, resource: str = 'core') -> tuple[Optional[int], Optional[int]]:
+        """(remaining, limit) of api resource summed over tokens, Nones until responses tell them."""
+        with self._lock:
+            budgets = [b for (_, r), b in self._budgets.items() if r == resource and b.limit is not None]
+            if not budgets:
+                return None, None
+            return sum(max(b.remaining or 0, 0) for b in budgets), sum(b.limit for b in budgets)
+
+    def route(self, url: str, headers: dict) -> tuple[dict, tuple]:
+        """Put token of the pool into Authorization header of request. Returns headers and bucket of request."""
+        headers = dict(headers or {})
+        resource = get_resource(url)
+        if not headers.get('Authorization'):
+            return headers, (None, resource)
+        scheme, _, token = headers['Authorization'].rpartition(' ')
+        tokens = get_tokens(token)
+        if len(tokens) > 1:
+            token = self._pick_token(tokens, resource)
+            headers['Authorization'] = f'{scheme} {token}'.strip()
+        return headers, (token, resource)
+
+    def _pick_token(self, tokens: list[str], resource: str) -> str:
+        """Token available the soonest, the one with the most remaining requests among available ones.
+        Tokens without known budget go first, so every token of the pool gets used."""
+        now = time.time()
+        with self._lock:
+            def availability(token: str) -> tuple:
+                budget = self._get_budget((token, resource))
+                available_at = budget.paused_until
+                if budget.remaining is not None and budget.remaining <= 0 and budget.reset:
+                    available_at = max(available_at, budget.reset + 1)
+                remaining = budget.remaining if budget.remaining is not None else float('inf')
+                return max(available_at, now), -remaining
+
+            return min(tokens, key=availability)
+
+    def reserve(self, bucket: tuple) -> float:
+        """Reserve slot for request. Returns seconds to wait before sending it."""
+        now = time.time()
+        with self._lock:
+            budget = self._get_budget(bucket)
+            start = max(now, budget.paused_until)
+            if budget.remaining is not None and budget.reset and budget.limit:
+                if budget.remaining <= 0 and budget.reset > start:
+                    start = budget.reset + 1
+                elif budget.remaining < budget.limit * PACING_THRESHOLD and budget.reset > start:
+                    start = max(start, budget.next_slot)
+                    budget.next_slot = start + (budget.reset - start) / max(budget.remaining, 1)
+                # requests in flight spend budget before their responses update it
+                budget.remaining -= 1
+            delay = max(start - now, 0)
+            self.slept += delay
+        if delay:
+            telemetry.record_sleep(delay)
+        return delay
+
+    def update(self, bucket: tuple, status: int, headers: dict, body: str = '') -> bool:
+        """Update budget by response. Returns True if request was rate limited and should be retried."""
+        now = time.time()
+        with self._lock:
+            budget = self._get_budget(bucket)
+            if 'x-ratelimit-remaining' in headers:
+                budget.remaining = int(headers['x-ratelimit-remaining'])
+                budget.limit = int(headers.get('x-ratelimit-limit', budget.limit or 0)) or None
+                budget.reset = float(headers.get('x-ratelimit-reset', budget.reset or 0)) or None
+            if status not in (403, 429):
+                budget.secondary_attempts = 0
+                return False
+            if 'retry-after' in headers:
+                pause = int(headers['retry-after']) + random.uniform(0, 1)
+            elif budget.remaining == 0 and budget.reset:
+                pause = budget.reset - now + 1
+            elif 'secondary rate limit' in (body or '') or 'abuse' in (body or ''):
+                pause = min(SECONDARY_LIMIT_BACKOFF * 2 ** budget.secondary_attempts, MAX_BACKOFF)
+                pause += random.uniform(0, pause / 2)
+                budget.secondary_attempts += 1
+            else:
+                return False  # not a rate limit, e.g. missing permissions
+            if budget.paused_until < now + pause:
+                budget.paused_until = now + pause
+                print(f'\nRate limit! Auditor sleeps for {int(pause)} seconds')
+            telemetry.record_rate_limited()
+            return True
+
+    def wait(self, bucket: tuple):
+        delay = self.reserve(bucket)
+        if delay > 0:
+            time.sleep(delay)
+
+
+scheduler = RateLimitScheduler()
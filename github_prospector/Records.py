@@ -0,0 +1,128 @@
+import re
+import sys
+from datetime import datetime
+from typing import Iterator, Optional
+
+from github.Requester import Requester
+
+from github_prospector.Checkpoint import Checkpoint
+from github_prospector.utils import GITHUB_DATE_PATTERN, SEARCH_RESULTS_LIMIT, get_created_qualifier
+
+PER_PAGE = 100
+NEXT_LINK_REGEX = re.compile(r'<([^>]+)>;\s*rel="next"')
+
+
+def _get_items(data) -> list:
+    return data.get('items', []) if isinstance(data, dict) else data
+
+
+def iter_pages(requester: Requester, url: str, params: dict = None) -> Iterator[tuple[dict, object]]:
+    """Headers and json of pages of paginated list.
+    Pages are stored in the checkpoint of run, a resumed run reads them and continues from the next page."""
+    params = dict(params or {}, per_page=PER_PAGE)
+    checkpoint = Checkpoint.active
+    listing = checkpoint.make_listing_key(url, params) if checkpoint else None
+    page = 0
+    if checkpoint:
+        for headers, data, next_url in checkpoint.get_pages(listing):
+            page += 1
+            yield headers, data
+            url, params = next_url, {}
+    while url:
+        headers, data = requester.requestJsonAndCheck('GET', url, params)
+        match = NEXT_LINK_REGEX.search(headers.get('link', ''))
+        next_url = match.group(1) if match else None
+        if checkpoint:
+            page += 1
+            checkpoint.add_page(listing, page, headers, data, next_url)
+        yield headers, data
+        url, params = next_url, {}
+
+
+def iter_raw(requester: Requester, url: str, params: dict = None) -> Iterator[tuple[dict, dict]]:
+    """Items of paginated list as raw json with headers of their page, without building PyGithub objects."""
+    for headers, data in iter_pages(requester, url, params):
+        for item in _get_items(data):
+            yield item, headers
+
+
+def search_created_between(requester: Requester, qualifiers: list[str],
+                           period_from=None, period_to=None) -> Optional[list]:
+    """Search issues/pull requests created in period with search api qualifiers, returns their json.
+    Returns None if there are more results than search api returns."""
+    query = ' '.join([*qualifiers, get_created_qualifier(period_from, period_to)])
+    items = []
+    for _, data in iter_pages(requester, '/search/issues', {'q': query, 'sort': 'created', 'order': 'desc'}):
+        if not items and data['total_count'] > SEARCH_RESULTS_LIMIT:
+            return None
+        items.extend(data['items'])
+    return items
+
+
+def parse_date(value: Optional[str]) -> Optional[datetime]:
+    return datetime.strptime(value, GITHUB_DATE_PATTERN) if value else None
+
+
+def _login(user: Optional[dict]) -> Optional[str]:
+    return sys.intern(user['login']) if user else None
+
+
+class PullRequestRecord:
+    """Fields of pull request read by metrics, projected from its json."""
+
+    __slots__ = ('id', 'number', 'state', 'title', 'url', 'html_url', 'user_login', 'created_at', 'updated_at',
+                 'merged_at')
+
+    def __init__(self, raw: dict):
+        self.id = raw['id']
+        self.number = raw['number']
+        self.state = sys.intern(raw['state'])
+        self.title = raw['title']
+        # search api returns pull requests as issues, with url of the issue
+        self.url = raw['pull_request']['url'] if 'pull_request' in raw else raw['url']
+        self.html_url = raw['html_url']
+        self.user_login = _login(raw.get('user'))
+        self.created_at = parse_date(raw['created_at'])
+        self.updated_at = parse_date(raw['updated_at'])
+        self.merged_at = parse_date(raw.get('merged_at') or raw.get('pull_request', {}).get('merged_at'))
+
+
+class IssueRecord:
+    """Fields of issue read by metrics, projected from its json."""
+
+    __slots__ = ('id', 'number', 'state', 'html_url', 'created_at', 'updated_at', 'is_pull_request')
+
+    def __init__(self, raw: dict):
+        self.id = raw['id']
+        self.number = raw['number']
+        self.state = sys.intern(raw['state'])
+        self.html_url = raw['html_url']
+        self.created_at = parse_date(raw['created_at'])
+        self.updated_at = parse_date(raw['updated_at'])
+        # issues api returns pull requests too
+        self.is_pull_request = 'pull_request' in raw
+
+
+class CommitRecord:
+    """Fields of commit read by metrics, projected from its json."""
+
+    __slots__ = ('sha', 'author_login', 'author_name', 'last_modified')
+
+    def __init__(self, raw: dict, headers: dict = None):
+        self.sha = raw['sha']
+        self.author_login = _login(raw.get('author'))  # GitHub account of commit author, if it's linked
+        self.author_name = raw['commit']['author']['name']
+        # like PyGithub, commits of list get Last-Modified of their page
+        last_modified = (headers or {}).get('last-modified')
+        self.last_modified = sys.intern(last_modified) if last_modified else None
+
+
+class ReviewRecord:
+    """Fields of pull request review read by metrics, projected from its json."""
+
+    __slots__ = ('user_login', 'submitted_at', 'state')
+
+    def __init__(self, raw: dict):
+        self.user_login = _login(raw.get('user'))
+        self.submitted_at = parse_date(raw.get('submitted_at'))
+        self.state = sys.intern(raw['state'])
@@ -2,14 +2,25 @@ import csv
 import json
 import optparse
 import os
+import threading
+import time
 from datetime import datetime
 from enum import Enum
 from pprint import pprint
 
+from github_prospector.ResultsStore import ResultsStore
+
+try:
+    import orjson
+except ImportError:  # optional dependency: pip install github_prospector[ndjson]
+    orjson = None
+
 
 class ReporterTypes(Enum):
     """Enumerate of report types."""
     JSON = 'json'
+    NDJSON = 'ndjson'
+    SQLITE = 'sqlite'
     PRINT = 'print'
 
     # CSV = 'csv'
@@ -43,6 +54,8 @@ class Reporter:
             pprint(self.data, width=120)
         elif self.reporter_type == ReporterTypes.JSON:
             self.create_json_reports()
+        elif self.reporter_type in (ReporterTypes.NDJSON, ReporterTypes.SQLITE):
+            return  # results were streamed by StreamingReporter/SqliteReporter while collecting
         elif self.reporter_type == ReporterTypes.CSV:
             self.create_csv_reports()
         else:
@@ -98,3 +111,140 @@ class Reporter:
         for name, _data in data.items():
             writer.writerow((name, *_data.values()))
         f.close()
+
+
+class StreamingReporter:
+    """Appends result of every (object, metric) to ndjson report as soon as it's collected,
+    so memory doesn't grow with count of objects and collected results survive a crash."""
+
+    FLUSH_INTERVAL = 1  # seconds
+    FLUSH_RECORDS = 100
+
+    def __init__(self, config: optparse.Values):
+        self.config = config
+        output_dir = getattr(config, 'output_dir')
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        self.path = os.path.join(output_dir, f'{datetime.now().strftime("%m-%d-%Y")}.ndjson')
+        # a resumed run gets results of the interrupted one from checkpoint, records of them are in the report
+        self._written = self._read_keys(self.path) if getattr(config, 'resume', False) else set()
+        self._file = open(self.path, 'ab')
+        if self._file.tell() and not self._ends_with_newline(self.path):
+            self._file.write(b'\n')  # the last record of a killed run may be cut
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._flushed_at = time.monotonic()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @staticmethod
+    def _dumps(record: dict) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(record, default=str,
+                                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+        return json.dumps(record, default=str, separators=(',', ':')).encode()
+
+    @staticmethod
+    def _read_keys(path: str) -> set[tuple]:
+        """(type, name, metric) of records in the report."""
+        keys = set()
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    keys.add((record.get('type'), record.get('name'), record.get('metric')))
+        return keys
+
+    @staticmethod
+    def _ends_with_newline(path: str) -> bool:
+        with open(path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def write(self, object_type: str, name: str, metric_name: str, result):
+        """Append record of metric result, used as QueryRunner's on_result hook. Results already in the report
+        aren't appended by a resumed run."""
+        if (object_type, name, metric_name) in self._written:
+            return
+        line = self._dumps({
+            'type': object_type,
+            'name': name,
+            'metric': metric_name,
+            'result': result,
+            'collected_at': datetime.now().isoformat(),
+        }) + b'\n'
+        with self._lock:
+            self._file.write(line)
+            self._pending += 1
+            if self._pending >= self.FLUSH_RECORDS or time.monotonic() - self._flushed_at >= self.FLUSH_INTERVAL:
+                self._flush()
+
+    def _flush(self):
+        self._file.flush()
+        self._pending = 0
+        self._flushed_at = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self._file.close()
+
+
+class SqliteReporter:
+    """Inserts results into history of runs in {out-dir}/results.sqlite as they are collected,
+    in batched transactions."""
+
+    BATCH_SIZE = 500
+
+    def __init__(self, config: optparse.Values):
+        self.config = config
+        self.store = ResultsStore(getattr(config, 'output_dir'))
+        self.path = self.store.path
+        self.run_id = self.store.start_run(getattr(config, 'query', None) or '')
+        self._lock = threading.Lock()
+        self._batch = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, object_type: str, name: str, metric_name: str, result):
+        """Add metric result to batch, used as QueryRunner's on_result hook."""
+        with self._lock:
+            self._batch.append((object_type, name, metric_name, result))
+            if len(self._batch) >= self.BATCH_SIZE:
+                self._flush()
+
+    def _flush(self):
+        if self._batch:
+            self.store.add_results(self.run_id, self._batch)
+            self._batch = []
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self.store.close()
+
+
+def print_history(config: optparse.Values, metric_name: str):
+    """Print trend of metric over the last runs stored by sqlite reporter."""
+    path = os.path.join(getattr(config, 'output_dir'), ResultsStore.FILE_NAME)
+    if not os.path.exists(path):
+        print(f'History not found: {path}')
+        return
+    names = [i.strip() for i in f"{getattr(config, 'repos', '') or ''},{getattr(config, 'teams', '') or ''}".split(',')
+             if i.strip()]
+    store = ResultsStore(getattr(config, 'output_dir'))
+    rows = store.get_history(metric_name, names, getattr(config, 'history_runs', None) or 90)
+    store.close()
+    for started_at, object_type, name, result in rows:
+        print(f'{started_at}  {object_type}: {name}  {result}')
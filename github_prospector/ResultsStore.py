@@ -0,0 +1,92 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Optional
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, started_at TEXT, query TEXT)',
+    'CREATE TABLE IF NOT EXISTS objects (id INTEGER PRIMARY KEY, type TEXT, name TEXT, UNIQUE (type, name))',
+    'CREATE TABLE IF NOT EXISTS metrics (id INTEGER PRIMARY KEY, name TEXT UNIQUE)',
+    'CREATE TABLE IF NOT EXISTS results ('
+    'run_id INTEGER REFERENCES runs (id), object_id INTEGER REFERENCES objects (id), '
+    'metric_id INTEGER REFERENCES metrics (id), value_num NUMERIC, value_json TEXT, '
+    'PRIMARY KEY (run_id, object_id, metric_id))',
+    'CREATE INDEX IF NOT EXISTS runs_started_at ON runs (started_at)',
+    'CREATE INDEX IF NOT EXISTS results_metric_object ON results (metric_id, object_id, run_id)',
+)
+
+
+class ResultsStore:
+    """History of collected metrics (SQLite): results of every run per object and metric.
+
+    Numeric results are kept in value_num, so trends are a single indexed query, others as json."""
+
+    FILE_NAME = 'results.sqlite'
+
+    def __init__(self, output_dir: str):
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        self.path = os.path.join(output_dir, self.FILE_NAME)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        for statement in SCHEMA:
+            self._db.execute(statement)
+        self._db.commit()
+        self._ids: dict[tuple, int] = {}
+
+    def start_run(self, query: str, started_at: datetime = None) -> int:
+        with self._lock, self._db:
+            cursor = self._db.execute('INSERT INTO runs (started_at, query) VALUES (?, ?)',
+                                      ((started_at or datetime.now()).isoformat(), query))
+        return cursor.lastrowid
+
+    def _get_id(self, table: str, **values) -> int:
+        key = (table, *values.values())
+        if key not in self._ids:
+            columns = ', '.join(values)
+            self._db.execute(f'INSERT OR IGNORE INTO {table} ({columns}) VALUES ({", ".join("?" * len(values))})',
+                             tuple(values.values()))
+            condition = ' AND '.join(f'{column} = ?' for column in values)
+            self._ids[key] = self._db.execute(f'SELECT id FROM {table} WHERE {condition}',
+                                              tuple(values.values())).fetchone()[0]
+        return self._ids[key]
+
+    def add_results(self, run_id: int, results: list[tuple]):
+        """Insert (object_type, name, metric_name, result) records in one transaction."""
+        rows = []
+        with self._lock, self._db:
+            for object_type, name, metric_name, result in results:
+                numeric = isinstance(result, (int, float)) and not isinstance(result, bool)
+                rows.append((
+                    run_id,
+                    self._get_id('objects', type=object_type, name=name),
+                    self._get_id('metrics', name=metric_name),
+                    result if numeric else None,
+                    None if numeric else json.dumps(result, default=str),
+                ))
+            self._db.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)', rows)
+
+    def get_history(self, metric_name: str, names: Optional[list[str]] = None, runs: int = 90) -> list[tuple]:
+        """Results of metric in the last runs as (started_at, object_type, name, result), ordered by object and time."""
+        query = (
+            'SELECT r.started_at, o.type, o.name, res.value_num, res.value_json FROM results res '
+            'JOIN metrics m ON m.id = res.metric_id JOIN runs r ON r.id = res.run_id '
+            'JOIN objects o ON o.id = res.object_id '
+            'WHERE m.name = ? AND r.id IN (SELECT id FROM runs ORDER BY started_at DESC LIMIT ?)'
+        )
+        params = [metric_name, runs]
+        if names:
+            query += f' AND o.name IN ({", ".join("?" * len(names))})'
+            params.extend(names)
+        query += ' ORDER BY o.type, o.name, r.started_at'
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return [(started_at, object_type, name, value_num if value_json is None else json.loads(value_json))
+                for started_at, object_type, name, value_num, value_json in rows]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
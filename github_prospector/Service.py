@@ -0,0 +1,282 @@
+import heapq
+import json
+import optparse
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+from github_prospector.DataCache import DataCache
+from github_prospector.EventStore import EventStore
+from github_prospector.MetricsRegistry import registry
+from github_prospector.QueryRunners import QueryRunner
+from github_prospector.RateLimiter import scheduler
+from github_prospector.Telemetry import telemetry
+from github_prospector.Webhooks import SUPPORTED_EVENTS, verify_signature
+
+DEFAULT_REFRESH_INTERVAL = 60  # minutes
+WEBHOOK_REFRESH_DELAY = 10  # seconds
+BUDGET_SHARE = 0.8  # share of the hourly rate limit spent by refreshes, the rest is left for other clients of tokens
+
+
+def _to_iso(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp).isoformat(timespec='seconds') if timestamp else None
+
+
+class MetricsService:
+    """Results of the query for every repo and team kept in memory and refreshed in background.
+
+    Objects are refreshed one by one, spread evenly over the refresh interval; the interval is stretched when
+    a cycle of refreshes costs more requests than the share of the hourly rate limit. Clients of GitHub,
+    the metric registry and names of users stay warm between refreshes. With --events repos are computed from
+    the event store and webhooks received by the service refresh their repo."""
+
+    def __init__(self, query: str, config: optparse.Values):
+        self.config = config
+        self.interval = (getattr(config, 'refresh_interval', None) or DEFAULT_REFRESH_INTERVAL) * 60
+        self.objects = [('repo', i) for i in getattr(config, 'repos', None) or []] + \
+                       [('team', i) for i in getattr(config, 'teams', None) or []]
+        metric_names = QueryRunner(query, self._get_config(), verbose=False).parsed_queries
+        # object is refreshed by a run of metrics of its type
+        self.type_metrics = {i: registry.get_names_of_type(metric_names, i) for i in ('repo', 'team')}
+        self.metric_names = self.type_metrics['repo'] + self.type_metrics['team']
+        self.objects = [i for i in self.objects if self.type_metrics[i[0]]]
+        self.data_cache = DataCache()
+        self._results: dict[tuple, dict] = {}  # (object type, name): {'results', 'collected_at', 'requests'}
+        self._next_refresh: dict[tuple, float] = {}
+        self._costs: dict[tuple, int] = {}  # requests of the last refresh of object
+        self._queue: list[tuple] = []  # heap of (due time, index of object)
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._started = time.time()
+
+    def _get_config(self, object_type: str = None, obj=None) -> optparse.Values:
+        """Config of a run collecting the only object, without checkpoints."""
+        return optparse.Values(dict(
+            vars(self.config), output_dir=None, repos=[obj] if object_type == 'repo' else [],
+            teams=[obj] if object_type == 'team' else [], users=[]))
+
+    def get_interval(self) -> float:
+        """Seconds between refreshes of an object: the configured interval, stretched to fit the rate budget."""
+        _, limit = scheduler.get_limits()
+        if not limit or len(self._costs) < len(self.objects):
+            return self.interval
+        return max(self.interval, sum(self._costs.values()) / (limit * BUDGET_SHARE) * 3600)
+
+    def refresh(self, index: int):
+        object_type, obj = self.objects[index]
+        key = (object_type, obj.name)
+        before = telemetry.get_requests(object_type, obj.name)
+        started = time.time()
+        # data of the previous refresh is stale, names of users are kept
+        self.data_cache.clear(keep='user:')
+        try:
+            runner = QueryRunner(','.join(self.type_metrics[object_type]), self._get_config(object_type, obj),
+                                 data_cache=self.data_cache, verbose=False)
+            runner.run()
+        except Exception as e:
+            print(f'! Refresh of {object_type} {obj.name} failed: {e}')
+            return
+        results = (runner.repos_results if object_type == 'repo' else runner.teams_results).get(obj.name, {})
+        requests = telemetry.get_requests(object_type, obj.name) - before
+        with self._condition:
+            self._results[key] = {'results': results, 'collected_at': _to_iso(time.time()), 'requests': requests}
+            self._costs[key] = requests
+        print(f'Refreshed {object_type} {obj.name} in {time.time() - started:.1f}s, requests: {requests}')
+
+    def _schedule(self, index: int, due: float):
+        with self._condition:
+            self._next_refresh[self.objects[index][0], self.objects[index][1].name] = due
+            heapq.heappush(self._queue, (due, index))
+            self._condition.notify()
+
+    def request_refresh(self, repos: list[str], teams: list[str]) -> list[dict]:
+        """Refresh objects as soon as possible, out of schedule."""
+        scheduled = []
+        for index, (object_type, obj) in enumerate(self.objects):
+            if obj.name in (repos if object_type == 'repo' else teams):
+                self._schedule(index, 0)
+                scheduled.append({'type': object_type, 'name': obj.name})
+        return scheduled
+
+    def apply_webhook(self, event: str, payload: dict, delivery: str = None) -> bool:
+        """Apply webhook to the event store, the changed repo is refreshed shortly after it, so refreshes of
+        a burst of webhooks are merged."""
+        applied = EventStore.open(getattr(self.config, 'cache_dir')).apply(event, payload, delivery)
+        if not applied:
+            return False
+        due = time.time() + WEBHOOK_REFRESH_DELAY
+        with self._condition:
+            for index, (object_type, obj) in enumerate(self.objects):
+                if object_type == 'repo' and obj.full_name == payload['repository']['full_name'] and \
+                        self._next_refresh.get((object_type, obj.name), 0) > due:
+                    self._schedule(index, due)
+        return True
+
+    def _refresh_loop(self):
+        interval = self.interval
+        while not self._stopped.is_set():
+            with self._condition:
+                while not self._stopped.is_set():
+                    if self._queue and self._queue[0][0] <= time.time():
+                        due, index = heapq.heappop(self._queue)
+                        break
+                    self._condition.wait(self._queue[0][0] - time.time() if self._queue else None)
+                else:
+                    return
+                object_type, obj = self.objects[index]
+                if self._next_refresh.get((object_type, obj.name)) != due:
+                    continue  # superseded by a refresh out of schedule
+            self.refresh(index)
+            if self.get_interval() > interval:
+                interval = self.get_interval()
+                print(f'! Refresh interval is stretched to {interval / 60:.0f} minutes to fit the rate limit')
+            # object keeps its slot in the cycle, so refreshes stay spread over the interval
+            slot = self._started + index * interval / len(self.objects)
+            cycles = max(int((time.time() - slot) // interval) + 1, 0)
+            with self._condition:
+                if self._next_refresh.get((object_type, obj.name)) != due:
+                    continue  # refresh out of schedule is requested meanwhile
+            self._schedule(index, slot + cycles * interval)
+
+    def start(self):
+        for index in range(len(self.objects)):
+            self._schedule(index, self._started)
+        threading.Thread(target=self._refresh_loop, daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+        with self._condition:
+            self._condition.notify_all()
+
+    def get_metrics(self) -> dict:
+        metrics = registry.get_all()
+        return {
+            name: {'type': metrics[name]['type'], 'doc': metrics[name]['doc']} for name in self.metric_names
+        }
+
+    def get_results(self, metric_names: list[str] = None, repos: list[str] = None, teams: list[str] = None) -> dict:
+        """Results in the shape of QueryRunner's repos_results and teams_results; objects without results yet
+        are pending."""
+        response = {'repos': {}, 'teams': {}, 'pending': []}
+        with self._condition:
+            for object_type, obj in self.objects:
+                names = repos if object_type == 'repo' else teams
+                if names is not None and obj.name not in names:
+                    continue
+                item = self._results.get((object_type, obj.name))
+                if item is None:
+                    response['pending'].append({'type': object_type, 'name': obj.name})
+                    continue
+                results = item['results']
+                if metric_names:
+                    results = {k: v for k, v in results.items() if k in metric_names}
+                response[f'{object_type}s'][obj.name] = results
+        return response
+
+    def get_status(self) -> dict:
+        remaining, limit = scheduler.get_limits()
+        with self._condition:
+            objects = [{
+                'type': object_type,
+                'name': obj.name,
+                'collected_at': self._results.get((object_type, obj.name), {}).get('collected_at'),
+                'requests': self._results.get((object_type, obj.name), {}).get('requests'),
+                'next_refresh': _to_iso(self._next_refresh.get((object_type, obj.name))),
+            } for object_type, obj in self.objects]
+        return {'refresh_interval': self.get_interval() / 60, 'rate_limit': {'remaining': remaining, 'limit': limit},
+                'objects': objects}
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """JSON API of the service:
+    GET /metrics, GET /results?metrics=&repos=&teams=, GET /status, POST /refresh?repos=&teams=, POST /webhook"""
+
+    service: MetricsService = None
+
+    def _send_json(self, status: int, data: dict):
+        body = json.dumps(data, default=str).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _get_params(self) -> dict[str, Optional[list[str]]]:
+        """Comma separated lists of query string, None if parameter isn't set."""
+        params = parse_qs(urlparse(self.path).query)
+        return {k: [i.strip() for i in ','.join(v).split(',') if i.strip()] for k, v in params.items()}
+
+    def do_GET(self):
+        path = urlparse(self.path).path.rstrip('/')
+        params = self._get_params()
+        if path == '/metrics':
+            return self._send_json(200, self.service.get_metrics())
+        if path == '/status':
+            return self._send_json(200, self.service.get_status())
+        if path == '/results':
+            unknown = [i for i in params.get('metrics', []) if i not in self.service.metric_names]
+            if unknown:
+                return self._send_json(400, {'message': f'Metrics are not served: {", ".join(unknown)}'})
+            return self._send_json(200, self.service.get_results(
+                params.get('metrics'), params.get('repos'), params.get('teams')))
+        self._send_json(404, {'message': 'Not Found'})
+
+    def do_POST(self):
+        path = urlparse(self.path).path.rstrip('/')
+        if path == '/webhook':
+            return self._receive_webhook()
+        if path != '/refresh':
+            return self._send_json(404, {'message': 'Not Found'})
+        params = self._get_params()
+        scheduled = self.service.request_refresh(params.get('repos', []), params.get('teams', []))
+        if not scheduled:
+            return self._send_json(404, {'message': 'No served repos or teams are set'})
+        self._send_json(202, {'scheduled': scheduled})
+
+    def _receive_webhook(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        config = self.service.config
+        if not getattr(config, 'events', False):
+            return self._send_json(404, {'message': 'Webhooks are applied in --events mode'})
+        if not getattr(config, 'webhook_secret', None):
+            # the endpoint is exposed to GitHub, unsigned webhooks would let anyone write into the event store
+            return self._send_json(403, {'message': 'Webhooks are refused without --webhook-secret'})
+        if not verify_signature(body, self.headers.get('X-Hub-Signature-256'), getattr(config, 'webhook_secret', None)):
+            return self._send_json(401, {'message': 'Bad signature'})
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return self._send_json(400, {'message': 'Body is not json'})
+        event = self.headers.get('X-GitHub-Event')
+        applied = event in SUPPORTED_EVENTS and self.service.apply_webhook(
+            event, payload, self.headers.get('X-GitHub-Delivery'))
+        self._send_json(200, {'applied': applied})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(query: str, config: optparse.Values):
+    """Run the service until interrupted."""
+    service = MetricsService(query, config)
+    if not service.metric_names or not service.objects:
+        print('Set metrics of repos or teams and repos or teams for the service')
+        return
+    handler = type('Handler', (ServiceHandler,), {'service': service})
+    server = ThreadingHTTPServer((getattr(config, 'host', '127.0.0.1'), getattr(config, 'port', 8080)), handler)
+    if getattr(config, 'events', False) and not getattr(config, 'webhook_secret', None):
+        print('! Webhooks are refused without --webhook-secret, repos are reconciled by polling only')
+    service.start()
+    print(f'Serving {len(service.metric_names)} metrics of {len(service.objects)} repos/teams on '
+          f'http://{server.server_address[0]}:{server.server_address[1]}, refresh interval: '
+          f'{service.interval / 60:.0f} minutes')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print('\nService is stopped')
+    finally:
+        service.stop()
+        server.server_close()
@@ -0,0 +1,201 @@
+import contextlib
+import contextvars
+import os
+import threading
+from typing import Callable
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # seconds, upper bounds of histogram
+UNATTRIBUTED = ('', '', 'other')  # requests outside of metrics, e.g. validation of repos
+
+_scope = contextvars.ContextVar('telemetry_scope', default=UNATTRIBUTED)
+
+
+class _Stats:
+    __slots__ = ('requests', 'bytes', 'not_modified', 'cache_hits', 'rate_limited', 'sleep', 'latency_sum',
+                 'latency_buckets')
+
+    def __init__(self):
+        self.requests = 0
+        self.bytes = 0
+        self.not_modified = 0
+        self.cache_hits = 0
+        self.rate_limited = 0
+        self.sleep = 0.0
+        self.latency_sum = 0.0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # the last one is +Inf
+
+    def add(self, other: '_Stats'):
+        for name in self.__slots__:
+            if name == 'latency_buckets':
+                self.latency_buckets = [a + b for a, b in zip(self.latency_buckets, other.latency_buckets)]
+            else:
+                setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def get_quantile(self, q: float) -> float:
+        """Upper bound of histogram bucket containing the quantile of latency, inf if it's above all buckets."""
+        if not self.requests:
+            return 0
+        rank = q * self.requests
+        count = 0
+        for bound, bucket_count in zip(LATENCY_BUCKETS + (float('inf'),), self.latency_buckets):
+            count += bucket_count
+            if count >= rank:
+                return bound
+        return float('inf')
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Telemetry:
+    """Requests to GitHub attributed to the (object type, object, metric) they were sent for:
+    counts, bytes, latency histogram, 304s, data cache hits, rate limited responses and rate limit sleeps.
+
+    Attribution is kept in a context variable, so it follows asyncio tasks; pools of threads started by a metric
+    keep it with `bind`."""
+
+    def __init__(self):
+        self._stats: dict[tuple, _Stats] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    @contextlib.contextmanager
+    def scope(object_type: str, name: str, metric_name: str):
+        token = _scope.set((object_type, name, metric_name))
+        try:
+            yield
+        finally:
+            _scope.reset(token)
+
+    @staticmethod
+    def bind(func: Callable) -> Callable:
+        """func running in the scope of the caller, e.g. in other thread."""
+        scope = _scope.get()
+
+        def inner(*args, **kwargs):
+            token = _scope.set(scope)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _scope.reset(token)
+
+        return inner
+
+    def _get_stats(self) -> _Stats:
+        key = _scope.get()
+        if key not in self._stats:
+            self._stats[key] = _Stats()
+        return self._stats[key]
+
+    def record_request(self, status: int, size: int, latency: float):
+        with self._lock:
+            stats = self._get_stats()
+            stats.requests += 1
+            stats.bytes += size
+            stats.not_modified += status == 304
+            stats.latency_sum += latency
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if latency <= bound:
+                    stats.latency_buckets[i] += 1
+                    break
+            else:
+                stats.latency_buckets[-1] += 1
+
+    def record_cache_hit(self):
+        with self._lock:
+            self._get_stats().cache_hits += 1
+
+    def record_rate_limited(self):
+        with self._lock:
+            self._get_stats().rate_limited += 1
+
+    def record_sleep(self, seconds: float):
+        with self._lock:
+            self._get_stats().sleep += seconds
+
+    def get_requests(self, object_type: str, name: str) -> int:
+        """Requests sent for object by all metrics."""
+        with self._lock:
+            return sum(i.requests for (t, n, _), i in self._stats.items() if t == object_type and n == name)
+
+    def get_all(self) -> dict[tuple, _Stats]:
+        with self._lock:
+            return dict(self._stats)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def print_summary(self, top: int = 10):
+        """Table of metrics and of the top objects by count of requests."""
+        stats = self.get_all()
+        if not stats:
+            return
+        by_metric: dict[str, _Stats] = {}
+        total = _Stats()
+        for (_, _, metric_name), item in stats.items():
+            by_metric.setdefault(metric_name, _Stats()).add(item)
+            total.add(item)
+        metric_rows = [(name, item) for name, item in sorted(by_metric.items(), key=lambda i: -i[1].requests)]
+        metric_rows.append(('total', total))
+        object_rows = [
+            (f'{object_type} {name}, {metric_name}' if name else metric_name, item)
+            for (object_type, name, metric_name), item in sorted(stats.items(), key=lambda i: -i[1].requests)[:top]
+        ]
+        width = max(len(title) for title, _ in metric_rows + object_rows) + 2
+        print('\nRequests to GitHub:')
+        self._print_rows('metric', metric_rows, width)
+        print(f'\nTop {top} objects by requests:')
+        self._print_rows('object, metric', object_rows, width)
+
+    @staticmethod
+    def _print_rows(title: str, rows: list[tuple[str, _Stats]], width: int):
+        columns = ('requests', '304', 'cache hits', 'MB', 'avg ms', 'p95 ms', 'limited', 'sleep s')
+        print(f'{title:<{width}}' + ''.join(f'{i:>11}' for i in columns))
+        for title, stats in rows:
+            avg = stats.latency_sum / stats.requests * 1000 if stats.requests else 0
+            values = (stats.requests, stats.not_modified, stats.cache_hits, f'{stats.bytes / 2 ** 20:.2f}',
+                      f'{avg:.0f}', f'{stats.get_quantile(0.95) * 1000:.0f}', stats.rate_limited, f'{stats.sleep:.1f}')
+            print(f'{title:<{width}}' + ''.join(f'{i:>11}' for i in values))
+
+    def write_textfile(self, path: str):
+        """Write telemetry in Prometheus textfile format, atomically, as textfile collector reads it anytime."""
+        counters = (
+            ('requests_total', 'requests', 'Requests sent to GitHub.'),
+            ('response_bytes_total', 'bytes', 'Bytes of response bodies.'),
+            ('not_modified_total', 'not_modified', 'Responses 304 to conditional requests.'),
+            ('cache_hits_total', 'cache_hits', 'Collections read from the data cache of run.'),
+            ('rate_limited_total', 'rate_limited', 'Rate limited responses.'),
+            ('rate_limit_sleep_seconds_total', 'sleep', 'Seconds slept for rate limits.'),
+        )
+        stats = self.get_all()
+        labels = {
+            key: f'object_type="{_escape(key[0])}",object="{_escape(key[1])}",metric="{_escape(key[2])}"'
+            for key in stats
+        }
+        lines = []
+        for name, field, help_text in counters:
+            lines.append(f'# HELP github_prospector_{name} {help_text}')
+            lines.append(f'# TYPE github_prospector_{name} counter')
+            lines.extend(f'github_prospector_{name}{{{labels[key]}}} {getattr(item, field)}'
+                         for key, item in stats.items())
+        name = 'github_prospector_request_duration_seconds'
+        lines.append(f'# HELP {name} Latency of requests to GitHub.')
+        lines.append(f'# TYPE {name} histogram')
+        for key, item in stats.items():
+            count = 0
+            for bound, bucket_count in zip(LATENCY_BUCKETS + ('+Inf',), item.latency_buckets):
+                count += bucket_count
+                lines.append(f'{name}_bucket{{{labels[key]},le="{bound}"}} {count}')
+            lines.append(f'{name}_sum{{{labels[key]}}} {item.latency_sum}')
+            lines.append(f'{name}_count{{{labels[key]}}} {item.requests}')
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}'
+        with open(tmp_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, path)
+
+
+telemetry = Telemetry()
@@ -0,0 +1,115 @@
+import optparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from github.Repository import Repository
+
+from github_prospector.Client import FETCH_CONCURRENCY
+from github_prospector.DataCache import DataCache
+from github_prospector.DataSources import get_commits, get_pulls, get_reviews
+from github_prospector.QueryPlanner import QueryPlan
+from github_prospector.Records import CommitRecord, PullRequestRecord, ReviewRecord
+from github_prospector.Telemetry import telemetry
+
+
+class UserActivity:
+    """Activity of user in indexed repos."""
+
+    __slots__ = ('prs_authored', 'prs_merged', 'reviews_given', 'reviewed_prs', 'commits', 'review_latencies',
+                 'repos')
+
+    def __init__(self):
+        self.prs_authored = 0
+        self.prs_merged = 0
+        self.reviews_given = 0
+        self.reviewed_prs = 0
+        self.commits = 0
+        self.review_latencies: list[float] = []  # hours from creation of pull request to the first review of user
+        self.repos: set[str] = set()
+
+
+class UserIndex:
+    """Inverted index of pull requests, reviews and commits of repos keyed by login of their author.
+
+    Repos are indexed from data fetched for them in the run, so metrics of any number of users cost no requests
+    of their own. Pull requests and reviews are of pull requests created in period, commits are of default
+    branch since start of period."""
+
+    def __init__(self):
+        self._users: dict[str, UserActivity] = {}
+        self._repos: set[str] = set()
+        self._lock = threading.Lock()
+
+    def _get_activity(self, login: str) -> UserActivity:
+        if login not in self._users:
+            self._users[login] = UserActivity()
+        return self._users[login]
+
+    def add_repo(self, repo_name: str, prs: list[PullRequestRecord], reviews: dict[int, list[ReviewRecord]],
+                 commits: list[CommitRecord]):
+        """Index repo once: its pull requests, reviews of them {number: reviews} and commits."""
+        with self._lock:
+            if repo_name in self._repos:
+                return
+            self._repos.add(repo_name)
+            for pr in prs:
+                if pr.user_login:
+                    activity = self._get_activity(pr.user_login)
+                    activity.prs_authored += 1
+                    activity.prs_merged += pr.merged_at is not None
+                    activity.repos.add(repo_name)
+                first_reviews = {}
+                for review in reviews.get(pr.number, []):
+                    # pending reviews aren't submitted, replies of author are reviews of own pull request
+                    if not review.user_login or not review.submitted_at or review.user_login == pr.user_login:
+                        continue
+                    activity = self._get_activity(review.user_login)
+                    activity.reviews_given += 1
+                    activity.repos.add(repo_name)
+                    if review.user_login not in first_reviews:
+                        first_reviews[review.user_login] = review.submitted_at
+                for login, submitted_at in first_reviews.items():
+                    activity = self._get_activity(login)
+                    activity.reviewed_prs += 1
+                    activity.review_latencies.append((submitted_at - pr.created_at).total_seconds() / 3600)
+            for commit in commits:
+                if commit.author_login:
+                    activity = self._get_activity(commit.author_login)
+                    activity.commits += 1
+                    activity.repos.add(repo_name)
+
+    def is_indexed(self, repo_name: str) -> bool:
+        with self._lock:
+            return repo_name in self._repos
+
+    def get(self, login: str) -> UserActivity:
+        """Activity of user, empty one if user has none in indexed repos."""
+        with self._lock:
+            return self._users.get(login) or UserActivity()
+
+
+def index_repo(config: optparse.Values, data_cache: DataCache, plan: QueryPlan, index: UserIndex,
+               repository: Repository):
+    """Index data of repository planned for user metrics. Data is read through the data cache in the period of
+    metrics, so what repo metrics of the run fetch is fetched once for both."""
+    if index.is_indexed(repository.full_name):
+        return
+    period_from = getattr(config, 'start_date', None)
+    period_to = getattr(config, 'end_date', datetime.now())
+    resources = plan.get_resources('user')
+    prs: list[PullRequestRecord] = []
+    reviews: dict[int, list[ReviewRecord]] = {}
+    commits: list[CommitRecord] = []
+    if 'pulls' in resources:
+        prs = get_pulls(config, data_cache, repository, 'all', period_from, period_to,
+                        plan.get_fetch_state('user', 'pulls', 'all', repository))
+    if 'reviews' in resources:
+        # reviews are a request per pull request, so they are fetched concurrently
+        with ThreadPoolExecutor(max_workers=FETCH_CONCURRENCY) as executor:
+            reviews = dict(zip([pr.number for pr in prs], executor.map(
+                telemetry.bind(lambda pr: get_reviews(config, data_cache, repository, pr)), prs)))
+    if 'commits' in resources:
+        commits = get_commits(config, data_cache, repository, period_from)
+    index.add_repo(repository.full_name, prs, reviews, commits)
+
@@ -0,0 +1,49 @@
+import hashlib
+import hmac
+import json
+import uuid
+from typing import Iterator, Optional
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+SUPPORTED_EVENTS = ('pull_request', 'pull_request_review', 'issues', 'push', 'branch_protection_rule')
+
+
+def sign(body: bytes, secret: str) -> str:
+    """X-Hub-Signature-256 of webhook's body."""
+    return 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def verify_signature(body: bytes, signature: Optional[str], secret: Optional[str]) -> bool:
+    """Webhook is sent by GitHub with the shared secret, none is accepted without secret."""
+    return bool(secret) and bool(signature) and hmac.compare_digest(sign(body, secret), signature)
+
+
+def read_recorded(path: str) -> Iterator[dict]:
+    """Recorded webhooks, a json per line: {"event": "pull_request", "delivery": "...", "payload": {...}},
+    delivery is optional."""
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def replay(path: str, url: str, secret: str = None):
+    """Send recorded webhooks to the service the way GitHub does."""
+    sent, applied = 0, 0
+    for record in read_recorded(path):
+        body = json.dumps(record['payload']).encode()
+        headers = {
+            'Content-Type': 'application/json',
+            'X-GitHub-Event': record['event'],
+            'X-GitHub-Delivery': record.get('delivery') or str(uuid.uuid4()),
+        }
+        if secret:
+            headers['X-Hub-Signature-256'] = sign(body, secret)
+        try:
+            with urlopen(Request(url, body, headers, method='POST')) as response:
+                applied += json.load(response).get('applied', False)
+        except HTTPError as e:
+            print(f'! {record["event"]} webhook is rejected: {e.code} {e.read().decode()}')
+        sent += 1
+    print(f'Replayed webhooks: {sent}, applied: {applied}')
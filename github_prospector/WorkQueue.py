@@ -0,0 +1,256 @@
+import json
+import optparse
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Optional
+
+LEASE = 600  # seconds without heartbeat of worker after which its shard is taken by another one
+HEARTBEAT_INTERVAL = 30  # seconds
+MAX_ATTEMPTS = 3
+RUN_OPTIONS = ('query', 'owner', 'start_date', 'end_date', 'branches')  # options results depend on, set by queue
+
+
+def split(names: list, count: int) -> list[list]:
+    """Split names into count contiguous parts of nearly equal size, without empty ones."""
+    count = max(min(count, len(names)), 1)
+    size, rest = divmod(len(names), count)
+    parts, start = [], 0
+    for i in range(count):
+        end = start + size + (i < rest)
+        parts.append(names[start:end])
+        start = end
+    return [i for i in parts if i]
+
+
+class WorkQueue:
+    """Queue of shards of repos/teams in a directory shared by workers, e.g. a network share.
+
+    A shard is a json file moved between directories of its status: pending, running, done (with results of
+    collected objects) and failed. Files are written to a temporary name and renamed, and a worker claims a shard
+    by renaming it into running under its own name, rename is atomic on local and network filesystems, so the
+    only worker succeeds. A running shard is touched by heartbeats of its worker, and taken by another one when
+    the worker stopped sending them. Results are merged into the report after all shards are done."""
+
+    STATUSES = ('pending', 'running', 'done', 'failed')
+    META_FILE = 'meta.json'
+
+    def __init__(self, queue_dir: str):
+        self.queue_dir = queue_dir
+        for status in self.STATUSES:
+            os.makedirs(os.path.join(queue_dir, status), exist_ok=True)
+        self._claims: dict[int, str] = {}  # shard id: path of running shard claimed by this worker
+
+    @staticmethod
+    def _write_json(path: str, data):
+        """Write file atomically: readers see the whole file or none."""
+        directory, name = os.path.split(path)
+        tmp_path = os.path.join(directory, f'.{name}.{uuid.uuid4().hex}.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, default=str)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read_json(path: str):
+        with open(path) as f:
+            return json.load(f)
+
+    @property
+    def _meta_path(self) -> str:
+        return os.path.join(self.queue_dir, self.META_FILE)
+
+    def _path(self, status: str, name: str = '') -> str:
+        return os.path.join(self.queue_dir, status, name)
+
+    def _list(self, status: str) -> list[str]:
+        """Names of shard files in status in the order of shards, temporary files are skipped."""
+        return sorted(i for i in os.listdir(self._path(status)) if i.endswith('.json') and not i.startswith('.'))
+
+    @staticmethod
+    def _get_id(name: str) -> int:
+        return int(name.split('.', 1)[0])
+
+    @staticmethod
+    def _running_name(shard_id: int, worker: str) -> str:
+        # time of claim is in the name, it's set atomically with the claim, heartbeats update time of the file
+        return f'{shard_id:06d}.{int(time.time())}.{worker}.json'
+
+    def create(self, config: optparse.Values, repos: list[str], teams: list[str], shards: int) -> int:
+        """Replace queue with shards of repos (full names) and teams (slugs). Returns count of shards."""
+        if os.path.exists(self._meta_path):
+            os.remove(self._meta_path)
+        for status in self.STATUSES:
+            for name in os.listdir(self._path(status)):
+                os.remove(self._path(status, name))
+        parts = [('team', i) for i in split(teams, shards)] + [('repo', i) for i in split(repos, shards)]
+        for shard_id, (object_type, names) in enumerate(parts, 1):
+            self._write_json(self._path('pending', f'{shard_id:06d}.json'), {
+                'id': shard_id, 'object_type': object_type, 'names': names, 'attempts': 0, 'error': None})
+        # workers see the queue once its options are written
+        options = {}
+        for option in RUN_OPTIONS:
+            value = getattr(config, option, None)
+            options[option] = value.isoformat() if isinstance(value, datetime) else value
+        self._write_json(self._meta_path, options)
+        return len(parts)
+
+    def get_run_options(self) -> dict:
+        if not os.path.exists(self._meta_path):
+            return {}
+        options = self._read_json(self._meta_path)
+        for option in ('start_date', 'end_date'):
+            if options.get(option):
+                options[option] = datetime.fromisoformat(options[option])
+        return options
+
+    def claim(self, worker: str) -> Optional[tuple[int, str, list[str]]]:
+        """Take a pending shard or one of a lost worker: (id, object type, names), None if there are none."""
+        candidates = [self._path('pending', i) for i in self._list('pending')]
+        done = {self._get_id(i) for i in self._list('done')}
+        for name in self._list('running'):
+            path = self._path('running', name)
+            try:
+                claimed_at = int(name.split('.', 2)[1])
+                if time.time() - max(claimed_at, os.stat(path).st_mtime) < LEASE:
+                    continue
+                if self._get_id(name) in done:
+                    os.remove(path)  # worker stopped after storing results
+                    continue
+            except FileNotFoundError:
+                continue
+            candidates.append(path)
+        for path in candidates:
+            shard_id = self._get_id(os.path.basename(path))
+            claimed = self._path('running', self._running_name(shard_id, worker))
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                continue  # claimed by another worker
+            shard = self._read_json(claimed)
+            shard['attempts'] += 1
+            self._write_json(claimed, shard)
+            self._claims[shard_id] = claimed
+            return shard_id, shard['object_type'], shard['names']
+        return None
+
+    def heartbeat(self, shard_id: int):
+        try:
+            os.utime(self._claims[shard_id])
+        except (KeyError, FileNotFoundError):
+            pass  # shard is finished, or taken by another worker after a too long pause
+
+    def complete(self, shard_id: int, object_type: str, results: dict):
+        """Store results {name: {metric: result}} of the shard, it's done."""
+        self._write_json(self._path('done', f'{shard_id:06d}.json'), {
+            'id': shard_id, 'object_type': object_type, 'results': list(results.items())})
+        self._release(shard_id)
+
+    def fail(self, shard_id: int, error: str):
+        """Shard is retried by workers until it fails MAX_ATTEMPTS times."""
+        try:
+            shard = self._read_json(self._claims[shard_id])
+        except FileNotFoundError:
+            self._claims.pop(shard_id)
+            return  # taken by another worker
+        shard['error'] = error
+        status = 'pending' if shard['attempts'] < MAX_ATTEMPTS else 'failed'
+        self._write_json(self._path(status, f'{shard_id:06d}.json'), shard)
+        self._release(shard_id)
+
+    def _release(self, shard_id: int):
+        try:
+            os.remove(self._claims.pop(shard_id))
+        except FileNotFoundError:
+            pass
+
+    def get_counts(self) -> dict[str, int]:
+        """Count of shards by status: pending, running, done, failed."""
+        done = {self._get_id(i) for i in self._list('done')}
+        counts = {
+            'pending': len(self._list('pending')),
+            'running': len({self._get_id(i) for i in self._list('running')} - done),
+            'done': len(done),
+            'failed': len(self._list('failed')),
+        }
+        return {status: count for status, count in counts.items() if count}
+
+    def get_results(self) -> dict[str, dict]:
+        """Merged results: {'repo': {name: {metric: result}}, 'team': {...}} in the order of shards."""
+        merged = {'repo': {}, 'team': {}}
+        for name in self._list('done'):
+            shard = self._read_json(self._path('done', name))
+            merged[shard['object_type']].update(shard['results'])
+        return merged
+
+    def get_failed(self) -> list[tuple]:
+        """(id, object type, names, error) of failed shards."""
+        failed = [self._read_json(self._path('failed', i)) for i in self._list('failed')]
+        return [(i['id'], i['object_type'], i['names'], i['error']) for i in failed]
+
+
+def _heartbeats(queue: WorkQueue, shard_id: int, stopped: threading.Event):
+    while not stopped.wait(HEARTBEAT_INTERVAL):
+        queue.heartbeat(shard_id)
+
+
+def run_worker(config: optparse.Values):
+    """Collect shards of the queue until none are left. Query, period and owner are the queue's ones,
+    fetching is configured by worker's options, e.g. its own token."""
+    from github_prospector.MetricsRegistry import registry
+    from github_prospector.QueryRunners import QueryRunner
+    from github_prospector.utils import validate_and_get_repos, validate_and_get_teams
+
+    queue = WorkQueue(getattr(config, 'queue_dir'))
+    options = queue.get_run_options()
+    if not options.get('query'):
+        print(f'Queue is empty: {queue.queue_dir}')
+        return
+    config = optparse.Values(dict(vars(config), **options))
+    worker = f'{socket.gethostname()}-{os.getpid()}'  # part of file names
+    collected = 0
+    while True:
+        shard = queue.claim(worker)
+        if shard is None:
+            break
+        shard_id, object_type, names = shard
+        started = time.time()
+        stopped = threading.Event()
+        threading.Thread(target=_heartbeats, args=(queue, shard_id, stopped), daemon=True).start()
+        try:
+            objects = (validate_and_get_repos if object_type == 'repo' else validate_and_get_teams)(names, config)
+            # checkpoint of the shard in the output directory of worker lets its retry continue from collected
+            # results and pages; it isn't in the queue directory, SQLite isn't safe on network filesystems
+            shard_config = optparse.Values(dict(
+                vars(config), repos=objects if object_type == 'repo' else [], users=[],
+                teams=objects if object_type == 'team' else [], checkpoint=True, resume=True))
+            metric_names = registry.get_names_of_type([i.strip() for i in config.query.split(',')], object_type)
+            runner = QueryRunner(','.join(metric_names), shard_config, verbose=False)
+            runner.run()
+            queue.complete(shard_id, object_type,
+                           runner.repos_results if object_type == 'repo' else runner.teams_results)
+            collected += 1
+            print(f'Shard {shard_id} ({len(names)} {object_type}s) is collected in {time.time() - started:.1f}s')
+        except Exception as e:
+            queue.fail(shard_id, repr(e))
+            print(f'! Shard {shard_id} failed: {e!r}')
+        finally:
+            stopped.set()
+    running = queue.get_counts().get('running')
+    print(f'Worker {worker} is done, shards collected: {collected}' +
+          (f', shards in progress by other workers: {running}' if running else ''))
+
+
+def merge(config: optparse.Values) -> Optional[tuple[dict, dict]]:
+    """Results of all shards as QueryRunner's (repos_results, teams_results), None if shards aren't done."""
+    queue = WorkQueue(getattr(config, 'queue_dir'))
+    counts = queue.get_counts()
+    if counts.get('pending') or counts.get('running'):
+        print(f'Shards are not collected yet: {counts}')
+        return None
+    for shard_id, object_type, names, error in queue.get_failed():
+        print(f'! Shard {shard_id} failed, its {object_type}s are missing: {", ".join(names)}. {error}')
+    results = queue.get_results()
+    return results['repo'], results['team']
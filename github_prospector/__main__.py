@@ -1,15 +1,18 @@
 import os
 from optparse import OptionParser
 
-from github_prospector.QueryRunners import QueryRunner
-from github_prospector.Reporter import ReporterTypes, Reporter
-from github_prospector.utils import (validate_options, validate_and_get_repos, print_all_metrics, print_version,
-                                     parse_date,
-                                     print_rate_limits, validate_and_get_teams)
+from github_prospector.MetricsRegistry import registry
+from github_prospector.Reporter import ReporterTypes, Reporter, StreamingReporter, SqliteReporter, print_history
+from github_prospector.settings import (DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE, DEFAULT_CONCURRENCY,
+                                        DEFAULT_RECONCILE_INTERVAL)
+from github_prospector.Telemetry import telemetry
 
 parser = OptionParser()
 parser.add_option('-t', '--github_token', dest='github_token', default=os.environ.get('auditor_token'),
-                  help="github's token for access to repos.\nCan set by env variable auditor_token")
+                  help="github's token for access to repos, or pool of tokens split by comma, requests are routed "
+                       "to the token with the most remaining rate limit.\nCan set by env variable auditor_token")
+parser.add_option('--api-url', dest='api_url', default=None,
+                  help="github's api url, set it for GitHub Enterprise. DEFAULT: https://api.github.com")
 parser.add_option('-o', '--owner', dest='owner', help='the username that repositories belong')
 parser.add_option('-s', '--start_date', dest='start_date', help='filter metrics by start date')
 parser.add_option('-e', '--end_date', dest='end_date', help='filter metrics by end date')
@@ -18,24 +21,115 @@ parser.add_option('-l', '--metrics-list', dest='only_print_metrics', action='sto
                   help='list of all exising metrics')
 parser.add_option('--out-dir', dest='output_dir', default=os.path.join(os.path.abspath('..'), '../runs'),
                   help=f"directory for storing reports. DEFAULT: {os.path.join(os.path.abspath('..'), '../runs')}")
-parser.add_option('-f', '--format', choices=['json', 'csv', 'print'], dest='reporter_type', default='print',
+parser.add_option('-f', '--format', choices=['json', 'ndjson', 'sqlite', 'csv', 'print'], dest='reporter_type',
+                  default='print',
                   help=f'Type of Reports: {ReporterTypes.get_all_reporters_types()}')
+parser.add_option('--checkpoint', dest='checkpoint', action='store_true', default=False,
+                  help='checkpoint progress of the run in output directory, so it can be continued with --resume if '
+                       'it is interrupted')
+parser.add_option('--resume', dest='resume', action='store_true', default=False,
+                  help='continue interrupted run of the same query from checkpoint in output directory')
 parser.add_option('--one-file', dest='one_file', action='store_true', default=False, help='create one-file report')
 parser.add_option(
     '-V', '--version', dest='only_print_version', action='store_true', default=False, help='prints version')
 parser.add_option('--get-limits', dest='only_print_limits', action='store_true', default=False,
                   help="prints github's rate limits")
 
+parser.add_option('--telemetry-file', dest='telemetry_file', default=None,
+                  help='file for requests of the run per repo/team and metric in Prometheus textfile format')
+
+parser.add_option('--history', dest='history', default=None,
+                  help='prints results of the metric in previous runs stored by sqlite reporter, '
+                       'can be filtered by --repos/--teams')
+parser.add_option('--history-runs', dest='history_runs', type='int', default=90,
+                  help='count of the last runs printed by --history. DEFAULT: 90')
+
+parser.add_option('--serve', dest='serve', action='store_true', default=False,
+                  help='run as a service: results of the query are refreshed on schedule and served over HTTP as JSON')
+parser.add_option('--host', dest='host', default='127.0.0.1', help='host of the service. DEFAULT: 127.0.0.1')
+parser.add_option('--port', dest='port', type='int', default=8080, help='port of the service. DEFAULT: 8080')
+parser.add_option('--refresh-interval', dest='refresh_interval', type='int', default=60,
+                  help='minutes between refreshes of a repo/team by the service, stretched to fit the rate limit. '
+                       'DEFAULT: 60')
+parser.add_option('--webhook-secret', dest='webhook_secret', default=os.environ.get('webhook_secret'),
+                  help="secret of GitHub webhooks received by the service on /webhook.\n"
+                       "Can set by env variable webhook_secret")
+parser.add_option('--replay-events', dest='replay_events', default=None,
+                  help='send recorded webhooks (json per line: {"event", "delivery", "payload"}) to the service '
+                       'on --host/--port')
+
+parser.add_option('--queue-dir', dest='queue_dir', default=None,
+                  help='directory of the work queue shared by workers of processes or hosts, e.g. a network share')
+parser.add_option('--shards', dest='shards', type='int', default=None,
+                  help='split repos/teams of the query into count of shards in the work queue, they are collected by '
+                       '--work and merged into the report by --merge')
+parser.add_option('--work', dest='work', action='store_true', default=False,
+                  help='collect shards of the work queue until all are done')
+parser.add_option('--merge', dest='merge', action='store_true', default=False,
+                  help='create the report from results of all shards of the work queue')
+
 parser.add_option('--repos', dest='repos', default=[], help='list of repos for analysis')
 parser.add_option('--teams', dest='teams', default=[], help='list of teams for analysis')
 parser.add_option('--users', dest='users', default=[], help='list of users for analysis')
+parser.add_option('--workers', dest='workers', type='int', default=1,
+                  help='count of repos/teams collected in parallel. DEFAULT: 1')
+parser.add_option('--engine', choices=['sync', 'async'], dest='engine', default='sync',
+                  help='fetch engine, async one prefetches data of all repos/teams concurrently (requires aiohttp)')
+parser.add_option('--concurrency', dest='concurrency', type='int', default=DEFAULT_CONCURRENCY,
+                  help=f'max requests in flight of async engine. DEFAULT: {DEFAULT_CONCURRENCY}')
+parser.add_option('--cache-dir', dest='cache_dir', default=DEFAULT_CACHE_DIR,
+                  help=f'directory for cached GitHub responses. DEFAULT: {DEFAULT_CACHE_DIR}')
+parser.add_option('--cache-size', dest='cache_size', type='int', default=DEFAULT_CACHE_SIZE,
+                  help=f'max size of cached responses in megabytes. DEFAULT: {DEFAULT_CACHE_SIZE}')
+parser.add_option('--no-cache', dest='no_cache', action='store_true', default=False,
+                  help="don't cache GitHub responses")
+parser.add_option('--incremental', dest='incremental', action='store_true', default=False,
+                  help='fetch only pull requests and issues changed since the previous run, '
+                       'state is stored in cache directory')
+parser.add_option('--events', dest='events', action='store_true', default=False,
+                  help='compute pull requests, issues, reviews, commits and branch protection from the store of '
+                       'webhooks received by the service, state is stored in cache directory')
+parser.add_option('--reconcile-interval', dest='reconcile_interval', type='int', default=DEFAULT_RECONCILE_INTERVAL,
+                  help='hours between polls of data kept by webhooks, for missed ones. DEFAULT: '
+                       f'{DEFAULT_RECONCILE_INTERVAL}')
+parser.add_option('--search', dest='search', action='store_true', default=False,
+                  help='fetch pull requests and issues of the period with search api')
+parser.add_option('--graphql', dest='graphql', action='store_true', default=False,
+                  help='collect count metrics and branch protection with batched GraphQL queries')
+parser.add_option('--contributor-stats', dest='contributor_stats', action='store_true', default=False,
+                  help="count commits per user by repository's contributor statistics, without commits' detail")
+parser.add_option('--branches', dest='branches', default=None,
+                  help='patterns of branches for branch protection metric split by comma, e.g. main,release/*')
+
+
+STREAMING_REPORTERS = {ReporterTypes.NDJSON.value: StreamingReporter, ReporterTypes.SQLITE.value: SqliteReporter}
+
+
+def report(repos_results: dict, teams_results: dict, config):
+    """Report of collected results, e.g. merged from shards."""
+    if getattr(config, 'reporter_type') in STREAMING_REPORTERS:
+        with STREAMING_REPORTERS[getattr(config, 'reporter_type')](config) as reporter:
+            for object_type, results in (('team', teams_results), ('repo', repos_results)):
+                for name, metrics in results.items():
+                    for metric_name, result in metrics.items():
+                        reporter.write(object_type, name, metric_name, result)
+        print(f'Report: {reporter.path}')
+    else:
+        for results in (repos_results, teams_results):
+            Reporter(results, config).run()
 
 
 def main(config):
+    registry.set_cache_dir(getattr(config, 'cache_dir', None) or DEFAULT_CACHE_DIR)
     if getattr(config, 'only_print_metrics'):
-        print_all_metrics()
+        registry.print_all()
         exit(0)
 
+    # importing of PyGithub takes the most of startup, so listing of metrics goes without it
+    from github_prospector.QueryRunners import QueryRunner
+    from github_prospector.utils import (validate_options, validate_and_get_repos, print_version, parse_date,
+                                         print_rate_limits, validate_and_get_teams)
+
     if getattr(config, 'only_print_version'):
         print_version()
         exit(0)
@@ -44,10 +138,39 @@ def main(config):
         print_rate_limits(config)
         exit(0)
 
+    if getattr(config, 'history'):
+        print_history(config, getattr(config, 'history'))
+        exit(0)
+
+    if getattr(config, 'replay_events'):
+        from github_prospector.Webhooks import replay
+        replay(getattr(config, 'replay_events'), f'http://{getattr(config, "host")}:{getattr(config, "port")}/webhook',
+               getattr(config, 'webhook_secret'))
+        exit(0)
+
+    if (getattr(config, 'shards') or getattr(config, 'work') or getattr(config, 'merge')) and \
+            not getattr(config, 'queue_dir'):
+        print('Set --queue-dir of the work queue')
+        exit(1)
+
+    if getattr(config, 'merge'):
+        from github_prospector.WorkQueue import merge
+        results = merge(config)
+        if results is None:
+            exit(1)
+        report(*results, config)
+        exit(0)
+
     if not validate_options(config):
         print('Check arguments and options')
         exit(1)
 
+    if getattr(config, 'work'):
+        from github_prospector.WorkQueue import run_worker
+        run_worker(config)
+        telemetry.print_summary()
+        exit(0)
+
     if getattr(config, 'start_date'):
         dt = getattr(config, 'start_date')
         setattr(config, 'start_date', parse_date(dt))
@@ -76,10 +199,32 @@ def main(config):
         exit(1)
 
     query = getattr(config, 'query')
-    qr = QueryRunner(query, config)
-    qr.run()
-    for results in (qr.repos_results, qr.teams_results, qr.users_results):
-        Reporter(results, config).run()
+    if getattr(config, 'shards'):
+        from github_prospector.WorkQueue import WorkQueue
+        queue = WorkQueue(getattr(config, 'queue_dir'))
+        count = queue.create(config, [i.full_name for i in getattr(config, 'repos') or []],
+                             [i.slug for i in getattr(config, 'teams') or []], getattr(config, 'shards'))
+        print(f'Shards in queue: {count}, {queue.queue_dir}')
+        exit(0)
+
+    if getattr(config, 'serve'):
+        from github_prospector.Service import serve
+        serve(query, config)
+        exit(0)
+
+    if getattr(config, 'reporter_type') in STREAMING_REPORTERS:
+        with STREAMING_REPORTERS[getattr(config, 'reporter_type')](config) as reporter:
+            QueryRunner(query, config, on_result=reporter.write, keep_results=False).run()
+        print(f'Report: {reporter.path}')
+    else:
+        qr = QueryRunner(query, config)
+        qr.run()
+        for results in (qr.repos_results, qr.teams_results, qr.users_results):
+            Reporter(results, config).run()
+    telemetry.print_summary()
+    if getattr(config, 'telemetry_file'):
+        telemetry.write_textfile(getattr(config, 'telemetry_file'))
+        print(f'Telemetry: {getattr(config, "telemetry_file")}')
 
 
 if __name__ == '__main__':
@@ -1,68 +1,74 @@
-import importlib
 import optparse
-import os
+import threading
 import time
 from datetime import datetime
 from enum import Enum
+from typing import Optional, Union
 
-from github import Github
 from github.GithubException import RateLimitExceededException
+from github.NamedUser import NamedUser
 
+from github_prospector.Client import create_github
+from github_prospector.DataCache import DataCache
+from github_prospector.MetricsRegistry import registry
+from github_prospector.QueryPlanner import QueryPlan
+from github_prospector.Telemetry import telemetry
+
+# workers pause together: the first one caught the rate limit waits for reset, others wait for it
+_rate_limit_lock = threading.Lock()
+_rate_limit_resume = threading.Event()
+_rate_limit_resume.set()
 
-DEFAULT_METRICS_DIR = os.path.dirname(os.path.realpath(__file__))
 
 def github_rate_limit_decorator(func):
-    """Decorator checking github limits and can make pause."""
+    """Decorator retrying metric after reset of github limits, if they were exceeded despite pacing of requests."""
 
     def inner(*args, **kwargs):
+        _rate_limit_resume.wait()
         try:
             return func(*args, **kwargs)
         except RateLimitExceededException:
             cls = args[0]  # get metric object for access to config
-            g = Github(getattr(cls.config, 'github_token'))
-            limits = g.get_rate_limit()
-            remains_requests = limits.core.remaining
-            max_requests = limits.core.limit
-            reset_after = (limits.core.reset - datetime.utcnow()).total_seconds()
-            print(f'Rate limit! {remains_requests}/{max_requests}. Auditor needs sleep for {reset_after} seconds')
-            answ = input(f'Do you agree sleep for {reset_after} seconds? [y/N]').strip().upper()
-            if answ == 'Y':
-                reset_after = (limits.core.reset - datetime.utcnow()).total_seconds()
-                if reset_after > 0:
-                    time.sleep(reset_after + 1)
-                return func(*args, **kwargs)
+            with _rate_limit_lock:
+                _rate_limit_resume.clear()
+                try:
+                    _wait_rate_limit_reset(cls.config)
+                finally:
+                    _rate_limit_resume.set()
+            return func(*args, **kwargs)
 
     return inner
 
 
+def data_sources(*sources: str, **alternatives: tuple):
+    """Declares data the metric is computed from: `resource` or `resource:state`, e.g. 'pulls:open'.
+    Alternatives are sources used when an option is set instead: `graphql=('counts',)`.
+    Declarations are read by the registry from the source code, so they must be literals."""
+
+    def decorator(func):
+        func.sources = sources
+        func.alternatives = alternatives
+        return func
+
+    return decorator
+
+
+def _wait_rate_limit_reset(config: optparse.Values):
+    """Sleep until rate limit reset."""
+    g = create_github(config)
+    limits = g.get_rate_limit()
+    if limits.core.remaining > 0:  # limit was already reset while waiting for another worker
+        return
+    reset_after = (limits.core.reset - datetime.utcnow()).total_seconds()
+    if reset_after > 0:
+        print(f'Rate limit! 0/{limits.core.limit}. Auditor sleeps for {int(reset_after) + 1} seconds')
+        time.sleep(reset_after + 1)
+        telemetry.record_sleep(reset_after + 1)
+
+
 def get_all_metrics():
-    """Getting all metrics by getting all properties."""
-    modules = [f'metrics.{i.split(".")[0]}' for i in os.listdir(DEFAULT_METRICS_DIR) if i.endswith('.py')]
-    collected_metrics = {}
-    for module in modules:
-        if module == 'metrics.Base':
-            continue
-        tmp_module = importlib.import_module('github_prospector.' + module)
-        for i in dir(tmp_module):
-            if not i.endswith('Metrics'):
-                continue
-            cls: object = getattr(tmp_module, i)
-            for name in __get_class_properties(cls):
-                collected_metrics.update(
-                    {f'{cls.__name__.lower()}.{name}': {
-                        'class_name': f'{cls.__name__}',
-                        'metric_name': f'{name}',
-                        'module_name': f'{cls.__module__}',
-                        'type': getattr(cls, 'MetricsType')
-
-                    }}
-                )
-    return collected_metrics
-
-
-def __get_class_properties(cls):
-    """Return list of properties' names and endswith _metric."""
-    return [k for k, v in vars(cls).items() if isinstance(v, property) and k.endswith('_metric')]
+    """Getting all metrics from the registry."""
+    return {name: dict(metric, type=MetricsTypes(metric['type'])) for name, metric in registry.get_all().items()}
 
 
 class MetricsTypes(Enum):
@@ -79,6 +85,25 @@ class BaseMetrics:
         self.config = config
         self.period_from = getattr(config, 'start_date', None)
         self.period_to = getattr(config, 'end_date', datetime.now())
+        self.data_cache: DataCache = kwargs.get('data_cache') or DataCache()
+        self.plan: Optional[QueryPlan] = kwargs.get('plan')
+
+    def get_fetch_state(self, resource: str, state: str, repository=None) -> str:
+        """State of resource (of repository) planned to be fetched for all requested metrics, it covers state."""
+        if self.plan is None:
+            return state
+        return self.plan.get_fetch_state(self.MetricsType.value.lower(), resource, state, repository)
+
+    def is_shared(self, resource: str) -> bool:
+        """Resource is read by other requested metrics too, so it's kept in the data cache, otherwise streamed."""
+        return self.plan is None or self.plan.is_shared(self.MetricsType.value.lower(), resource)
+
+    def get_user_name(self, user: Union[NamedUser, str]) -> str:
+        """Name of user by user or login, getting name is a request, so it's done once per run."""
+        if isinstance(user, NamedUser):
+            return self.data_cache.get_or_fetch(f'user:{user.login}', 'name', lambda: user.name)
+        return self.data_cache.get_or_fetch(
+            f'user:{user}', 'name', lambda: create_github(self.config).get_user(user).name)
 
     @property
     def all(self) -> dict:
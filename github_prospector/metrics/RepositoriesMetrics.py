@@ -1,9 +1,23 @@
 import optparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, Optional
 
-from github.Commit import Commit
+from github.Branch import Branch
 from github.Repository import Repository
 
-from github_prospector.metrics.Base import github_rate_limit_decorator, BaseMetrics, MetricsTypes
+from github_prospector.Client import FETCH_CONCURRENCY, AcceptedException, raise_accepted
+from github_prospector.DataSources import get_stored_commits, iter_issues, iter_pulls
+from github_prospector.EventStore import get_stored_items
+from github_prospector.GraphQL import get_repo_counts, get_repo_branch_protection
+from github_prospector.metrics.Base import github_rate_limit_decorator, BaseMetrics, MetricsTypes, data_sources
+from github_prospector.Records import CommitRecord, IssueRecord, PullRequestRecord, iter_raw
+from github_prospector.Telemetry import telemetry
+from github_prospector.utils import get_branch_patterns, match_branch_patterns, GITHUB_DATE_PATTERN
+
+STATS_RETRIES = 5
+STATS_RETRY_DELAY = 3  # seconds
 
 
 class RepoMetrics(BaseMetrics):
@@ -11,95 +25,82 @@ class RepoMetrics(BaseMetrics):
 
     MetricsType = MetricsTypes.REPO
 
-    __prs_list = []
-    __issues_list = []
-
     def __init__(self, config: optparse.Values, repository_data: Repository, *args, **kwargs):
         super().__init__(config, *args, **kwargs)
         self.repository_data = repository_data
 
-    @github_rate_limit_decorator
-    def __get_prs(self):
-        if self.period_to and self.period_from:
-            self.__prs_list = [pr for pr in self.repository_data.get_pulls('*')
-                               if self.period_from <= pr.created_at <= self.period_to]
-
-        elif self.period_from:
-            self.__prs_list = [pr for pr in self.repository_data.get_pulls('*')
-                               if self.period_from <= pr.created_at]
-
-        elif self.period_to:
-            self.__prs_list = [pr for pr in self.repository_data.get_pulls('*')
-                               if self.period_to >= pr.created_at]
-        else:
-            self.__prs_list = [pr for pr in self.repository_data.get_pulls('*')]
+    def __iter_prs(self, state: str) -> Iterable[PullRequestRecord]:
+        return iter_pulls(self.config, self.data_cache, self.repository_data, state, self.period_from, self.period_to,
+                          self.get_fetch_state('pulls', state, self.repository_data), self.is_shared('pulls'))
 
-    @github_rate_limit_decorator
     def get_merged_prs(self):
-        if not self.__prs_list:
-            self.__get_prs()
-        return [pr for pr in self.__prs_list if pr.state == 'merged']
+        return (pr for pr in self.__iter_prs('closed') if pr.merged_at)
 
-    @github_rate_limit_decorator
     def get_opened_prs(self):
-        if not self.__prs_list:
-            self.__get_prs()
-        return [pr for pr in self.__prs_list if pr.state == 'open']
+        return self.__iter_prs('open')
 
-    @github_rate_limit_decorator
     def get_closed_prs(self):
-        if not self.__prs_list:
-            self.__get_prs()
-        return [pr for pr in self.__prs_list if pr.state == 'closed']
+        return self.__iter_prs('closed')
+
+    @github_rate_limit_decorator
+    def __count(self, get_items: Callable[[], Iterable]) -> int:
+        """Count of items, counted as their pages arrive."""
+        return sum(1 for _ in get_items())
 
     @property
+    @data_sources('pulls:closed', graphql=('counts',))
     def closed_pr_metric(self):
         """Count of closed pull requests."""
-        return len(self.get_closed_prs())
+        if getattr(self.config, 'graphql', False):
+            return self.__get_counts().get('closed_prs')
+        return self.__count(self.get_closed_prs)
 
     @property
+    @data_sources('pulls:closed', graphql=('counts',))
     def merged_prs_metric(self):
         """Count of merged pull requests."""
-        return len(self.get_merged_prs())
+        if getattr(self.config, 'graphql', False):
+            return self.__get_counts().get('merged_prs')
+        return self.__count(self.get_merged_prs)
 
     @property
+    @data_sources('pulls:open', graphql=('counts',))
     def opened_prs_metric(self):
         """Count of opened pull requests."""
-        return len(self.get_opened_prs())
+        if getattr(self.config, 'graphql', False):
+            return self.__get_counts().get('open_prs')
+        return self.__count(self.get_opened_prs)
 
     @property
+    @data_sources('issues:open', graphql=('counts',))
     def opened_issues_metric(self):
         """Count of opened issues."""
-        return len(self.get_opened_issues())
+        if getattr(self.config, 'graphql', False):
+            return self.__get_counts().get('open_issues')
+        return self.__count(self.get_opened_issues)
 
     @property
+    @data_sources('issues:closed', graphql=('counts',))
     def closed_issues_metric(self):
         """Count of closed issues."""
-        return len(self.get_closed_issues())
+        if getattr(self.config, 'graphql', False):
+            return self.__get_counts().get('closed_issues')
+        return self.__count(self.get_closed_issues)
 
     @github_rate_limit_decorator
-    def __get_issues(self):
-        if self.period_to and self.period_from:
-            self.__issues_list = [issue for issue in self.repository_data.get_issues()
-                                  if self.period_from <= issue.created_at <= self.period_to]
-        elif self.period_from:
-            self.__issues_list = [issue for issue in self.repository_data.get_issues() if
-                                  self.period_from <= issue.created_at]
-        elif self.period_to:
-            self.__issues_list = [issue for issue in self.repository_data.get_issues() if
-                                  self.period_to >= issue.created_at]
-        else:
-            self.__issues_list = [issue for issue in self.repository_data.get_issues()]
+    def __get_counts(self) -> dict:
+        return get_repo_counts(self.config, self.data_cache, self.repository_data, self.period_from, self.period_to)
+
+    def __iter_issues(self, state: str) -> Iterable[IssueRecord]:
+        return iter_issues(self.config, self.data_cache, self.repository_data, state, self.period_from,
+                           self.period_to, self.get_fetch_state('issues', state, self.repository_data),
+                           self.is_shared('issues'))
 
     def get_opened_issues(self):
-        if not self.__issues_list:
-            self.__get_issues()
-        return [issue for issue in self.__issues_list if issue.state == 'open']
+        return (issue for issue in self.__iter_issues('open') if not issue.is_pull_request)
 
     def get_closed_issues(self):
-        if not self.__issues_list:
-            self.__get_issues()
-        return [issue for issue in self.__issues_list if issue.state == 'closed']
+        return (issue for issue in self.__iter_issues('closed') if not issue.is_pull_request)
 
     def __repr__(self):
         return f'[{self.__class__.__name__}]<{self.repository_data.name}>'
@@ -111,39 +112,71 @@ class RepoCommitMetrics(BaseMetrics):
     def __init__(self, config: optparse.Values, repository_data: Repository, *args, **kwargs):
         super().__init__(config, *args, **kwargs)
         self.repository = repository_data
-        self._commits: list[Commit] = []
 
-    @github_rate_limit_decorator
-    def _get_commits(self) -> list[Commit]:
-        if not self._commits:
-            if self.period_from:
-                self._commits = [i for i in self.repository.get_commits(since=self.period_from)]
-            else:
-                self._commits = [i for i in self.repository.get_commits()]
-        return self._commits
+    def _iter_commits(self) -> Iterable[CommitRecord]:
+        """Commits prefetched into the data cache, otherwise streamed page by page without keeping them."""
+        commits = self.data_cache.get(self.repository, 'commits', self.period_from)
+        if commits is not None:
+            return commits
+        if getattr(self.config, 'events', False):
+            return get_stored_commits(self.config, self.data_cache, self.repository, self.period_from)
+        params = {'since': self.period_from.strftime(GITHUB_DATE_PATTERN)} if self.period_from else {}
+        return (CommitRecord(raw, headers) for raw, headers in iter_raw(
+            self.repository._requester, f'{self.repository.url}/commits', params))
+
+    def _get_author_name(self, login: Optional[str], git_name: str = None) -> str:
+        """Name of GitHub account, or name from git if commit isn't linked to an account."""
+        return (self.get_user_name(login) or login) if login else git_name
 
     @property
+    @data_sources('commits', contributor_stats=('contributor_stats',))
     def commit_per_user_metric(self):
         """Collect commit info per repository."""
+        if getattr(self.config, 'contributor_stats', False):
+            results = self._get_contributor_stats_counts()
+            if results is not None:
+                return results
+        return self._get_commits_per_user()
+
+    @github_rate_limit_decorator
+    def _get_commits_per_user(self) -> dict:
         results = {}
+        for commit in self._iter_commits():
+            user_data = results.setdefault(self._get_author_name(commit.author_login, commit.author_name),
+                                           {'count': 0, 'commits': []})
+            user_data['count'] += 1
+            user_data['commits'].append({commit.sha: {'last_modified': commit.last_modified}})
+        return dict(sorted(results.items(), key=lambda item: item[1]['count'], reverse=True))
 
-        for commit in self._get_commits():
-            name = commit.author.name or commit.author.login
-            _tmp = {
-                'count': 1,
-                'commits': [
-                    {commit.sha: {
-                        'last_modified': commit.last_modified
-                    }}
-                ]
-            }
-            prev_data = results.get(name)
-            if prev_data is not None:
-                _tmp['count'] = prev_data.get('count', 0) + _tmp.get('count', 0)
-                _tmp['commits'] = prev_data.get('commits', []) + _tmp.get('commits', [])
-            results[name] = _tmp
-        results = {k: v for k, v in sorted(results.items(), key=lambda item: item[1].get('count'), reverse=True)}
-        return results
+    @github_rate_limit_decorator
+    def _get_contributor_stats_counts(self) -> Optional[dict]:
+        """Commit counts per user in period from contributor statistics of repository, without commits' detail.
+        GitHub computes statistics in background and answers 202 meanwhile, None is returned if they aren't ready.
+        Statistics contain only the top 100 contributors and are summed by weeks, partial weeks are counted whole."""
+        for attempt in range(STATS_RETRIES):
+            try:
+                with raise_accepted():
+                    _, stats = self.repository._requester.requestJsonAndCheck(
+                        'GET', f'{self.repository.url}/stats/contributors')
+                break
+            except AcceptedException:
+                time.sleep(STATS_RETRY_DELAY)
+        else:
+            print(f'! Contributor statistics of {self.repository.full_name} are not ready, commits are listed')
+            return None
+        results = {}
+        # statistics of a repository without commits are empty
+        for stat in stats or []:
+            count = 0
+            for week in stat['weeks']:
+                start = datetime.utcfromtimestamp(week['w'])
+                if (not self.period_from or start + timedelta(days=7) > self.period_from) and \
+                        (not self.period_to or start <= self.period_to):
+                    count += week['c']
+            if count:
+                name = self._get_author_name(stat['author']['login'] if stat.get('author') else None, 'ghost')
+                results[name] = {'count': results.get(name, {}).get('count', 0) + count}
+        return dict(sorted(results.items(), key=lambda item: item[1]['count'], reverse=True))
 
 
 class RepositoryInfoMetrics(BaseMetrics):
@@ -151,7 +184,7 @@ class RepositoryInfoMetrics(BaseMetrics):
     MetricsType = MetricsTypes.REPO
 
     def __init__(self, config: optparse.Values, repository: Repository, *args, **kwargs):
-        super().__init__(config, *args, *kwargs)
+        super().__init__(config, *args, **kwargs)
         self.repository = repository
 
     @github_rate_limit_decorator
@@ -201,16 +234,38 @@ class RepositoryInfoMetrics(BaseMetrics):
             return branch_data
 
     @property
+    @data_sources('branches', 'branch_protection', graphql=('branch_protection_rules',))
     def get_branch_protection_metric(self):
         """Branch protection of repo."""
-        result = {}
-        for branch in self.repository.get_branches():
-            result.update(
-                {branch.name: self.get_branch_info(branch)}
-            )
-        return result
+        if getattr(self.config, 'graphql', False):
+            return self._get_graphql_branch_protection()
+        patterns = get_branch_patterns(self.config)
+        if getattr(self.config, 'events', False):
+            # protection is polled again only when webhooks tell it or branches changed
+            branches_info = get_stored_items(self.config, self.data_cache, self.repository,
+                                             f'branch_protection:{",".join(patterns)}',
+                                             lambda: self._get_branches_info(patterns))
+            return {info['name']: info for info in branches_info}
+        return {info['name']: info for info in self._get_branches_info(patterns)}
+
+    def _get_branches_info(self, patterns: list[str]) -> list[dict]:
+        branches = [branch for branch in self._get_branches()
+                    if not patterns or match_branch_patterns(branch.name, patterns)]
+        # protection is a request per protected branch, so they are fetched concurrently
+        with ThreadPoolExecutor(max_workers=FETCH_CONCURRENCY) as executor:
+            return list(executor.map(telemetry.bind(self.get_branch_info), branches))
+
+    @github_rate_limit_decorator
+    def _get_branches(self) -> list[Branch]:
+        return self.data_cache.get_or_fetch(self.repository, 'branches',
+                                            lambda: [i for i in self.repository.get_branches()])
+
+    @github_rate_limit_decorator
+    def _get_graphql_branch_protection(self):
+        return get_repo_branch_protection(self.config, self.data_cache, self.repository)
 
     @property
+    @data_sources()
     def get_default_branch_metric(self):
         """Get Default branch."""
         return self.repository.default_branch
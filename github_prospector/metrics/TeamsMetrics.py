@@ -1,12 +1,19 @@
 import optparse
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from itertools import chain
+from typing import Iterator
 
 from github.NamedUser import NamedUser
-from github.PullRequest import PullRequest
 from github.Repository import Repository
 from github.Team import Team
 
-from github_prospector.metrics.Base import BaseMetrics, MetricsTypes, github_rate_limit_decorator
+from github_prospector.Client import FETCH_CONCURRENCY
+from github_prospector.DataSources import get_pulls, get_reviews
+from github_prospector.GraphQL import get_open_prs_reviews
+from github_prospector.metrics.Base import BaseMetrics, MetricsTypes, data_sources, github_rate_limit_decorator
+from github_prospector.Records import PullRequestRecord
+from github_prospector.Telemetry import telemetry
 
 
 class TeamMetrics(BaseMetrics):
@@ -17,29 +24,27 @@ class TeamMetrics(BaseMetrics):
         self.team = team
         self.members: list[NamedUser] = []
         self.repos: list[Repository] = []
-        self.prs: dict[str, list[PullRequest]] = {}
+        self.prs: dict[str, list[PullRequestRecord]] = {}
 
-    def _get_prs_only(self):
+    def _get_prs_only(self) -> Iterator[PullRequestRecord]:
         if not self.prs:
             self._get_team_prs()
-        res = []
-        for pr_list in self.prs.values():
-            res.extend(pr_list)
-        return res
+        return chain.from_iterable(self.prs.values())
 
     @property
     def team_open_prs_count(self):
         """Open pull requests by team."""
-        return len([pr for pr in self._get_prs_only() if pr.state == 'open'])
+        return sum(1 for pr in self._get_prs_only() if pr.state == 'open')
 
     @property
+    @data_sources('repos', 'pulls:open')
     def expired_open_prs_metric(self):
         """Expired Opened Pull Requests (more than 3 days)."""
         if not self.prs:
             self.prs = self._get_team_prs()
         results = {}
         for team_name, prs_data in self.prs.items():
-            prs_data: list[PullRequest]
+            prs_data: list[PullRequestRecord]
             _tmp = {}
             for pr in prs_data:
                 exists_for = (datetime.now() - pr.created_at).days
@@ -53,22 +58,27 @@ class TeamMetrics(BaseMetrics):
         return results
 
     @property
+    @data_sources('repos', 'pulls:open', 'reviews')
     def open_pr_metric(self):
         """Open Pull Requests Info."""
         if not self.prs:
             self.prs = self._get_team_prs()
+        repos = {repo.name: repo for repo in self._get_team_repos()}
         results = {}
         for team_name, prs_data in self.prs.items():
-            prs_data: list[PullRequest]
+            prs_data: list[PullRequestRecord]
+            prs_reviews = self._get_prs_reviews(repos[team_name], prs_data)
             _tmp = {}
             for pr in prs_data:
+                pr_reviews = prs_reviews.get(pr.number) or self._fetch_pr_reviews(pr, repos[team_name])
+                author_name, author_login = pr_reviews['author']
                 _tmp['id'] = pr.id
                 _tmp['title'] = pr.title
                 _tmp['url'] = pr.html_url
-                _tmp['author'] = f'{pr.user.name} | @{pr.user.login}'
+                _tmp['author'] = f'{author_name} | @{author_login}'
                 _tmp['reviewers'] = {
-                    rev.user.name or rev.user.login: {'submitted_at': rev.submitted_at.isoformat(), 'state': rev.state}
-                    for rev in pr.get_reviews()}
+                    name or login: {'submitted_at': submitted_at.isoformat() if submitted_at else None, 'state': state}
+                    for name, login, submitted_at, state in pr_reviews['reviews']}
                 _tmp['created_at'] = pr.created_at.isoformat()
                 _tmp['updated_at'] = pr.updated_at.isoformat()
                 _tmp['exists_for'] = f'{(datetime.now() - pr.created_at).days} days'
@@ -81,39 +91,57 @@ class TeamMetrics(BaseMetrics):
         return results
 
     @property
+    @data_sources('members')
     def team_members_count_metric(self):
         """Get count team members."""
         return self._get_team_members().totalCount
 
     @property
+    @data_sources('repos', 'pulls:open')
     def team_open_prs_count_metric(self):
         """Get count of opened pull requests."""
-        return len([i for i in self._get_prs_only() if i.state == 'open'])
+        return sum(1 for i in self._get_prs_only() if i.state == 'open')
+
+    @github_rate_limit_decorator
+    def _get_prs_reviews(self, repo: Repository, prs: list[PullRequestRecord]) -> dict:
+        """Authors and reviews of pull requests: {number: {'author': (name, login), 'reviews': [...]}}."""
+        if getattr(self.config, 'graphql', False):
+            return get_open_prs_reviews(self.config, self.data_cache, repo)
+        # reviews are a request per pull request, so they are fetched concurrently
+        with ThreadPoolExecutor(max_workers=FETCH_CONCURRENCY) as executor:
+            return dict(zip([pr.number for pr in prs], executor.map(
+                telemetry.bind(self._fetch_pr_reviews), prs, [repo] * len(prs))))
+
+    def _fetch_pr_reviews(self, pr: PullRequestRecord, repo: Repository) -> dict:
+        def fetch():
+            reviews = get_reviews(self.config, self.data_cache, repo, pr)
+            return {
+                'author': self._get_user(pr.user_login),
+                'reviews': [(*self._get_user(rev.user_login), rev.submitted_at, rev.state) for rev in reviews],
+            }
+
+        return self.data_cache.get_or_fetch(pr, 'reviews', fetch)
+
+    def _get_user(self, login: str) -> tuple:
+        """(name, login) of user, deleted users are ghosts."""
+        return (self.get_user_name(login), login) if login else (None, 'ghost')
 
     @github_rate_limit_decorator
     def _get_team_members(self):
-        return self.team.get_members()
+        return self.data_cache.get_or_fetch(self.team, 'members', self.team.get_members)
 
     @github_rate_limit_decorator
     def _get_team_repos(self) -> list[Repository]:
         if not self.repos:
-            self.repos = self.team.get_repos()
+            self.repos = self.data_cache.get_or_fetch(self.team, 'repos', lambda: [i for i in self.team.get_repos()])
         return self.repos
 
     @github_rate_limit_decorator
     def _get_team_prs(self):
         if not self.prs:
-            _prs = {}
-            for repo in self._get_team_repos():
-                _tmp = repo.get_pulls()
-                if self.period_to and self.period_from:
-                    _tmp = [i for i in filter(
-                        lambda x: self.period_to <= x.created_at <= self.period_from,
-                        _tmp)]
-                elif self.period_from:
-                    _tmp = [i for i in filter(lambda x: x.created_at >= self.period_from, _tmp)]
-                elif self.period_to:
-                    _tmp = [i for i in filter(lambda x: x.created_at <= self.period_to, _tmp)]
-                _prs[repo.name] = [i for i in _tmp]
-            self.prs = _prs
+            self.prs = {
+                repo.name: get_pulls(self.config, self.data_cache, repo, 'open', self.period_from, self.period_to,
+                                     self.get_fetch_state('pulls', 'open', repo))
+                for repo in self._get_team_repos()
+            }
         return self.prs
@@ -1,5 +1,54 @@
-from github_prospector.metrics.Base import BaseMetrics, MetricsTypes
+import optparse
+from statistics import median
+
+from github_prospector.metrics.Base import BaseMetrics, MetricsTypes, data_sources
+from github_prospector.UserIndex import UserActivity, UserIndex
 
 
 class UserMetrics(BaseMetrics):
+    """Activity of user in repos of the run, computed from the user index built while repos are collected."""
+
     MetricsType = MetricsTypes.USER
+
+    def __init__(self, config: optparse.Values, login: str, *args, **kwargs):
+        super().__init__(config, *args, **kwargs)
+        self.login = login
+        self.user_index: UserIndex = kwargs.get('user_index') or UserIndex()
+
+    def _get_activity(self) -> UserActivity:
+        return self.user_index.get(self.login)
+
+    @property
+    @data_sources('pulls:all')
+    def prs_authored_metric(self):
+        """Count of pull requests authored by user."""
+        return self._get_activity().prs_authored
+
+    @property
+    @data_sources('pulls:all')
+    def prs_merged_metric(self):
+        """Count of merged pull requests authored by user."""
+        return self._get_activity().prs_merged
+
+    @property
+    @data_sources('pulls:all', 'reviews')
+    def reviews_given_metric(self):
+        """Reviews given by user to pull requests of others: count of reviews and of reviewed pull requests."""
+        activity = self._get_activity()
+        return {'reviews': activity.reviews_given, 'prs': activity.reviewed_prs}
+
+    @property
+    @data_sources('commits')
+    def commits_metric(self):
+        """Count of commits authored by user in default branches."""
+        return self._get_activity().commits
+
+    @property
+    @data_sources('pulls:all', 'reviews')
+    def review_latency_metric(self):
+        """Median hours from creation of pull request to the first review of user."""
+        latencies = self._get_activity().review_latencies
+        return round(median(latencies), 1) if latencies else None
+
+    def __repr__(self):
+        return f'[{self.__class__.__name__}]<{self.login}>'
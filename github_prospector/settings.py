@@ -0,0 +1,7 @@
+import os
+
+# defaults of cli options, kept apart from modules importing PyGithub/aiohttp so the cli starts fast
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'github_prospector')
+DEFAULT_CACHE_SIZE = 512  # megabytes
+DEFAULT_CONCURRENCY = 32  # requests in flight of async engine
+DEFAULT_RECONCILE_INTERVAL = 24  # hours between polls of resources kept up to date by webhooks
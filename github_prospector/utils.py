@@ -1,16 +1,19 @@
-import importlib
 import optparse
 import os
+import re
 from datetime import datetime
-from typing import Iterable
+from typing import Iterable, Iterator
 
-from github import Github  # install PyGithub
 from github.GithubException import UnknownObjectException
 
+from github_prospector.Client import create_github
+from github_prospector.RateLimiter import get_tokens
 from github_prospector.__version__ import __version__
-from github_prospector.metrics.Base import __get_class_properties
 
 DATE_PATTERN = "%m-%d-%Y"
+GITHUB_DATE_PATTERN = '%Y-%m-%dT%H:%M:%SZ'
+SEARCH_DATE_PATTERN = '%Y-%m-%dT%H:%M:%S'
+SEARCH_RESULTS_LIMIT = 1000  # github's search api doesn't return more results
 
 BASE_DIR = os.path.dirname(os.path.realpath(__file__))
 
@@ -19,12 +22,20 @@ def print_version():
 
 
 def print_rate_limits(config):
-    g = Github(config.github_token)
-    limits = g.get_rate_limit()
-    remains_requests = limits.core.remaining
-    max_requests = limits.core.limit
-    reset_after = (limits.core.reset - datetime.utcnow()).total_seconds()
-    print(f'Rate limits:{remains_requests}/{max_requests}. For renew: {reset_after} seconds')
+    tokens = get_tokens(getattr(config, 'github_token'))
+    remains_total, max_total = 0, 0
+    for token in tokens:
+        g = create_github(optparse.Values(dict(vars(config), github_token=token)))
+        limits = g.get_rate_limit()
+        remains_requests = limits.core.remaining
+        max_requests = limits.core.limit
+        reset_after = (limits.core.reset - datetime.utcnow()).total_seconds()
+        remains_total += remains_requests
+        max_total += max_requests
+        name = f'Token ...{token[-4:]} rate limits' if len(tokens) > 1 else 'Rate limits'
+        print(f'{name}:{remains_requests}/{max_requests}. For renew: {reset_after} seconds')
+    if len(tokens) > 1:
+        print(f'Pooled rate limits of {len(tokens)} tokens:{remains_total}/{max_total}')
 
 
 def validate_options(opt: optparse.Values):
@@ -54,33 +65,13 @@ def parse_date(s):
     return datetime.strptime(s, DATE_PATTERN)
 
 
-def print_all_metrics():
-    print("All existing metrics: ")
-    modules = [
-        f'metrics.{i.split(".")[0]}' for i in os.listdir(os.path.join(
-            BASE_DIR, 'metrics'
-        )) if i.endswith('.py')
-    ]
-    for module in modules:
-        if module == 'metrics.Base':
-            continue
-        tmp_module = importlib.import_module('github_prospector.' + module)
-        for i in dir(tmp_module):
-            if not i.endswith('Metrics'):
-                continue
-            cls: object = getattr(tmp_module, i)
-            for name in __get_class_properties(cls):
-                if cls:
-                    print(f'{cls.__name__.lower()}.{name}', f'Desc: {getattr(cls, name).__doc__}')
-
-
 def validate_and_get_repos(repos: list[str], config: optparse.Values):
     validated_repos = []
     owner = getattr(config, 'owner')
     if 'all' in repos or 'ALL' in repos:
         if owner:
             return [
-                i for i in Github(getattr(config, 'github_token')).get_organization(owner).get_repos()
+                i for i in create_github(config).get_organization(owner).get_repos()
             ]
         else:
             print('You need set owner before using all')
@@ -98,7 +89,7 @@ def validate_and_get_repos(repos: list[str], config: optparse.Values):
         else:
             validated_repos.append(repo_name)
 
-    g = Github(getattr(config, 'github_token'))
+    g = create_github(config)
     for repo in validated_repos:
         instances.append(g.get_repo(repo))
     return instances
@@ -115,13 +106,68 @@ def filter_between(_iter: Iterable[object], value: str, less_than=None, more_tha
         return filter(lambda x: x, _iter)
 
 
+def take_created_between(_iter: Iterable[object], period_from=None, period_to=None) -> Iterator[object]:
+    """Filter items ordered by `created_at` descending.
+    Stops iteration (and fetching of next pages) on the first item created before period_from."""
+    for item in _iter:
+        if period_from and item.created_at < period_from:
+            break
+        if period_to and item.created_at > period_to:
+            continue
+        yield item
+
+
+def get_created_qualifier(period_from=None, period_to=None) -> str:
+    """Search api qualifier of creation period."""
+    if period_from and period_to:
+        return f'created:{period_from.strftime(SEARCH_DATE_PATTERN)}..{period_to.strftime(SEARCH_DATE_PATTERN)}'
+    elif period_from:
+        return f'created:>={period_from.strftime(SEARCH_DATE_PATTERN)}'
+    elif period_to:
+        return f'created:<={period_to.strftime(SEARCH_DATE_PATTERN)}'
+    return ''
+
+
+def branch_pattern_to_regex(pattern: str) -> re.Pattern:
+    """Translate branch protection pattern (fnmatch syntax, `*` doesn't match `/`, `**` does) to regex."""
+    regex = ''
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**', i):
+            regex += '.*'
+            i += 2
+            continue
+        char = pattern[i]
+        if char == '*':
+            regex += '[^/]*'
+        elif char == '?':
+            regex += '[^/]'
+        elif char == '[' and pattern.find(']', i + 1) != -1:
+            end = pattern.find(']', i + 1)
+            regex += '[' + pattern[i + 1:end].replace('!', '^', 1) + ']'
+            i = end
+        else:
+            regex += re.escape(char)
+        i += 1
+    return re.compile(regex + r'\Z')
+
+
+def match_branch_patterns(name: str, patterns: Iterable[str]) -> bool:
+    return any(branch_pattern_to_regex(pattern).match(name) for pattern in patterns)
+
+
+def get_branch_patterns(config: optparse.Values) -> list[str]:
+    """Patterns of branches set in cli, empty list means all branches."""
+    return [i.strip() for i in (getattr(config, 'branches', None) or '').split(',') if i.strip()]
+
+
 def validate_and_get_teams(teams: list[str], config: optparse.Values):
     owner = getattr(config, 'owner')
     if not owner:
         print('Please set -o argument with owner')
         exit(1)
 
-    g = Github(getattr(config, 'github_token'))
+    g = create_github(config)
     org = g.get_organization(owner)
 
     if 'all' in teams or 'ALL' in teams:
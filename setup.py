@@ -10,5 +10,6 @@ setup(
     author='Maxim Kuznetsov',
     author_email='maksim.kuznetsov@akvelon.com',
     description='CLII analytic tool for GitHub\'s teams, repositories, users.',
-    install_requires=['PyGithub==1.55']
+    install_requires=['PyGithub==1.55'],
+    extras_require={'async': ['aiohttp'], 'ndjson': ['orjson']},
 )
@@ -0,0 +1,164 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from github.GithubException import GithubException
+
+from benchmarks.FakeGitHub import FakeGitHub, SyntheticOrg
+from github_prospector import RateLimiter
+from github_prospector.__main__ import parser
+from github_prospector.Client import PooledConnection, create_github
+from github_prospector.HttpCache import HttpCache
+from github_prospector.QueryRunners import QueryRunner
+from github_prospector.Telemetry import telemetry
+from github_prospector.utils import parse_date
+
+pytest.importorskip('aiohttp')
+from github_prospector.AsyncEngine import AsyncFetcher  # noqa: E402
+
+PRS = 250  # 3 pages
+
+
+@pytest.fixture(scope='module')
+def server():
+    server = FakeGitHub(SyntheticOrg(repos=3, teams=2, users=6, prs=PRS, issues=120, commits=150),
+                        rate_limit=10 ** 7).start()
+    yield server
+    server.stop()
+
+
+def make_config(api_url: str, token: str = 'test', **options):
+    config = parser.get_default_values()
+    for key, value in dict(options, github_token=token, api_url=api_url, no_cache=True).items():
+        setattr(config, key, value)
+    return config
+
+
+def fetch_all(config, url: str, params: dict = None, stop=None) -> tuple[list, int]:
+    async def run():
+        async with AsyncFetcher(config) as fetcher:
+            return await fetcher.get_all(url, params, stop), fetcher.requests_count
+    return asyncio.run(run())
+
+
+def test_pages_are_fetched_by_last_page(server):
+    server.reset()
+    items, requests_count = fetch_all(make_config(server.url), f'{server.url}/repos/acme/repo0/pulls',
+                                      {'state': 'all', 'sort': 'created', 'direction': 'desc'})
+    assert [item['number'] for item, _ in items] == list(range(PRS, 0, -1))
+    assert requests_count == server.get_counters()['requests'] == 3
+
+
+def test_listing_stops_on_first_stop_item(server):
+    url = f'{server.url}/repos/acme/repo0/pulls'
+    params = {'state': 'all', 'sort': 'created', 'direction': 'desc'}
+    items, requests_count = fetch_all(make_config(server.url), url, params, lambda item: item['number'] < 200)
+    assert [item['number'] for item, _ in items] == list(range(PRS, 199, -1))
+    assert requests_count == 1
+    # the stop item is on the second page, the third one isn't fetched
+    items, requests_count = fetch_all(make_config(server.url), url, params, lambda item: item['number'] < 120)
+    assert len(items) == PRS - 119
+    assert requests_count == 2
+
+
+def test_cached_pages_are_revalidated(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(PooledConnection, 'http_cache', HttpCache(str(tmp_path), 10 * 1024 * 1024))
+    url = f'{server.url}/repos/acme/repo1/pulls'
+    params = {'state': 'all', 'sort': 'created', 'direction': 'desc'}
+    first, _ = fetch_all(make_config(server.url), url, params)
+    server.reset()
+    second, requests_count = fetch_all(make_config(server.url), url, params)
+    assert [item for item, _ in second] == [item for item, _ in first]
+    assert server.get_counters()['not_modified'] == requests_count == 3
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers every GET with the next scripted (status, headers, body) of the server."""
+
+    server: 'StubServer'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        status, headers, body = self.server.responses.pop(0)
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, responses: list[tuple]):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.responses = responses
+        self.url = f'http://127.0.0.1:{self.server_address[1]}'
+
+
+@pytest.fixture
+def stub():
+    server = StubServer([])
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_rate_limited_requests_are_retried(stub, monkeypatch):
+    monkeypatch.setattr(RateLimiter.random, 'uniform', lambda a, b: 0)
+    limits = {'X-RateLimit-Limit': '5000', 'X-RateLimit-Remaining': '4000', 'X-RateLimit-Reset': '0'}
+    stub.responses.extend([
+        (429, {'Retry-After': '0'}, {'message': 'Too many requests'}),
+        (403, {'Retry-After': '0'}, {'message': 'You have exceeded a secondary rate limit'}),
+        (403, dict(limits, **{'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': str(int(time.time()) - 1)}),
+         {'message': 'API rate limit exceeded'}),
+        (200, limits, [{'id': 1}]),
+    ])
+    items, requests_count = fetch_all(make_config(stub.url, token='retried'), f'{stub.url}/repos/acme/repo0/pulls')
+    assert [item for item, _ in items] == [{'id': 1}]
+    assert requests_count == 4
+
+
+def test_forbidden_request_isnt_retried(stub):
+    stub.responses.append((403, {}, {'message': 'Resource not accessible by integration'}))
+    with pytest.raises(GithubException) as e:
+        fetch_all(make_config(stub.url, token='forbidden'), f'{stub.url}/repos/acme/repo0/pulls')
+    assert e.value.status == 403
+    assert not stub.responses
+
+
+@pytest.mark.parametrize('start_date', [None, '01-20-2022'])
+@pytest.mark.parametrize('query', [
+    'repometrics.opened_prs_metric,repometrics.closed_pr_metric,repometrics.merged_prs_metric,'
+    'repometrics.opened_issues_metric,repometrics.closed_issues_metric,teammetrics.team_open_prs_count_metric,'
+    'usermetrics.prs_authored_metric,usermetrics.commits_metric',
+    # closed pull requests of repo0 for the repo and open ones for its team are one listing
+    'repometrics.closed_pr_metric,teammetrics.team_open_prs_count_metric',
+])
+def test_prefetched_data_is_read_by_metrics(server, query, start_date):
+    """Metrics of the async engine send no requests of their own: data they read is in the data cache
+    under the keys prefetching filled, and results are the ones of the sync engine."""
+    results = []
+    for engine in ('sync', 'async'):
+        config = make_config(server.url, engine=engine, start_date=start_date and parse_date(start_date),
+                             users=['user0', 'user1'])
+        github = create_github(config)
+        config.repos = [github.get_repo('acme/repo0'), github.get_repo('acme/repo1')]
+        config.teams = [github.get_organization('acme').get_team_by_slug('team0')]
+        telemetry.reset()
+        runner = QueryRunner(query, config, verbose=False)
+        runner.run()
+        results.append((runner.repos_results, runner.teams_results, runner.users_results))
+    requests = {(object_type, name, metric): stats.requests
+                for (object_type, name, metric), stats in telemetry.get_all().items() if stats.requests}
+    # listing of team's repos is read before prefetching, to plan the state of their pull requests
+    assert all(metric.startswith('prefetch:') or metric == 'repos' for _, _, metric in requests), requests
+    assert results[0] == results[1]
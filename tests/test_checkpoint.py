@@ -0,0 +1,54 @@
+import json
+import optparse
+import subprocess
+import sys
+
+import pytest
+
+from github_prospector.Checkpoint import Checkpoint, CheckpointLocked
+from github_prospector.Reporter import StreamingReporter
+
+
+def test_checkpoints_of_queries_are_separate(tmp_path):
+    first = Checkpoint(str(tmp_path), 'first')
+    first.add_result('repo', 'repo0', 'repometrics.closed_pr_metric', 1)
+    second = Checkpoint(str(tmp_path), 'second')
+    second.complete()
+    first.close()
+    resumed = Checkpoint(str(tmp_path), 'first', resume=True)
+    assert resumed.resumed
+    assert resumed.get_result('repo', 'repo0', 'repometrics.closed_pr_metric') == 1
+    resumed.complete()
+    assert not list(tmp_path.iterdir())
+
+
+def test_checkpoint_is_locked_by_its_run(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path), 'query')
+    # the lock is of the file, so it's taken by another process
+    code = ('import sys\nfrom github_prospector.Checkpoint import Checkpoint, CheckpointLocked\n'
+            'try:\n    Checkpoint(sys.argv[1], "query")\nexcept CheckpointLocked:\n    sys.exit(3)\n')
+    assert subprocess.run([sys.executable, '-c', code, str(tmp_path)]).returncode == 3
+    checkpoint.close()
+    assert subprocess.run([sys.executable, '-c', code, str(tmp_path)]).returncode == 0
+
+
+def test_checkpoint_locked_in_process(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path), 'query')
+    with pytest.raises(CheckpointLocked):
+        Checkpoint(str(tmp_path), 'query')
+    checkpoint.close()
+
+
+def test_resumed_ndjson_report_gets_missing_results(tmp_path):
+    config = optparse.Values({'output_dir': str(tmp_path), 'resume': False})
+    with StreamingReporter(config) as reporter:
+        reporter.write('repo', 'repo0', 'repometrics.closed_pr_metric', 1)
+    with open(reporter.path, 'ab') as f:
+        f.write(b'{"type":"repo","name":"repo1"')  # killed while writing
+    config.resume = True
+    with StreamingReporter(config) as reporter:
+        reporter.write('repo', 'repo0', 'repometrics.closed_pr_metric', 1)
+        reporter.write('repo', 'repo1', 'repometrics.closed_pr_metric', 2)
+    with open(reporter.path) as f:
+        lines = f.read().splitlines()
+    assert [json.loads(i)['name'] for i in lines if i.endswith('}')] == ['repo0', 'repo1']
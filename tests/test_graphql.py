@@ -0,0 +1,139 @@
+import json
+import optparse
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+from github.GithubException import GithubException, RateLimitExceededException
+
+from github_prospector.GraphQL import (GraphQLClient, REPO_COUNTS_FIELDS, REPO_COUNTS_SEARCH_QUALIFIERS,
+                                       _build_counts_query, fetch_repos_counts)
+
+REPOS = [SimpleNamespace(full_name='acme/repo0'), SimpleNamespace(full_name='acme/repo1')]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers every POST with the next canned (status, body) of the server and records the request."""
+
+    server: 'StubGraphQL'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.requests.append({'path': self.path, 'headers': dict(self.headers), 'body': json.loads(body)})
+        status, response = self.server.responses.pop(0)
+        data = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class StubGraphQL(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.responses: list[tuple[int, dict]] = []
+        self.requests: list[dict] = []
+
+    def answer(self, *responses: dict, status: int = 200):
+        self.responses.extend((status, i) for i in responses)
+
+
+@pytest.fixture
+def stub():
+    server = StubGraphQL()
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_config(stub: StubGraphQL, path: str = '') -> optparse.Values:
+    return optparse.Values({'github_token': 'token', 'api_url': f'http://127.0.0.1:{stub.server_address[1]}{path}',
+                            'no_cache': True})
+
+
+def counts(value: int) -> dict:
+    return {field: {'totalCount': value} for field in REPO_COUNTS_FIELDS}
+
+
+def test_counts_query_of_repositories():
+    query = _build_counts_query(REPOS)
+    assert query.startswith('query { r0: repository(owner: "acme", name: "repo0") { open_prs: pullRequests')
+    assert 'r1: repository(owner: "acme", name: "repo1")' in query
+    assert query.count('totalCount') == 2 * len(REPO_COUNTS_FIELDS)
+    assert 'search(' not in query
+
+
+def test_counts_query_of_period_searches():
+    query = _build_counts_query(REPOS, datetime(2022, 1, 1), datetime(2022, 2, 1))
+    assert 'repository(' not in query
+    assert query.count('issueCount') == 2 * len(REPO_COUNTS_SEARCH_QUALIFIERS)
+    assert 'r1_merged_prs: search(type: ISSUE, query: "repo:acme/repo1 is:pr is:merged ' \
+           'created:2022-01-01T00:00:00..2022-02-01T00:00:00") { issueCount }' in query
+
+
+def test_counts_of_repositories(stub):
+    stub.answer({'data': {'r0': counts(3), 'r1': counts(5)}})
+    assert fetch_repos_counts(make_config(stub), REPOS) == {
+        'acme/repo0': dict.fromkeys(REPO_COUNTS_FIELDS, 3), 'acme/repo1': dict.fromkeys(REPO_COUNTS_FIELDS, 5)}
+    request = stub.requests[0]
+    assert request['path'] == '/graphql'
+    assert request['headers']['Authorization'] == 'bearer token'
+    assert request['body']['query'] == _build_counts_query(REPOS)
+
+
+def test_not_found_repository_is_skipped(stub):
+    stub.answer({'data': {'r0': counts(3), 'r1': None},
+                 'errors': [{'type': 'NOT_FOUND', 'path': ['r1'], 'message': 'Could not resolve to a Repository'}]})
+    assert fetch_repos_counts(make_config(stub), REPOS) == {'acme/repo0': dict.fromkeys(REPO_COUNTS_FIELDS, 3)}
+
+
+def test_counts_of_period(stub):
+    data = {f'r{i}_{field}': {'issueCount': i * 10 + n}
+            for i in range(len(REPOS)) for n, field in enumerate(REPO_COUNTS_SEARCH_QUALIFIERS)}
+    stub.answer({'data': data})
+    results = fetch_repos_counts(make_config(stub), REPOS, datetime(2022, 1, 1))
+    assert results['acme/repo0'] == {field: n for n, field in enumerate(REPO_COUNTS_SEARCH_QUALIFIERS)}
+    assert results['acme/repo1']['open_prs'] == 10
+    assert 'created:>=2022-01-01T00:00:00' in stub.requests[0]['body']['query']
+
+
+def test_enterprise_graphql_url(stub):
+    stub.answer({'data': {'viewer': {'login': 'user'}}})
+    assert GraphQLClient(make_config(stub, '/api/v3')).query('query { viewer { login } }') == {
+        'viewer': {'login': 'user'}}
+    assert stub.requests[0]['path'] == '/api/graphql'
+
+
+def test_variables_are_sent(stub):
+    stub.answer({'data': {'repository': None}})
+    GraphQLClient(make_config(stub)).query('query ($owner: String!) { x }', {'owner': 'acme'})
+    assert stub.requests[0]['body']['variables'] == {'owner': 'acme'}
+
+
+def test_rate_limited_query(stub):
+    stub.answer({'data': None, 'errors': [{'type': 'RATE_LIMITED', 'message': 'API rate limit exceeded'}]})
+    with pytest.raises(RateLimitExceededException):
+        GraphQLClient(make_config(stub)).query('query { x }')
+
+
+@pytest.mark.parametrize('status, response', [
+    (200, {'data': {'r0': None}, 'errors': [{'type': 'FORBIDDEN', 'message': 'Resource not accessible'}]}),
+    (200, {'data': None, 'errors': [{'type': 'NOT_FOUND', 'message': 'Not found'}]}),
+    (200, {'errors': [{'message': 'Parse error on "}"'}]}),
+    (401, {'message': 'Bad credentials'}),
+    (502, {}),
+])
+def test_failed_query(stub, status, response):
+    stub.answer(response, status=status)
+    with pytest.raises(GithubException) as e:
+        GraphQLClient(make_config(stub)).query('query { x }')
+    assert e.value.status == status
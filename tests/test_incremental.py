@@ -0,0 +1,39 @@
+import pytest
+
+from benchmarks.FakeGitHub import FakeGitHub, SyntheticOrg
+from github_prospector.__main__ import parser
+from github_prospector.Client import create_github
+from github_prospector.QueryRunners import QueryRunner
+
+QUERY = ('repometrics.opened_prs_metric,repometrics.closed_pr_metric,repometrics.opened_issues_metric,'
+         'teammetrics.open_pr_metric,teammetrics.expired_open_prs_metric')
+
+
+@pytest.fixture(scope='module')
+def server():
+    # pull requests and issues of a repo are several pages
+    server = FakeGitHub(SyntheticOrg(repos=2, teams=1, prs=250, issues=150, commits=10), rate_limit=10 ** 7).start()
+    yield server
+    server.stop()
+
+
+def collect(server: FakeGitHub, **options) -> tuple[dict, dict]:
+    config = parser.get_default_values()
+    for key, value in dict(options, github_token='test', api_url=server.url, no_cache=True).items():
+        setattr(config, key, value)
+    github = create_github(config)
+    config.repos = [github.get_repo('acme/repo0')]
+    config.teams = [github.get_organization('acme').get_team_by_slug('team0')]
+    runner = QueryRunner(QUERY, config, verbose=False)
+    runner.run()
+    return runner.repos_results, runner.teams_results
+
+
+@pytest.mark.parametrize('engine', ['sync', 'async'])
+def test_incremental_results_are_of_listings(server, tmp_path, engine):
+    if engine == 'async':
+        pytest.importorskip('aiohttp')
+    expected = collect(server)
+    # the first run stores all items, the next one merges changes into the store
+    for _ in range(2):
+        assert collect(server, engine=engine, incremental=True, cache_dir=str(tmp_path)) == expected
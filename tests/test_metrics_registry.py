@@ -0,0 +1,45 @@
+import os
+import textwrap
+
+from github_prospector.metrics import RepositoriesMetrics
+from github_prospector.MetricsRegistry import MetricsRegistry, parse_metrics_module
+
+MODULE = '''
+from github_prospector.metrics.RepositoriesMetrics import RepoMetrics as Repo
+
+
+class CustomMetrics(Repo):
+    @property
+    def custom_metric(self):
+        return 1
+
+
+class DerivedMetrics(CustomMetrics):
+    @property
+    def derived_metric(self):
+        return 2
+
+
+class PlainMetrics:
+    @property
+    def plain_metric(self):
+        return 3
+'''
+
+
+def test_metrics_type_is_inherited(tmp_path):
+    path = tmp_path / 'custom.py'
+    path.write_text(textwrap.dedent(MODULE))
+    dependencies = {}
+    metrics = parse_metrics_module(str(path), 'custom', dependencies=dependencies)
+    assert {name: metric['type'] for name, metric in metrics.items()} == {
+        'custommetrics.custom_metric': 'REPO', 'derivedmetrics.derived_metric': 'REPO',
+        'plainmetrics.plain_metric': 'BASE'}
+    assert list(dependencies) == [os.path.realpath(RepositoriesMetrics.__file__)]
+
+
+def test_manifest_is_in_cache_dir(tmp_path):
+    registry = MetricsRegistry()
+    registry.set_cache_dir(str(tmp_path))
+    assert registry.get_all()['repometrics.closed_pr_metric']['type'] == 'REPO'
+    assert os.listdir(tmp_path) == [MetricsRegistry.MANIFEST_NAME]
@@ -0,0 +1,63 @@
+from math import ceil
+
+import pytest
+
+from benchmarks.FakeGitHub import FakeGitHub, SyntheticOrg
+from github_prospector.__main__ import parser
+from github_prospector.Client import create_github
+from github_prospector.QueryRunners import QueryRunner
+from github_prospector.Records import PER_PAGE
+
+REPO_METRIC = 'repometrics.closed_pr_metric'
+TEAM_METRIC = 'teammetrics.team_open_prs_count_metric'
+
+
+@pytest.fixture(scope='module')
+def server():
+    # team0 has repos repo0 and repo2
+    server = FakeGitHub(SyntheticOrg(repos=3, teams=2, prs=250, issues=10, commits=10), rate_limit=10 ** 7).start()
+    yield server
+    server.stop()
+
+
+def count_requests(server: FakeGitHub, query: str, output_dir, **options) -> int:
+    config = parser.get_default_values()
+    for key, value in dict(options, github_token='test', api_url=server.url, no_cache=True,
+                           output_dir=str(output_dir)).items():
+        setattr(config, key, value)
+    github = create_github(config)
+    config.repos = [github.get_repo('acme/repo0')]
+    config.teams = [github.get_organization('acme').get_team_by_slug('team0')]
+    server.reset()
+    QueryRunner(query, config, verbose=False).run()
+    return server.get_counters()['requests']
+
+
+def count_pages(server: FakeGitHub, repo_name: str, state: str) -> int:
+    pulls = [i for i in server.org.repos[repo_name]['pulls'] if state in ('all', i['state'])]
+    return max(1, ceil(len(pulls) / PER_PAGE))
+
+
+@pytest.mark.parametrize('engine', ['sync', 'async'])
+def test_repo_of_repos_and_team_is_fetched_once(server, tmp_path, engine):
+    if engine == 'async':
+        pytest.importorskip('aiohttp')
+    team_requests = 1 + count_pages(server, 'repo0', 'open') + count_pages(server, 'repo2', 'open')
+    assert count_requests(server, REPO_METRIC, tmp_path, engine=engine) == count_pages(server, 'repo0', 'closed')
+    assert count_requests(server, TEAM_METRIC, tmp_path, engine=engine) == team_requests
+    # closed pull requests of repo0 for the repo and open ones for the team are one listing of all
+    assert count_requests(server, f'{REPO_METRIC},{TEAM_METRIC}', tmp_path, engine=engine) == \
+        1 + count_pages(server, 'repo0', 'all') + count_pages(server, 'repo2', 'open')
+
+
+def test_data_of_collected_objects_is_dropped(server, tmp_path):
+    config = parser.get_default_values()
+    for key, value in dict(github_token='test', api_url=server.url, no_cache=True).items():
+        setattr(config, key, value)
+    github = create_github(config)
+    config.repos = [github.get_repo('acme/repo0')]
+    config.teams = [github.get_organization('acme').get_team_by_slug('team0')]
+    runner = QueryRunner(f'{REPO_METRIC},{TEAM_METRIC}', config, verbose=False)
+    runner.run()
+    # repo2 of the team isn't in --repos, its data is dropped with the team
+    assert not runner.data_cache._data
@@ -0,0 +1,42 @@
+from datetime import datetime
+
+import pytest
+
+from benchmarks.FakeGitHub import FakeGitHub, SyntheticOrg
+from github_prospector import Records
+from github_prospector.__main__ import parser
+from github_prospector.Client import create_github
+from github_prospector.Records import PullRequestRecord, iter_raw, search_created_between
+
+QUALIFIERS = ['repo:acme/repo0', 'is:pr']
+
+
+@pytest.fixture(scope='module')
+def server():
+    server = FakeGitHub(SyntheticOrg(repos=1, teams=1, prs=250, issues=10, commits=10), rate_limit=10 ** 7).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def repository(server):
+    config = parser.get_default_values()
+    for key, value in dict(github_token='test', api_url=server.url, no_cache=True).items():
+        setattr(config, key, value)
+    repository = create_github(config).get_repo('acme/repo0')
+    server.reset()
+    return repository
+
+
+def test_search_is_paged_by_listing_pages(server, repository):
+    items = search_created_between(repository._requester, QUALIFIERS, datetime(2021, 1, 1))
+    listed = [raw for raw, _ in iter_raw(repository._requester, f'{repository.url}/pulls', {'state': 'all'})]
+    assert [PullRequestRecord(i).number for i in items] == [i['number'] for i in listed]
+    # total count is of the first page, pages are of the listing size
+    assert server.get_counters()['requests'] == 6
+
+
+def test_search_over_limit_stops_on_first_page(server, repository, monkeypatch):
+    monkeypatch.setattr(Records, 'SEARCH_RESULTS_LIMIT', 200)
+    assert search_created_between(repository._requester, QUALIFIERS, datetime(2021, 1, 1)) is None
+    assert server.get_counters()['requests'] == 1
@@ -0,0 +1,73 @@
+import optparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from github_prospector import WorkQueue as work_queue
+from github_prospector.WorkQueue import MAX_ATTEMPTS, WorkQueue, split
+
+
+def create_queue(queue_dir, repos: int = 10, shards: int = 5) -> WorkQueue:
+    queue = WorkQueue(str(queue_dir))
+    config = optparse.Values({'query': 'repometrics.closed_pr_metric', 'owner': 'acme', 'start_date': None,
+                              'end_date': None, 'branches': None})
+    queue.create(config, [f'acme/repo{i}' for i in range(repos)], [], shards)
+    return queue
+
+
+def claim_all(queue_dir: str, worker: str) -> list[int]:
+    queue = WorkQueue(queue_dir)
+    claimed = []
+    while (shard := queue.claim(worker)) is not None:
+        claimed.append(shard[0])
+    return claimed
+
+
+def test_split():
+    assert split(list(range(5)), 2) == [[0, 1, 2], [3, 4]]
+    assert split(list(range(2)), 5) == [[0], [1]]
+    assert split([], 3) == []
+
+
+def test_shard_is_claimed_by_one_worker(tmp_path):
+    create_queue(tmp_path, repos=200, shards=200)
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        claims = list(executor.map(claim_all, [str(tmp_path)] * 4, [f'worker{i}' for i in range(4)]))
+    claimed = [i for worker_claims in claims for i in worker_claims]
+    assert sorted(claimed) == list(range(1, 201))
+    assert WorkQueue(str(tmp_path)).get_counts() == {'running': 200}
+
+
+def test_shard_of_lost_worker_is_taken(tmp_path, monkeypatch):
+    queue = create_queue(tmp_path, shards=1)
+    assert queue.claim('lost')[0] == 1
+    assert WorkQueue(str(tmp_path)).claim('other') is None
+    monkeypatch.setattr(work_queue, 'LEASE', -1)
+    other = WorkQueue(str(tmp_path))
+    assert other.claim('other')[0] == 1
+    # results of the lost worker are stored, if it isn't lost, the shard is done once
+    queue.complete(1, 'repo', {'repo0': {'m': 1}})
+    other.complete(1, 'repo', {'repo0': {'m': 1}})
+    assert queue.get_counts() == {'done': 1}
+    assert os.listdir(tmp_path / 'running') == []
+
+
+def test_failed_shard_is_retried(tmp_path):
+    queue = create_queue(tmp_path, shards=1)
+    for _ in range(MAX_ATTEMPTS):
+        assert queue.claim('worker')[0] == 1
+        queue.fail(1, 'error')
+    assert queue.claim('worker') is None
+    assert queue.get_failed() == [(1, 'repo', [f'acme/repo{i}' for i in range(10)], 'error')]
+
+
+def test_results_are_merged_in_order_of_shards(tmp_path):
+    queue = create_queue(tmp_path, repos=4, shards=2)
+    # shards of the previous queue are replaced
+    queue.create(optparse.Values({'query': 'q'}), ['acme/repo0', 'acme/repo1'], ['team0'], 2)
+    shards = [queue.claim('worker') for _ in range(3)]
+    assert [(i[1], i[2]) for i in shards] == [('team', ['team0']), ('repo', ['acme/repo0']), ('repo', ['acme/repo1'])]
+    for shard_id, object_type, names in reversed(shards):
+        queue.complete(shard_id, object_type, {i: {'metric': shard_id} for i in names})
+    assert queue.get_results() == {'repo': {'acme/repo0': {'metric': 2}, 'acme/repo1': {'metric': 3}},
+                                   'team': {'team0': {'metric': 1}}}
+    assert queue.get_run_options()['query'] == 'q'